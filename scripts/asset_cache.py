@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""コンテンツアドレス型の生成キャッシュ
+
+生成物の「作り方」（モデル ID・完全なプロンプト・サイズ・seed など）を
+正規化 JSON にして SHA-256 を取り、それをキーに成果物を保存する。
+
+  .cache/assets/objects/ab/abcdef....png   キーごとの成果物
+  .cache/assets/manifest.json              出力パス → キー・SHA-256 の対応
+
+出力パスを持たない中間成果物（文ごとの音声など）も load_object /
+save_object で同じ objects/ に置ける。
+
+再実行時は出力パスに記録されたキーと今のキーを比べ、入力が変わった
+アセットだけを再生成する。別スクリプトでも同じキーなら objects から
+コピーするだけで済む（API 呼び出しなし）。
+
+マニフェスト導入前から存在するファイルは、初回に現在のキーで採用する
+（従来の「存在すればスキップ」と同じ挙動）。以降の変更から追跡される。
+
+同じパスへ書くスクリプトが複数ある場合（モデル違い）、項目の keys に
+モデルごとの最新キーを残す。別モデルの成果物は上書きしないが、
+自分のキー（プロンプトなど）が変わればそのモデルで作り直す。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from atomic_io import asset_complete, atomic_writer, sha256_file
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get("ASSET_CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache", "assets"))
+
+
+def _model_keys(entry):
+    """出力パスの項目に残っている、モデルごとの最新キー {model: key}"""
+    if entry is None:
+        return {}
+    keys = dict(entry.get("keys") or {})
+    if entry.get("model") and entry["model"] not in keys:
+        keys[entry["model"]] = entry["key"]  # keys 導入前の項目
+    return keys
+
+
+def cache_key(model, prompt, **params):
+    """モデル・プロンプト・パラメータから決まるキャッシュキー (hex)"""
+    spec = {"model": model, "prompt": prompt, "params": params}
+    canonical = json.dumps(spec, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AssetCache:
+    """成果物ストアとマニフェスト（スレッドセーフ）"""
+
+    def __init__(self, cache_dir=CACHE_DIR, root=PROJECT_ROOT):
+        self.cache_dir = cache_dir
+        self.root = root
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self._lock = threading.Lock()
+        self._outputs = self._load().get("outputs", {})
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self):
+        # 別プロセスが並行して書いた分を取りこんでから保存する
+        merged = self._load().get("outputs", {})
+        merged.update(self._outputs)
+        self._outputs = merged
+        with atomic_writer(self.manifest_path, "w") as f:
+            json.dump({"version": 1, "outputs": merged}, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def _rel(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def object_path(self, key, ext):
+        return os.path.join(self.cache_dir, "objects", key[:2], key + ext)
+
+    def _record(self, output_path, key, meta):
+        stat = os.stat(output_path)
+        rel = self._rel(output_path)
+        keys = _model_keys(self._outputs.get(rel))
+        if meta.get("model"):
+            keys[meta["model"]] = key
+        self._outputs[rel] = {
+            "key": key,
+            "sha256": sha256_file(output_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **meta,
+            "keys": keys,
+        }
+        self._save()
+
+    def entry(self, output_path):
+        """出力パスのマニフェスト項目（なければ None）"""
+        with self._lock:
+            return self._outputs.get(self._rel(output_path))
+
+    def status(self, output_path, key, model=None):
+        """出力の状態: "fresh" | "stale" | "missing" | "foreign"
+
+        foreign は別モデル（別スクリプト）が同じパスへ書いた成果物で、
+        このモデルの作り方（keys に残した前回のキー）が変わっていないもの。
+        上書きし合わないよう、呼び出し側は force 指定時以外スキップする。
+        このモデルのキーが変わっていれば stale（作り直す）。初めて見る
+        foreign な出力は、今のキーを基準として記録して foreign を返す。
+        """
+        if not asset_complete(output_path):
+            return "missing"
+        with self._lock:
+            entry = self._outputs.get(self._rel(output_path))
+            if entry is None:
+                self._record(output_path, key, {"model": model, "adopted": True})
+                return "fresh"
+            if model and entry.get("model") not in (None, model):
+                keys = _model_keys(entry)
+                if model not in keys:
+                    entry["keys"] = {**keys, model: key}
+                    self._save()
+                    return "foreign"
+                return "foreign" if keys[model] == key else "stale"
+            if entry["key"] != key:
+                return "stale"
+            stat = os.stat(output_path)
+            if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+                return "fresh"
+            # 手で差し替えられた等 → 内容で判定
+            return "fresh" if sha256_file(output_path) == entry["sha256"] else "stale"
+
+    def refresh(self, output_path, **meta):
+        """出力をキーはそのまま後処理で書き換えたとき（faststart 化など）に記録し直す
+
+        記録し直さないと内容の変化で "stale" と判定され、生成し直しになる。
+        """
+        with self._lock:
+            entry = self._outputs.get(self._rel(output_path))
+            if entry is None:
+                return
+            kept = {k: v for k, v in entry.items() if k not in ("key", "sha256", "size", "mtime_ns", "updated")}
+            self._record(output_path, entry["key"], {**kept, **meta})
+
+    def restore(self, key, output_path, model=None):
+        """同じキーの成果物がストアにあれば出力先へコピーして True"""
+        src = self.object_path(key, os.path.splitext(output_path)[1])
+        if not asset_complete(src):
+            return False
+        with atomic_writer(output_path) as f, open(src, "rb") as s:
+            shutil.copyfileobj(s, f)
+        with self._lock:
+            self._record(output_path, key, {"model": model, "restored": True})
+        return True
+
+    def lookup(self, output_path, key, model=None, force=False):
+        """生成不要なら理由（"fresh" | "cached" | "foreign"）、必要なら None を返す
+
+        force=True は常に None（引き直し）。
+        """
+        if force:
+            return None
+        state = self.status(output_path, key, model)
+        if state in ("fresh", "foreign"):
+            return state
+        if self.restore(key, output_path, model):
+            return "cached"
+        return None
+
+    def load_object(self, key, ext):
+        """キーの中間成果物をバイト列で返す（なければ None）"""
+        path = self.object_path(key, ext)
+        if not asset_complete(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def save_object(self, key, data, ext):
+        """出力パスを持たない中間成果物をストアへ保存する"""
+        with atomic_writer(self.object_path(key, ext)) as f:
+            f.write(data)
+
+    def store(self, key, output_path, model=None, **meta):
+        """生成直後の出力をストアへ保存し、マニフェストに記録する"""
+        # 同じキーで引き直した場合（--force・リトライ）は最新の成果物で置き換える
+        dest = self.object_path(key, os.path.splitext(output_path)[1])
+        with atomic_writer(dest) as f, open(output_path, "rb") as s:
+            shutil.copyfileobj(s, f)
+        with self._lock:
+            self._record(output_path, key, {"model": model, **meta})
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """プロセス共通の AssetCache を返す"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = AssetCache()
+        return _default_cache
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""原子的なファイル書き込みと完全性チェック
+
+生成物は同じディレクトリの一時ファイルへ書いてから os.replace するので、
+途中で落ちても最終パスに壊れたファイルが残らない。
+既存ファイルの「生成済み」判定には asset_complete() で末尾構造まで確認する。
+"""
+
+import contextlib
+import hashlib
+import os
+import struct
+import tempfile
+
+
+@contextlib.contextmanager
+def atomic_writer(path, mode="wb"):
+    """path と同じディレクトリの一時ファイルへ書き、成功時のみ置き換える"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory,
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_bytes(path, data):
+    """bytes を原子的に書き込む"""
+    with atomic_writer(path) as f:
+        f.write(data)
+    return len(data)
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """ファイルの SHA-256 (hex)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _mp4_complete(path, size):
+    """トップレベル box のサイズ合計がファイルサイズと一致するか"""
+    offset = 0
+    with open(path, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            header = f.read(16)
+            if len(header) < 8:
+                return False
+            box_size = struct.unpack(">I", header[:4])[0]
+            if box_size == 1:
+                if len(header) < 16:
+                    return False
+                box_size = struct.unpack(">Q", header[8:16])[0]
+            elif box_size == 0:
+                return True  # 末尾まで続く box
+            if box_size < 8:
+                return False
+            offset += box_size
+    return offset == size
+
+
+def asset_complete(path):
+    """生成物が存在し、途中で切れていないか（形式ごとの末尾チェック）"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    if size == 0:
+        return False
+
+    # 拡張子ではなく先頭バイトで判定する（NanoBanana は .png 名で JPEG を書く）
+    with open(path, "rb") as f:
+        head = f.read(12)
+        f.seek(max(0, size - 12))
+        tail = f.read()
+    if head.startswith(b"\x89PNG"):
+        return tail.endswith(b"IEND\xaeB`\x82")
+    if head.startswith(b"\xff\xd8"):
+        return tail.rstrip(b"\x00").endswith(b"\xff\xd9")
+    if head[4:8] == b"ftyp":
+        return _mp4_complete(path, size)
+    return True
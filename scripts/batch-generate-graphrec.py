@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """グラレコ VSL 一括画像生成パイプライン
 
-1. NanoBanana Pro でグラレコ風画像を生成（台本内容を視覚で伝える）
+1. NanoBanana Pro でグラレコ風画像を生成（台本内容を視覚で伝える、常駐ワーカー経由）
 2. japanese-text-verifier でテキスト品質チェック（警告のみ）
 3. Pillow で正確な日本語テロップをオーバーレイ
 4. agentic-vision で品質チェック（オプション）
@@ -15,25 +15,51 @@
   python3 scripts/batch-generate-graphrec.py --start-from s03    # 途中から再開
   python3 scripts/batch-generate-graphrec.py --skip-verify       # 検証スキップ
   python3 scripts/batch-generate-graphrec.py --overlay-only      # オーバーレイのみ(背景済)
+  python3 scripts/batch-generate-graphrec.py --overlay-only -j 8 # 8 プロセスで並列オーバーレイ
+
+  python3 scripts/batch-generate-graphrec.py --bg-workers 3 --queue-size 6
+
+通常実行は段階パイプライン（scripts/pipeline.py）で回す:
+  background(NanoBanana) → verify → overlay(プロセスプール) → vision
+ステージ間は上限付きキューでつなぎ、N 枚目を検証・オーバーレイしている間に
+N+1..N+k 枚目の背景を生成する。検証 NG は background ステージへ戻して再生成する。
+
+失敗は retry_policy.py で transient / quota / content / hard に分類し、
+クラスごとのバックオフと回数上限でキュー末尾へ戻す（ワーカーは待たない）。
+NanoBanana 呼び出しは全ワーカー共有のトークンバケット（--rate 件/分）で抑える。
+クラス別の件数は --report の "retries" に出力する。
+
+ステージ別の所要時間（生成キュー待ち・生成・検証・オーバーレイの
+decode/render/encode など）は telemetry.py のトレースに書き出す:
+  python3 scripts/telemetry.py summary
+
+--overlay-only はローカルの CPU 処理だけなので、コア数のプロセスプールで
+並列に描画し、待ち時間（sleep）も入れない。
 """
 
 import argparse
 import json
 import os
-import subprocess
 import sys
 import time
+from concurrent.futures import as_completed
 
 # パスを設定
 SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, SCRIPTS_DIR)
 
+import nanobanana_worker
+import telemetry
+from asset_cache import cache_key, get_cache
+from atomic_io import asset_complete, sha256_file
 from graphrec_config import GRAPHREC_SCENE_IMAGES, get_theme_for_scene
-from graphrec_overlay import overlay_graphrec_text
+from graphrec_overlay import RENDERER_VERSION, OverlayPool
+from pipeline import Pipeline, Requeue, Stage
+from qa_service import get_qa
+from retry_policy import RetryTracker, TokenBucket, classify
 
-NANOBANANA_DIR = os.path.expanduser("~/.claude/skills/nanobanana-pro")
-VERIFIER_DIR = os.path.expanduser("~/.claude/skills/japanese-text-verifier/scripts")
-VISION_DIR = os.path.expanduser("~/.claude/skills/agentic-vision/scripts")
+MODEL = "nanobanana-pro"
+OVERLAY_MODEL = "graphrec-overlay"
 
 OUTPUT_DIR = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
@@ -41,224 +67,336 @@ OUTPUT_DIR = os.path.join(
 )
 BG_DIR = os.path.join(OUTPUT_DIR, "_backgrounds")
 
-MAX_RETRIES = 3
+DEFAULT_RATE_PER_MINUTE = 20
 
+# 全ワーカー共有（main で --rate に合わせて作り直す。既定は無制限）
+_retry_tracker = RetryTracker()
+_rate_limit = TokenBucket(0)
 
-def generate_background(prompt, output_path, timeout=240):
-    """NanoBanana Pro でグラレコ風画像を生成"""
-    cmd = [
-        sys.executable,
-        os.path.join(NANOBANANA_DIR, "scripts", "run.py"),
-        "image_generator.py",
-        "--prompt", prompt,
-        "--output", output_path,
-        "--timeout", str(timeout),
-    ]
+JP_REINFORCE_SUFFIXES = [
+    ", ensure all visible text is in correct accurate Japanese",
+    ", Japanese text must be legible and correctly spelled",
+    ", text elements should display exact Japanese characters as specified",
+]
+
+def attempt_background(prompt, output_path, timeout=240):
+    """NanoBanana Pro でグラレコ風画像を1回生成（常駐ワーカー経由）
 
+    Returns: 成功なら None、失敗ならエラー文字列（retry_policy.classify で分類する）
+    """
+    waited = _rate_limit.acquire()
+    start = time.monotonic()
+    if waited:
+        telemetry.record("ratelimit.wait", start - waited, start)
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout + 60,
-            cwd=NANOBANANA_DIR,
-        )
-        if result.returncode == 0 and os.path.exists(output_path):
-            size = os.path.getsize(output_path)
-            if size > 5000:
-                return True
-            print(f"    [bg] File too small: {size}B", flush=True)
-            return False
-        print(f"    [bg] Generation failed (rc={result.returncode})", flush=True)
-        if result.stderr:
-            print(f"    [bg] stderr: {result.stderr[:200]}", flush=True)
-        return False
-    except subprocess.TimeoutExpired:
-        print("    [bg] Timeout", flush=True)
-        return False
+        response = nanobanana_worker.generate_image(prompt, output_path, timeout)
     except Exception as e:
-        print(f"    [bg] Error: {e}", flush=True)
-        return False
+        error = f"{type(e).__name__}: {e}"
+    else:
+        if response["ok"] and response["size"] > 5000:
+            print(f"    [bg] Generated ({nanobanana_worker.format_timings(response)})", flush=True)
+            timings = response.get("timings") or {}
+            telemetry.record_phases(
+                [("generate.queue", timings.get("queued", 0)), ("generation", timings.get("generate", 0))],
+                bytes=response["size"],
+            )
+            return None
+        error = f"file too small: {response['size']}B" if response["ok"] else (response["error"] or "no image")
+    failure_class = classify(error)
+    telemetry.record("generation", start, time.monotonic(), status="error",
+                     error=error[:200], failure_class=failure_class)
+    if failure_class == "quota":
+        _rate_limit.drain()
+    print(f"    [bg] Generation failed: {error[:200]}", flush=True)
+    return error
 
 
 def verify_text_quality(image_path):
     """japanese-text-verifier で画像内テキストの品質を確認（警告のみ）
 
-    画像にテキストが含まれること自体は問題ない。
-    ガベージ（デタラメ文字）が含まれていれば警告する。
+    検証器はプロセスで1回だけ読み込み、結果は画像内容のハッシュで
+    キャッシュする（qa_service.py）。
 
     Returns:
         (is_ok, extracted_text)
     """
-    original_path = sys.path.copy()
-    try:
-        sys.path.insert(0, VERIFIER_DIR)
+    return get_qa().verify_text(image_path)
 
-        from slide_verifier import BackgroundVerifier
-        verifier = BackgroundVerifier(max_retries=0)
-        result = verifier.verify_background(image_path)
 
-        if result.is_clean:
-            return True, ""
+def run_vision_qa(image_path):
+    """agentic-vision で品質チェック（オプション、結果は内容ハッシュでキャッシュ）
 
-        extracted = result.extracted_text
-        has_japanese = any(
-            "\u3041" <= ch <= "\u3096"  # ひらがな
-            or "\u30a1" <= ch <= "\u30fa"  # カタカナ
-            or "\u4e00" <= ch <= "\u9fff"  # CJK漢字
-            for ch in extracted
-        )
+    Returns:
+        (passed, details)
+    """
+    return get_qa().vision_qa(image_path)
 
-        if has_japanese or len(extracted) < 3:
-            return True, extracted
 
-        # 日本語が含まれない長いテキスト → ガベージの可能性（警告用）
-        return False, extracted
-    except ImportError:
-        print("    [verify] japanese-text-verifier not available, skipping", flush=True)
-        return True, ""
-    except Exception as e:
-        print(f"    [verify] Error: {e}", flush=True)
-        return True, ""
-    finally:
-        sys.path = original_path
+def image_paths(scene_id, index):
+    """(最終画像, 背景画像) のパス"""
+    final_path = os.path.join(OUTPUT_DIR, f"{scene_id}_{index}.png")
+    bg_path = os.path.join(BG_DIR, f"{scene_id}_{index}_bg.png")
+    return final_path, bg_path
 
 
-def run_vision_qa(image_path):
-    """agentic-vision で品質チェック（オプション）
+def background_key(bg_prompt):
+    """背景のキャッシュキー"""
+    return cache_key(MODEL, bg_prompt)
 
-    Returns:
-        (passed, details)
+
+def background_digest(bg_path):
+    """背景画像の内容 SHA-256
+
+    ファイルがなければ生成キャッシュに残る最後の記録（それもなければ None）。
+    サイズ・mtime が記録と同じならハッシュは取り直さない。
     """
-    original_path = sys.path.copy()
-    try:
-        sys.path.insert(0, VISION_DIR)
+    entry = get_cache().entry(bg_path)
+    if not asset_complete(bg_path):
+        return entry["sha256"] if entry else None
+    stat = os.stat(bg_path)
+    if entry and stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+        return entry["sha256"]
+    return sha256_file(bg_path)
 
-        from agentic_vision import AgenticVisionAnalyzer, AnalysisType
-        analyzer = AgenticVisionAnalyzer()
 
-        if analyzer.client is None:
-            print("    [vision] No GEMINI_API_KEY, skipping QA", flush=True)
-            return True, "skipped"
+def overlay_key(background, overlay_text, theme):
+    """テロップ入り最終画像のキャッシュキー
 
-        result = analyzer.analyze(
-            image_path,
-            analysis_type=AnalysisType.QUALITY,
-        )
+    background は背景の内容（background_digest）。同じプロンプトで背景を
+    引き直したときに、古い背景で合成した最終画像を復元しないように。
+    """
+    return cache_key(OVERLAY_MODEL, overlay_text, background=background, theme=theme, renderer=RENDERER_VERSION)
 
-        quality = result.results.get("quality_score", 0)
-        passed = quality >= 60
-        return passed, f"quality={quality}"
-    except ImportError:
-        print("    [vision] agentic-vision not available, skipping", flush=True)
-        return True, "skipped"
-    except Exception as e:
-        print(f"    [vision] Error: {e}", flush=True)
-        return True, "error"
-    finally:
-        sys.path = original_path
+
+def reinforced_prompt(bg_prompt, attempt):
+    """content（文字化け・画像不良）リトライの回数に応じて日本語テキストの指示を補強したプロンプト"""
+    if attempt == 0:
+        return bg_prompt
+    suffix_idx = min(attempt - 1, len(JP_REINFORCE_SUFFIXES) - 1)
+    return bg_prompt + JP_REINFORCE_SUFFIXES[suffix_idx]
+
+
+# ============================================
+# 段階パイプライン
+# ============================================
+
+class GraphrecTask:
+    """パイプラインを流れる1枚分の状態"""
+
+    def __init__(self, scene_id, index, bg_prompt, overlay_text):
+        self.scene_id = scene_id
+        self.index = index
+        self.bg_prompt = bg_prompt
+        self.overlay_text = overlay_text
+        self.filename = f"{scene_id}_{index}.png"
+        self.final_path, self.bg_path = image_paths(scene_id, index)
+        self.theme = get_theme_for_scene(scene_id)
+        self.bg_key = background_key(bg_prompt)
+        self.final_key = overlay_key(background_digest(self.bg_path), overlay_text, self.theme)
+        self.attempt = 0
+        self.retries = {}  # 失敗クラス → リトライ回数
+        self.needs_verify = False
+        self.result = None
+
+    def log(self, message):
+        print(f"    [{self.filename}] {message}", flush=True)
 
 
-def process_one_image(
-    scene_id, index, bg_prompt, overlay_text,
-    dry_run=False, force=False, skip_verify=False, overlay_only=False,
-    skip_vision=True,
-):
-    """1枚の画像を処理する完全パイプライン
+def _stage_background(task, force=False, overlay_only=False, skip_verify=False):
+    """背景を用意する（既存・キャッシュがなければ NanoBanana で1回生成）
 
-    Returns: "ok" | "skip" | "fail" | "dry" | "timeout"
+    失敗したらクラス別のバックオフ後に background ステージの末尾へ戻す。
     """
-    filename = f"{scene_id}_{index}.png"
-    final_path = os.path.join(OUTPUT_DIR, filename)
-    bg_filename = f"{scene_id}_{index}_bg.png"
-    bg_path = os.path.join(BG_DIR, bg_filename)
-
-    theme = get_theme_for_scene(scene_id)
-
-    # 既存チェック
-    if os.path.exists(final_path) and not force and not overlay_only:
-        size = os.path.getsize(final_path)
-        if size > 10000:
-            print(f"  SKIP: {filename} (exists, {size // 1024}KB)", flush=True)
-            return "skip"
-
-    if dry_run:
-        print(f"  DRY-RUN: {filename}", flush=True)
-        print(f"    BG prompt: {bg_prompt[:80]}...", flush=True)
-        print(f"    Overlay: {overlay_text}", flush=True)
-        return "dry"
-
-    print(f"  PROCESSING: {filename}", flush=True)
-
-    # ===== Phase 1: 背景生成 =====
-    if overlay_only and os.path.exists(bg_path):
-        print(f"    [bg] Using existing background", flush=True)
-    else:
-        os.makedirs(BG_DIR, exist_ok=True)
-
-        for attempt in range(MAX_RETRIES + 1):
-            enhanced_prompt = bg_prompt
-            if attempt > 0:
-                jp_reinforce_suffixes = [
-                    ", ensure all visible text is in correct accurate Japanese",
-                    ", Japanese text must be legible and correctly spelled",
-                    ", text elements should display exact Japanese characters as specified",
-                ]
-                suffix_idx = min(attempt - 1, len(jp_reinforce_suffixes) - 1)
-                enhanced_prompt = bg_prompt + jp_reinforce_suffixes[suffix_idx]
-
-            print(f"    [bg] Generating (attempt {attempt + 1}/{MAX_RETRIES + 1})...", flush=True)
-            success = generate_background(enhanced_prompt, bg_path)
-
-            if not success:
-                if attempt < MAX_RETRIES:
-                    print(f"    [bg] Retrying...", flush=True)
-                    time.sleep(3)
-                    continue
-                print(f"  FAIL: {filename} (generation failed)", flush=True)
-                return "fail"
-
-            # ===== Phase 2: テキスト品質チェック（警告のみ） =====
-            if not skip_verify:
-                is_ok, extracted = verify_text_quality(bg_path)
-                if is_ok:
-                    if extracted:
-                        print(f"    [verify] Japanese text OK: '{extracted[:40]}'", flush=True)
-                    else:
-                        print(f"    [verify] No text detected", flush=True)
-                    break
-                print(f"    [verify] Garbled text detected: '{extracted[:40]}'", flush=True)
-                if attempt < MAX_RETRIES:
-                    print(f"    [verify] Retrying with Japanese reinforcement...", flush=True)
-                    time.sleep(2)
-                    continue
-                print(f"    [verify] Max retries reached, proceeding (overlay will fix)", flush=True)
-                break
-            else:
-                break
-
-    # ===== Phase 3: Pillow テキストオーバーレイ =====
-    if not os.path.exists(bg_path):
-        print(f"  FAIL: {filename} (no background image)", flush=True)
-        return "fail"
-    print(f"    [overlay] Applying text: {overlay_text}", flush=True)
+    if task.attempt == 0:
+        if overlay_only and os.path.exists(task.bg_path):
+            task.log("[bg] Using existing background")
+            return task
+        bg_hit = None if force else get_cache().lookup(task.bg_path, task.bg_key, model=MODEL)
+        if bg_hit:
+            task.log(f"[bg] Using background ({bg_hit})")
+            return task
+
+    os.makedirs(BG_DIR, exist_ok=True)
+    task.attempt += 1
+    task.log(f"[bg] Generating (attempt {task.attempt})...")
+    prompt = reinforced_prompt(task.bg_prompt, task.retries.get("content", 0))
+    error = attempt_background(prompt, task.bg_path)
+    if error is not None:
+        failure_class = classify(error)
+        delay = _retry_tracker.next_delay(task.retries, failure_class)
+        if delay is None:
+            print(f"  FAIL: {task.filename} (generation failed: {failure_class})", flush=True)
+            task.result = "fail"
+            return None
+        task.log(f"[bg] Requeued ({failure_class}, retry in {delay:.0f}s)")
+        return Requeue("background", delay)
+    get_cache().store(task.bg_key, task.bg_path, model=MODEL, attempt=task.attempt)
+    task.needs_verify = not skip_verify
+    return task
+
+
+def _stage_verify(task):
+    """生成した背景の文字化けチェック（NG なら補強プロンプトで background へ戻す）"""
+    if not task.needs_verify:
+        return task
+    is_ok, extracted = verify_text_quality(task.bg_path)
+    if is_ok:
+        task.log(f"[verify] Japanese text OK: '{extracted[:40]}'" if extracted else "[verify] No text detected")
+        return task
+    task.log(f"[verify] Garbled text detected: '{extracted[:40]}'")
+    delay = _retry_tracker.next_delay(task.retries, "content")
+    if delay is None:
+        task.log("[verify] Max retries reached, proceeding (overlay will fix)")
+        return task
+    task.needs_verify = False
+    return Requeue("background", delay)
+
+
+def _stage_overlay(task, pool):
+    """テロップ合成（Pillow の処理はプロセスプールで行う）"""
+    if not os.path.exists(task.bg_path):
+        print(f"  FAIL: {task.filename} (no background image)", flush=True)
+        task.result = "fail"
+        return None
+    timings = pool.submit(task.bg_path, task.final_path, task.overlay_text, task.theme).result()
+    record_overlay_timings(timings)
+    # 背景を作り直していればキーも変わる
+    task.final_key = overlay_key(background_digest(task.bg_path), task.overlay_text, task.theme)
+    get_cache().store(task.final_key, task.final_path, model=OVERLAY_MODEL)
+    return task
+
+
+def record_overlay_timings(timings, item=None):
+    """OverlayPool が返した段階ごとの秒数をスパンとして書く"""
+    telemetry.record_phases(
+        [(f"overlay.{phase}", timings[phase]) for phase in ("decode", "render", "encode")],
+        item=item, bytes=timings["bytes"],
+    )
+
+
+def _stage_vision(task):
+    """agentic-vision QA（結果は表示のみ）"""
+    passed, details = run_vision_qa(task.final_path)
+    task.log(f"[vision] QA {'passed' if passed else 'failed'}: {details}")
+    return task
+
+
+def run_graphrec_pipeline(images, args):
+    """背景生成 → 検証 → オーバーレイ → vision QA を段階パイプラインで流す
+
+    Returns: [(scene_id, index, overlay_text, result), ...]（images の順）
+    """
+    cache = get_cache()
+    tasks = [GraphrecTask(*item) for item in images]
+    for task in tasks:
+        if args.overlay_only:
+            continue
+        hit = cache.lookup(task.final_path, task.final_key, model=OVERLAY_MODEL, force=args.force)
+        if hit:
+            print(f"  SKIP: {task.filename} ({hit})", flush=True)
+            task.result = "skip"
+
+    def on_done(task):
+        if task.result is None:
+            task.result = "ok"
+            print(f"  OK: {task.filename} ({os.path.getsize(task.final_path) // 1024}KB)", flush=True)
+
+    def on_error(task, stage, error):
+        print(f"  FAIL: {task.filename} ({stage} error: {error})", flush=True)
+        task.result = "fail"
+
+    pool = OverlayPool(args.jobs)
+    stages = [
+        Stage(
+            "background",
+            lambda task: _stage_background(task, args.force, args.overlay_only, args.skip_verify),
+            workers=args.bg_workers, queue_size=args.queue_size,
+        ),
+        Stage("verify", _stage_verify, workers=args.verify_workers, queue_size=args.queue_size),
+        Stage("overlay", lambda task: _stage_overlay(task, pool), workers=pool.workers, queue_size=args.queue_size),
+    ]
+    if args.with_vision:
+        stages.append(Stage("vision", _stage_vision, workers=args.vision_workers, queue_size=args.queue_size))
+
+    pipeline = Pipeline(
+        stages, on_done=on_done, on_error=on_error,
+        label=lambda task: task.filename,
+        attributes=lambda task: {"result": task.result, "retries": sum(task.retries.values())},
+    )
     try:
-        overlay_graphrec_text(bg_path, final_path, overlay_text, theme=theme)
-    except Exception as e:
-        print(f"  FAIL: {filename} (overlay error: {e})", flush=True)
-        return "fail"
-
-    # ===== Phase 4: Vision QA (オプション) =====
-    if not skip_vision:
-        passed, details = run_vision_qa(final_path)
-        if not passed:
-            print(f"    [vision] QA failed: {details}", flush=True)
-        else:
-            print(f"    [vision] QA passed: {details}", flush=True)
+        pipeline.run(task for task in tasks if task.result is None)
+    finally:
+        pool.shutdown()
+    pipeline.print_summary()
+    return [(task.scene_id, task.index, task.overlay_text, task.result) for task in tasks]
+
+
+def generate_background(scene_id, index, bg_prompt, force=False, skip_verify=False):
+    """1枚分の背景だけを background → verify ステージで作る（build.py 用）
+
+    リトライのバックオフは Requeue で待つので、呼び出し元へは完了後に戻る。
+
+    Returns: 背景ができたら True
+    """
+    task = GraphrecTask(scene_id, index, bg_prompt, "")
+
+    def on_error(task, stage, error):
+        print(f"  FAIL: {task.filename} ({stage} error: {error})", flush=True)
+        task.result = "fail"
+
+    stages = [
+        Stage("background", lambda task: _stage_background(task, force, skip_verify=skip_verify)),
+        Stage("verify", _stage_verify),
+    ]
+    Pipeline(stages, on_error=on_error, label=lambda task: task.filename).run([task])
+    return task.result != "fail"
 
-    size = os.path.getsize(final_path)
-    print(f"  OK: {filename} ({size // 1024}KB)", flush=True)
-    return "ok"
+
+def run_overlay_parallel(images, workers=None):
+    """背景済みの画像にテロップだけをプロセスプールで並列合成する
+
+    Returns: [(scene_id, index, overlay_text, result), ...]（images の順）
+    """
+    cache = get_cache()
+    results = {}
+    pending = {}
+    pool = OverlayPool(workers)
+    print(f"Overlay workers: {pool.workers}", flush=True)
+    start = time.perf_counter()
+    try:
+        for scene_id, index, bg_prompt, overlay_text in images:
+            final_path, bg_path = image_paths(scene_id, index)
+            if not os.path.exists(bg_path):
+                print(f"  FAIL: {scene_id}_{index}.png (no background image)", flush=True)
+                results[(scene_id, index)] = "fail"
+                continue
+            theme = get_theme_for_scene(scene_id)
+            final_key = overlay_key(background_digest(bg_path), overlay_text, theme)
+            future = pool.submit(bg_path, final_path, overlay_text, theme)
+            pending[future] = (scene_id, index, final_path, final_key)
+
+        for future in as_completed(pending):
+            scene_id, index, final_path, final_key = pending[future]
+            filename = f"{scene_id}_{index}.png"
+            try:
+                record_overlay_timings(future.result(), item=filename)
+                cache.store(final_key, final_path, model=OVERLAY_MODEL)
+            except Exception as e:
+                print(f"  FAIL: {filename} (overlay error: {e})", flush=True)
+                results[(scene_id, index)] = "fail"
+                continue
+            print(f"  OK: {filename} ({os.path.getsize(final_path) // 1024}KB)", flush=True)
+            results[(scene_id, index)] = "ok"
+    finally:
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    done = sum(1 for result in results.values() if result == "ok")
+    print(f"  Overlay: {done} images in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f} images/sec)", flush=True)
+    return [
+        (scene_id, index, overlay_text, results[(scene_id, index)])
+        for scene_id, index, _, overlay_text in images
+    ]
 
 
 def main():
@@ -268,15 +406,30 @@ def main():
     parser.add_argument("--scene", help="Generate for a specific scene only")
     parser.add_argument("--start-from", help="Start from this scene ID")
     parser.add_argument("--dry-run", action="store_true", help="Preview only")
-    parser.add_argument("--force", action="store_true", help="Regenerate even if file exists")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if the cached asset is current")
     parser.add_argument("--skip-verify", action="store_true", help="Skip text verification")
     parser.add_argument("--overlay-only", action="store_true",
                         help="Only apply text overlay (backgrounds already exist)")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Overlay worker processes (default: CPU count)")
+    parser.add_argument("--bg-workers", type=int, default=2,
+                        help="Concurrent NanoBanana background generations (default: 2)")
+    parser.add_argument("--verify-workers", type=int, default=2,
+                        help="Concurrent text verifications (default: 2)")
+    parser.add_argument("--vision-workers", type=int, default=2,
+                        help="Concurrent vision QA checks (default: 2)")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_MINUTE,
+                        help=f"Max NanoBanana requests per minute across workers (default: {DEFAULT_RATE_PER_MINUTE}, 0 = unlimited)")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="Max items waiting between pipeline stages (default: 4)")
     parser.add_argument("--with-vision", action="store_true",
                         help="Enable agentic-vision QA (slower)")
     parser.add_argument("--report", help="Save generation report to JSON file")
     args = parser.parse_args()
 
+    global _rate_limit
+    _rate_limit = TokenBucket(args.rate / 60, capacity=args.bg_workers)
+
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     images = list(GRAPHREC_SCENE_IMAGES)
@@ -304,24 +457,47 @@ def main():
 
     stats = {"ok": 0, "skip": 0, "fail": 0, "timeout": 0, "dry": 0}
     report_items = []
+    if not args.dry_run:
+        telemetry.start_run("batch-generate-graphrec")
     current_scene = None
 
+    # オーバーレイのみ（ローカル処理）はプロセスプール、それ以外は段階パイプライン
+    if not args.dry_run:
+        if args.overlay_only and skip_vision:
+            results = run_overlay_parallel(images, args.jobs)
+        else:
+            results = run_graphrec_pipeline(images, args)
+        for scene_id, img_idx, overlay_text, result in results:
+            stats[result] = stats.get(result, 0) + 1
+            report_items.append({
+                "scene_id": scene_id,
+                "index": img_idx,
+                "overlay_text": overlay_text,
+                "result": result,
+            })
+        images = []
+
+    # --dry-run: 作り直しが必要なものを表示するだけ
+    cache = get_cache()
     for idx, (scene_id, img_idx, bg_prompt, overlay_text) in enumerate(images, 1):
         if scene_id != current_scene:
             current_scene = scene_id
             print(f"\n--- Scene: {scene_id} ---", flush=True)
 
         print(f"[{idx}/{total}]", flush=True)
-        result = process_one_image(
-            scene_id, img_idx, bg_prompt, overlay_text,
-            dry_run=args.dry_run,
-            force=args.force,
-            skip_verify=args.skip_verify,
-            overlay_only=args.overlay_only,
-            skip_vision=skip_vision,
-        )
-        stats[result] = stats.get(result, 0) + 1
-
+        filename = f"{scene_id}_{img_idx}.png"
+        final_path, bg_path = image_paths(scene_id, img_idx)
+        final_key = overlay_key(background_digest(bg_path), overlay_text, get_theme_for_scene(scene_id))
+        hit = None if args.overlay_only else cache.lookup(final_path, final_key, model=OVERLAY_MODEL, force=args.force)
+        if hit:
+            print(f"  SKIP: {filename} ({hit})", flush=True)
+            result = "skip"
+        else:
+            print(f"  DRY-RUN: {filename}", flush=True)
+            print(f"    BG prompt: {bg_prompt[:80]}...", flush=True)
+            print(f"    Overlay: {overlay_text}", flush=True)
+            result = "dry"
+        stats[result] += 1
         report_items.append({
             "scene_id": scene_id,
             "index": img_idx,
@@ -329,20 +505,22 @@ def main():
             "result": result,
         })
 
-        if result == "ok":
-            time.sleep(2)
-
     print(f"\n{'=' * 60}", flush=True)
     print(f"COMPLETE", flush=True)
     print(f"  OK: {stats['ok']}, Skip: {stats['skip']}, Fail: {stats['fail']}", flush=True)
+    print(f"  Retries: {_retry_tracker.summary()}", flush=True)
+    if _rate_limit.waited:
+        print(f"  Rate limit wait: {_rate_limit.waited:.1f}s", flush=True)
     if args.dry_run:
         print(f"  Dry-run: {stats['dry']}", flush=True)
     print(f"{'=' * 60}", flush=True)
+    telemetry.finish_run()
 
     if args.report:
         report = {
             "total": total,
             "stats": stats,
+            "retries": _retry_tracker.snapshot(),
             "items": report_items,
         }
         with open(args.report, "w", encoding="utf-8") as f:
@@ -9,15 +9,21 @@
   python3 scripts/batch-generate-images.py --scene s01-hook  # 1シーンだけ
   python3 scripts/batch-generate-images.py --dry-run          # プレビューのみ
   python3 scripts/batch-generate-images.py --start-from s03   # 途中から再開
+  NANOBANANA_WORKER=fake python3 scripts/batch-generate-images.py --scene s01-hook  # オフライン検証
+
+生成は常駐ワーカー（scripts/nanobanana_worker.py）に依頼し、
+画像ごとのインタプリタ起動・認証を省く。
 """
 
 import argparse
 import os
-import subprocess
-import sys
 import time
 
-NANOBANANA_DIR = os.path.expanduser("~/.claude/skills/nanobanana-pro")
+import nanobanana_worker
+import telemetry
+from asset_cache import cache_key, get_cache
+
+MODEL = "nanobanana-pro"
 OUTPUT_DIR = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
     "public", "images", "scenes"
@@ -277,16 +283,26 @@ SCENE_IMAGES = [
 ]
 
 
+def image_key(prompt):
+    """生成キャッシュ / ビルドグラフ共通のキー"""
+    return cache_key(MODEL, prompt)
+
+
+def output_path_for(scene_id, index):
+    filename = f"{scene_id}_{index}.png" if index != "00" else f"{scene_id}.png"
+    return os.path.join(OUTPUT_DIR, filename)
+
+
 def generate_one_image(scene_id, index, prompt, dry_run=False, force=False):
     """NanoBanana Pro で1枚の画像を生成"""
-    filename = f"{scene_id}_{index}.png" if index != "00" else f"{scene_id}.png"
-    output_path = os.path.join(OUTPUT_DIR, filename)
+    output_path = output_path_for(scene_id, index)
+    filename = os.path.basename(output_path)
 
-    if os.path.exists(output_path) and not force:
-        size = os.path.getsize(output_path)
-        if size > 10000:  # 10KB以上なら既存として扱う
-            print(f"  SKIP: {filename} (exists, {size//1024}KB)", flush=True)
-            return "skip"
+    key = image_key(prompt)
+    hit = get_cache().lookup(output_path, key, model=MODEL, force=force)
+    if hit:
+        print(f"  SKIP: {filename} ({hit})", flush=True)
+        return "skip"
 
     if dry_run:
         print(f"  DRY-RUN: {filename}", flush=True)
@@ -294,38 +310,28 @@ def generate_one_image(scene_id, index, prompt, dry_run=False, force=False):
         return "dry"
 
     print(f"  GENERATING: {filename}", flush=True)
-    cmd = [
-        sys.executable,
-        os.path.join(NANOBANANA_DIR, "scripts", "run.py"),
-        "image_generator.py",
-        "--prompt", prompt,
-        "--output", output_path,
-        "--timeout", "180",
-    ]
-
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=240,
-            cwd=NANOBANANA_DIR,
-        )
-        if result.returncode == 0 and os.path.exists(output_path):
-            size = os.path.getsize(output_path)
-            print(f"  OK: {filename} ({size//1024}KB)", flush=True)
-            return "ok"
-        else:
-            print(f"  FAIL: {filename}", flush=True)
-            if result.stderr:
-                print(f"    stderr: {result.stderr[:200]}", flush=True)
-            return "fail"
-    except subprocess.TimeoutExpired:
-        print(f"  TIMEOUT: {filename}", flush=True)
-        return "timeout"
+        response = nanobanana_worker.generate_image(prompt, output_path, timeout=180)
     except Exception as e:
         print(f"  ERROR: {filename}: {e}", flush=True)
         return "error"
+    timings = response.get("timings") or {}
+    telemetry.record_phases(
+        [("generate.queue", timings.get("queued", 0)), ("generation", timings.get("generate", 0))],
+        status="ok" if response["ok"] else "error", bytes=response["size"],
+    )
+    if response["ok"]:
+        get_cache().store(key, output_path, model=MODEL)
+        print(f"  OK: {filename} ({response['size']//1024}KB, {nanobanana_worker.format_timings(response)})", flush=True)
+        return "ok"
+    error = response["error"] or ""
+    if error.startswith("timeout"):
+        print(f"  TIMEOUT: {filename}", flush=True)
+        return "timeout"
+    print(f"  FAIL: {filename}", flush=True)
+    if error:
+        print(f"    stderr: {error[:200]}", flush=True)
+    return "fail"
 
 
 def main():
@@ -333,7 +339,7 @@ def main():
     parser.add_argument("--scene", help="Generate for a specific scene only")
     parser.add_argument("--start-from", help="Start from this scene ID")
     parser.add_argument("--dry-run", action="store_true", help="Preview only")
-    parser.add_argument("--force", action="store_true", help="Regenerate even if file exists")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if the cached asset is current")
     args = parser.parse_args()
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -358,6 +364,8 @@ def main():
 
     stats = {"ok": 0, "skip": 0, "fail": 0, "timeout": 0, "error": 0, "dry": 0}
     current_scene = None
+    if not args.dry_run:
+        telemetry.start_run("batch-generate-images")
 
     for idx, (scene_id, img_idx, prompt) in enumerate(images, 1):
         if scene_id != current_scene:
@@ -365,7 +373,9 @@ def main():
             print(f"\n--- Scene: {scene_id} ---", flush=True)
 
         print(f"[{idx}/{total}]", flush=True)
-        result = generate_one_image(scene_id, img_idx, prompt, dry_run=args.dry_run, force=args.force)
+        with telemetry.item(f"{scene_id}_{img_idx}") as span:
+            result = generate_one_image(scene_id, img_idx, prompt, dry_run=args.dry_run, force=args.force)
+            span.set(result=result)
         stats[result] = stats.get(result, 0) + 1
 
         # Wait between generations to avoid rate limiting
@@ -379,6 +389,7 @@ def main():
     if args.dry_run:
         print(f"  Dry-run: {stats['dry']}", flush=True)
     print(f"{'='*60}", flush=True)
+    telemetry.finish_run()
 
 
 if __name__ == "__main__":
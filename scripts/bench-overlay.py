@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""グラレコテロップ描画のベンチマーク
+
+GRAPHREC_SCENE_IMAGES の全テロップを描画し、1枚あたりの描画時間を
+文字効果ごとに比べる。legacy は旧実装（(2w+1)² 回 draw.text を重ねる
+縁取り）をこのスクリプト内で再現したもの。
+
+Usage:
+  python3 scripts/bench-overlay.py
+  python3 scripts/bench-overlay.py --bg public/images/scenes/scene1.png --limit 20
+  python3 scripts/bench-overlay.py --effects legacy outline --repeat 3
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+import graphrec_overlay
+from graphrec_config import GRAPHREC_SCENE_IMAGES, get_theme_for_scene
+from image_pipeline import FRAME_SIZE, load_frame
+
+EFFECTS = ("legacy",) + graphrec_overlay.TEXT_EFFECTS
+
+
+def _legacy_draw_line(overlay, draw, position, text, font, fill_color, outline_color, effect, accent_color):
+    """旧実装: 縁取りの各オフセットごとに draw.text を重ねる"""
+    x, y = position
+    width = graphrec_overlay.OUTLINE_WIDTH
+    for dx in range(-width, width + 1):
+        for dy in range(-width, width + 1):
+            if dx != 0 or dy != 0:
+                draw.text((x + dx, y + dy), text, font=font, fill=outline_color)
+    draw.text((x, y), text, font=font, fill=fill_color)
+
+
+def bench(effect, frame, items, repeat):
+    """1枚あたりの描画時間 (ms) のリストを返す"""
+    draw_line = graphrec_overlay._draw_line
+    if effect == "legacy":
+        graphrec_overlay._draw_line = _legacy_draw_line
+    try:
+        timings = []
+        for _ in range(repeat):
+            for scene_id, text in items:
+                theme = get_theme_for_scene(scene_id)
+                start = time.perf_counter()
+                graphrec_overlay.render_graphrec_overlay(
+                    frame, text, theme, None if effect == "legacy" else effect,
+                )
+                timings.append((time.perf_counter() - start) * 1000)
+        return timings
+    finally:
+        graphrec_overlay._draw_line = draw_line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="グラレコテロップ描画のベンチマーク")
+    parser.add_argument("--bg", help="背景画像（省略時は単色フレーム）")
+    parser.add_argument("--limit", type=int, help="先頭 N 件だけ描画")
+    parser.add_argument("--repeat", type=int, default=1, help="繰り返し回数")
+    parser.add_argument("--effects", nargs="+", choices=EFFECTS, default=list(EFFECTS))
+    args = parser.parse_args()
+
+    frame = load_frame(args.bg) if args.bg else Image.new("RGB", FRAME_SIZE, (90, 120, 150))
+    items = [(scene_id, text) for scene_id, _, _, text in GRAPHREC_SCENE_IMAGES]
+    if args.limit:
+        items = items[:args.limit]
+
+    # フォント読み込み・文節解析のキャッシュを温めておく
+    bench("outline", frame, items[:1], 1)
+
+    print(f"[bench-overlay] {len(items)} texts x {args.repeat}, frame {frame.size[0]}x{frame.size[1]}", flush=True)
+    baseline = None
+    for effect in args.effects:
+        timings = bench(effect, frame, items, args.repeat)
+        mean = statistics.mean(timings)
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        baseline = baseline or mean
+        print(
+            f"  {effect:<8} {mean:7.1f} ms/image  p95 {p95:7.1f} ms  x{baseline / mean:.2f}",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""src/data/branch-structure.ts のシーングラフを Python から読む
+
+TypeScript を実行せず、sceneGraph.nodes（next / choices）と各シーンの
+imageCount・imageInterval・duration・mediaType を正規表現で取り出す。
+配信用の書き出し・サイズ集計・マニフェストがシーンの並びと分岐を
+知るために使う。
+
+使い方:
+  python3 scripts/branch_structure.py          # 経路ごとのシーン列を表示
+"""
+
+import os
+import re
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BRANCH_TS = os.path.join(PROJECT_ROOT, "src", "data", "branch-structure.ts")
+
+_ENTRY = re.compile(r'entrySceneId:\s*"([^"]+)"')
+_NODE = re.compile(
+    r'"?([\w-]+)"?:\s*\{\s*sceneId:\s*"([^"]+)",\s*next:\s*(null|"[^"]*")'
+    r'(?:,\s*choices:\s*\[([^\]]*)\])?',
+)
+_SCENE = re.compile(r'^\s*id:\s*"([^"]+)",\s*\n\s*type:\s*"(\w+)"', re.M)
+_FIELDS = {
+    "duration": re.compile(r"^\s*duration:\s*([\d.]+)", re.M),
+    "imageCount": re.compile(r"^\s*imageCount:\s*(\d+)", re.M),
+    "imageInterval": re.compile(r"^\s*imageInterval:\s*(\d+)", re.M),
+    "mediaType": re.compile(r'^\s*mediaType:\s*"(\w+)"', re.M),
+}
+
+
+def _number(value):
+    return float(value) if "." in value else int(value)
+
+
+def load(path=BRANCH_TS):
+    """シーングラフを読む
+
+    Returns: {"entry": id,
+              "nodes": {id: {"next": id | None, "choices": [id, ...]}},
+              "scenes": {id: {"type", "duration", "imageCount", "imageInterval", "mediaType"}}}
+    """
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+
+    graph_at = source.index("sceneGraph:")
+    graph = source[graph_at:]
+    entry = _ENTRY.search(graph).group(1)
+    nodes = {}
+    for match in _NODE.finditer(graph):
+        next_id = None if match.group(3) == "null" else match.group(3).strip('"')
+        choices = re.findall(r'"([^"]+)"', match.group(4) or "")
+        nodes[match.group(2)] = {"next": next_id, "choices": choices}
+
+    scenes = {}
+    body = source[:graph_at]
+    starts = list(_SCENE.finditer(body))
+    for i, match in enumerate(starts):
+        block = body[match.end():starts[i + 1].start() if i + 1 < len(starts) else len(body)]
+        scene = {"type": match.group(2)}
+        for name, pattern in _FIELDS.items():
+            found = pattern.search(block)
+            if found:
+                scene[name] = found.group(1) if name == "mediaType" else _number(found.group(1))
+        scenes.setdefault(match.group(1), scene)
+    return {"entry": entry, "nodes": nodes, "scenes": scenes}
+
+
+def successors(graph, scene_id):
+    """scene_id の次に再生されうるシーン（分岐なら選択肢の順）"""
+    node = graph["nodes"].get(scene_id, {})
+    if node.get("choices"):
+        return list(node["choices"])
+    return [node["next"]] if node.get("next") else []
+
+
+def paths(graph):
+    """入口から終端までの全経路 [[scene_id, ...], ...]（選択肢の順）"""
+    result = []
+
+    def walk(scene_id, path):
+        path = path + [scene_id]
+        following = [s for s in successors(graph, scene_id) if s not in path]
+        if not following:
+            result.append(path)
+        for next_id in following:
+            walk(next_id, path)
+
+    walk(graph["entry"], [])
+    return result
+
+
+def branch_name(graph, path):
+    """経路の名前（分岐で選んだシーン ID を "/" でつなぐ。分岐がなければ "main"）"""
+    picks = [path[i + 1] for i, scene_id in enumerate(path[:-1])
+             if graph["nodes"].get(scene_id, {}).get("choices")]
+    return "/".join(picks) or "main"
+
+
+def main():
+    graph = load()
+    print(f"Entry: {graph['entry']}, scenes: {len(graph['scenes'])}", flush=True)
+    for path in paths(graph):
+        print(f"  {branch_name(graph, path)}: {' → '.join(path)}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
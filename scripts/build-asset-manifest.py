@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""内容ハッシュ付きアセットマニフェストと、分岐ごとの先読みリスト
+
+/audio/scenes/{id}.mp3 のような固定パスは作り直しても URL が変わらないため、
+長期キャッシュすると古い版が配信され、キャッシュを切ると毎回取り直しになる。
+全アセットを内容の SHA-256 を含むパス（/assets/...）にも置き、
+シーン ID から引けるマニフェストを書く。ハッシュ付きパスは内容が変われば
+別 URL になるので、immutable で1年キャッシュできる（vercel.json）。
+プレイヤーが固定パスを読んでいる間は、固定パス側のキャッシュ設定は変えない
+（プレイヤーをハッシュ付きパスへ切り替えるときに見直す）。ただし字幕タイミング
+（/audio/scenes/{id}.json・.vtt）は音声と食い違うと字幕がずれるので、毎回
+再検証させる。
+
+  public/assets/audio/scenes/s01-hook.3f9c0a1b2d4e.mp3 ...  （元ファイルへのハードリンク）
+  public/asset-manifest.json
+
+マニフェスト:
+  scenes    シーンごとの音声（秒数）・字幕タイミング・画像（WebP / AVIF の
+            バリアントとプレースホルダ）・動画（秒数・解像度・ポスター・ラダー）
+  prefetch  シーンごとに、次に再生しうるシーン（分岐なら選択肢ごと）で
+            最初に必要になる順のアセットとその合計バイト数
+
+生成・export-web-images.py・process-videos.py の後に実行する。
+サイズ・mtime が前回と同じファイルはハッシュを取り直さない。
+
+使い方:
+  python3 scripts/build-asset-manifest.py
+  python3 scripts/build-asset-manifest.py --prefetch-images 3
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+
+from PIL import Image
+
+import branch_structure
+import mp3_frames
+import mp4_boxes
+from atomic_io import atomic_writer, sha256_file
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PUBLIC_DIR = os.path.join(PROJECT_ROOT, "public")
+ASSETS_DIR = os.path.join(PUBLIC_DIR, "assets")
+MANIFEST_PATH = os.path.join(PUBLIC_DIR, "asset-manifest.json")
+IMAGE_VARIANTS_MANIFEST = os.path.join(PUBLIC_DIR, "images", "web", "manifest.json")
+VIDEO_VARIANTS_MANIFEST = os.path.join(PUBLIC_DIR, "video", "web", "manifest.json")
+
+HASH_LENGTH = 12
+# 先読みする画像の形式と幅（WebP はどのブラウザでも表示できる）
+PREFETCH_FORMAT = "webp"
+PREFETCH_WIDTH = 720
+PREFETCH_IMAGES = 2
+# プレイヤーと同じ既定の画像枚数
+DEFAULT_IMAGE_COUNT = 3
+
+MANIFEST_VERSION = 1
+
+
+def _load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+# ============================================
+# ハッシュ付きパス
+# ============================================
+
+class Fingerprinter:
+    """公開パス → ハッシュ付きパスの割り当てと、public/assets への配置"""
+
+    def __init__(self, previous=None):
+        self.previous = (previous or {}).get("files", {})
+        self.files = {}
+        self.linked = 0
+
+    def add(self, public_path):
+        """public_path（"/audio/scenes/x.mp3"）をハッシュ付きで配置し、項目を返す（なければ None）"""
+        if public_path in self.files:
+            return self.files[public_path]
+        source = os.path.join(PUBLIC_DIR, public_path.lstrip("/"))
+        if not os.path.isfile(source):
+            return None
+        stat = os.stat(source)
+        previous = self.previous.get(public_path)
+        if previous and previous["bytes"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+            sha = previous["sha256"]
+        else:
+            sha = sha256_file(source)
+        stem, ext = os.path.splitext(public_path)
+        hashed = f"/assets{stem}.{sha[:HASH_LENGTH]}{ext}"
+        self._place(source, os.path.join(PUBLIC_DIR, hashed.lstrip("/")))
+        self.files[public_path] = {
+            "path": hashed,
+            "bytes": stat.st_size,
+            "sha256": sha,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        return self.files[public_path]
+
+    def _place(self, source, dest):
+        """ハードリンクで置く（別ファイルシステムならコピー）。同名があれば内容は同じなので何もしない
+
+        生成スクリプトは atomic_writer で別 inode に置き換えるので、
+        元ファイルを作り直してもリンク先（旧版）は変わらない。
+        """
+        if os.path.exists(dest):
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".tmp"
+        try:
+            os.link(source, tmp)
+        except OSError:
+            shutil.copy2(source, tmp)
+        os.replace(tmp, dest)
+        self.linked += 1
+
+    def prune(self):
+        """どの項目からも参照されなくなったハッシュ付きファイルを消す（削除数を返す）"""
+        keep = {os.path.join(PUBLIC_DIR, f["path"].lstrip("/")) for f in self.files.values()}
+        removed = 0
+        for path in glob.glob(os.path.join(ASSETS_DIR, "**", "*"), recursive=True):
+            if os.path.isfile(path) and path not in keep:
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+def _asset(fp, public_path, **extra):
+    """マニフェストに載せる形（元パス・ハッシュ付きパス・バイト数）"""
+    entry = fp.add(public_path)
+    if entry is None:
+        return None
+    return {"src": public_path, "path": entry["path"], "bytes": entry["bytes"], **extra}
+
+
+# ============================================
+# シーンごとのアセット
+# ============================================
+
+def _images(fp, scene_id, scene, variants):
+    count = scene.get("imageCount", DEFAULT_IMAGE_COUNT)
+    images = []
+    for index in range(1, count + 1):
+        stem = f"{scene_id}_{index:02d}"
+        web = variants.get(stem)
+        if web:
+            size = {"width": web["width"], "height": web["height"]}
+        else:
+            path = os.path.join(PUBLIC_DIR, "images", "scenes", f"{stem}.png")
+            if not os.path.exists(path):
+                continue
+            with Image.open(path) as img:
+                size = {"width": img.width, "height": img.height}
+        image = _asset(fp, f"/images/scenes/{stem}.png", **size)
+        if image is None:
+            continue
+        if web:
+            image["variants"] = {
+                fmt: [_asset(fp, v["path"], width=v["width"], height=v["height"]) for v in entries]
+                for fmt, entries in web["variants"].items()
+            }
+            image["blurhash"] = web["blurhash"]
+            image["lqip"] = web["lqip"]
+        images.append(image)
+    return images
+
+
+def _video(fp, scene_id, clips):
+    path = os.path.join(PUBLIC_DIR, "video", "scenes", f"{scene_id}.mp4")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        meta = mp4_boxes.info(f.read())
+    video = _asset(fp, f"/video/scenes/{scene_id}.mp4", duration=round(meta["duration"], 3),
+                   width=meta["width"], height=meta["height"], faststart=meta["faststart"])
+    clip = clips.get(scene_id)
+    if clip:
+        video["poster"] = _asset(fp, clip["poster"])
+        video["renditions"] = [
+            _asset(fp, r["path"], width=r["width"], height=r["height"], duration=r["duration"])
+            for r in clip["renditions"]
+        ]
+        # HLS のプレイリストはセグメントを相対名で参照するので、固定パスのまま載せる
+        video["hls"] = clip["hls"]
+    return video
+
+
+def scene_assets(fp, scene_id, scene, variants, clips):
+    audio_path = f"/audio/scenes/{scene_id}.mp3"
+    audio_file = os.path.join(PUBLIC_DIR, audio_path.lstrip("/"))
+    audio = None
+    if os.path.exists(audio_file):
+        audio = _asset(fp, audio_path, duration=round(mp3_frames.duration(audio_file), 3))
+    entry = {
+        "type": scene.get("type"),
+        "mediaType": scene.get("mediaType", "image"),
+        "audio": audio,
+        "timing": _asset(fp, f"/audio/scenes/{scene_id}.json"),
+        "captions": _asset(fp, f"/audio/scenes/{scene_id}.vtt"),
+        "images": _images(fp, scene_id, scene, variants),
+        "video": _video(fp, scene_id, clips) if scene.get("mediaType") == "video" else None,
+    }
+    return entry
+
+
+# ============================================
+# 先読みリスト
+# ============================================
+
+def _preferred_image(image):
+    for variant in image.get("variants", {}).get(PREFETCH_FORMAT, []):
+        if variant and variant["width"] == PREFETCH_WIDTH:
+            return variant
+    return image
+
+
+def first_needed(entry, images=PREFETCH_IMAGES):
+    """シーンの再生開始直後に必要になる順のアセット [{"path", "as", "bytes"}, ...]"""
+    items = []
+
+    def add(asset, kind):
+        if asset:
+            items.append({"path": asset["path"], "as": kind, "bytes": asset["bytes"]})
+
+    add(entry["audio"], "audio")
+    add(entry["timing"], "fetch")
+    video = entry["video"]
+    if video:
+        add(video.get("poster"), "image")
+        add(video, "video")
+    # 動画が再生できない場合も画像で代替するので、動画シーンでも1枚目は読む
+    for image in entry["images"][:1 if video else images]:
+        add(_preferred_image(image), "image")
+    return items
+
+
+def prefetch_lists(graph, scenes, images=PREFETCH_IMAGES):
+    """{scene_id: {"choice": 分岐か, "next": [{"scene", "bytes", "assets"}, ...]}}"""
+    result = {}
+    for scene_id in scenes:
+        following = [s for s in branch_structure.successors(graph, scene_id) if s in scenes]
+        nexts = []
+        for next_id in following:
+            assets = first_needed(scenes[next_id], images)
+            nexts.append({"scene": next_id, "bytes": sum(a["bytes"] for a in assets), "assets": assets})
+        result[scene_id] = {
+            "choice": bool(graph["nodes"].get(scene_id, {}).get("choices")),
+            "next": nexts,
+        }
+    return result
+
+
+def build_manifest(images=PREFETCH_IMAGES):
+    graph = branch_structure.load()
+    previous = _load_json(MANIFEST_PATH)
+    variants = _load_json(IMAGE_VARIANTS_MANIFEST).get("images", {})
+    clips = _load_json(VIDEO_VARIANTS_MANIFEST).get("clips", {})
+
+    fp = Fingerprinter(previous)
+    scenes = {
+        scene_id: scene_assets(fp, scene_id, scene, variants, clips)
+        for scene_id, scene in graph["scenes"].items()
+    }
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "entry": graph["entry"],
+        "initial": first_needed(scenes[graph["entry"]], images) if graph["entry"] in scenes else [],
+        "scenes": scenes,
+        "prefetch": prefetch_lists(graph, scenes, images),
+        "files": fp.files,
+    }
+    with atomic_writer(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    removed = fp.prune()
+    return manifest, fp.linked, removed
+
+
+def print_summary(manifest, linked, removed):
+    files = manifest["files"]
+    total = sum(f["bytes"] for f in files.values())
+    print(f"Manifest: {len(manifest['scenes'])} scenes, {len(files)} files ({total / 1e6:.1f} MB), "
+          f"{linked} new hashed paths, {removed} removed", flush=True)
+    missing = [s for s, e in manifest["scenes"].items() if not e["audio"] or not (e["images"] or e["video"])]
+    if missing:
+        print(f"  WARNING: scenes without audio or visuals: {', '.join(missing)}", flush=True)
+    print(f"\n  {'scene':<20} {'next':<28} {'assets':>6} {'prefetch':>9}", flush=True)
+    for scene_id, entry in manifest["prefetch"].items():
+        for i, item in enumerate(entry["next"]):
+            label = scene_id if i == 0 else ""
+            mark = "?" if entry["choice"] else "→"
+            print(f"  {label:<20} {mark} {item['scene']:<26} {len(item['assets']):>6} "
+                  f"{item['bytes'] / 1e6:7.2f}MB", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内容ハッシュ付きアセットマニフェストと先読みリストを書き出す")
+    parser.add_argument("--prefetch-images", type=int, default=PREFETCH_IMAGES,
+                        help=f"次のシーンで先読みする画像の枚数 (default: {PREFETCH_IMAGES})")
+    args = parser.parse_args()
+
+    manifest, linked, removed = build_manifest(args.prefetch_images)
+    print_summary(manifest, linked, removed)
+    print(f"Saved: {MANIFEST_PATH}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
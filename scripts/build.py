@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""アセットのインクリメンタルビルド
+
+画像 → 動画、背景 → テロップ画像、台本 → 音声 の依存をグラフにし、
+入力が変わったノードとその下流だけを、トポロジカル順に並列実行する。
+
+各ノードは
+  key     生成の「作り方」（モデル・プロンプト・パラメータ）のハッシュ
+  inputs  依存するファイル（上流ノードの出力や _backgrounds/*_bg.png）
+を持ち、前回ビルド時の key と入力ファイルの SHA-256 を
+.cache/build/manifest.json に記録する。どちらかが変わるか出力が
+欠けていれば stale。stale な上流を持つノードも stale になる。
+
+使い方:
+  python3 scripts/build.py                          # images, videos, audio
+  python3 scripts/build.py --plan                   # stale なノードと理由を表示
+  python3 scripts/build.py --stages graphrec -j 4   # グラレコ（背景 → テロップ）
+  python3 scripts/build.py --scene s04b-gap         # 1シーンだけ
+  python3 scripts/build.py --image-source flux      # 画像を Flux Pro で生成
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+
+import telemetry
+from asset_cache import PROJECT_ROOT, cache_key, get_cache
+from atomic_io import asset_complete, atomic_writer, sha256_file
+from fal_client import get_client
+from job_runner import Job, JobRunner, report
+
+MANIFEST_PATH = os.path.join(PROJECT_ROOT, ".cache", "build", "manifest.json")
+
+ALL_STAGES = ("images", "videos", "graphrec", "audio")
+DEFAULT_STAGES = ("images", "videos", "audio")
+
+# 外部サービスごとの同時実行数（-j はグラフ全体の上限）
+POOL_LIMITS = {"fal": 8, "nanobanana": 2, "fish": 2, "local": os.cpu_count() or 2}
+
+_modules = {}
+
+
+def load_script(filename):
+    """ハイフン入りのスクリプトをモジュールとして読み込む（キャッシュ付き）"""
+    if filename not in _modules:
+        name = os.path.splitext(filename)[0].replace("-", "_")
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[filename] = module
+    return _modules[filename]
+
+
+# ============================================
+# ノードとマニフェスト
+# ============================================
+
+class Node:
+    """出力1ファイルを作るビルド単位（action(force) が出力を書く）"""
+
+    def __init__(self, node_id, stage, scene_id, output, key, action, inputs=(), pool="local"):
+        self.id = node_id
+        self.stage = stage
+        self.scene_id = scene_id
+        self.output = output
+        self.key = key
+        self.action = action
+        self.inputs = list(inputs)
+        self.pool = pool
+        self.deps = []
+        self.reason = None
+
+
+class BuildManifest:
+    """ノードごとの key・入力 SHA-256・出力 SHA-256 を永続化する"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.nodes = json.load(f).get("nodes", {})
+        except (FileNotFoundError, ValueError):
+            self.nodes = {}
+        self._hashes = {}
+
+    def file_sha(self, path):
+        """SHA-256（サイズと mtime が同じなら前回の値を使う）"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        for entry in self.nodes.values():
+            if entry.get("output") == _rel(path) and (entry.get("size"), entry.get("mtime_ns")) == stamp:
+                digest = entry["sha256"]
+                break
+        else:
+            digest = sha256_file(path)
+        self._hashes[path] = (stamp, digest)
+        return digest
+
+    def record(self, node):
+        stat = os.stat(node.output)
+        entry = {
+            "stage": node.stage,
+            "output": _rel(node.output),
+            "key": node.key,
+            "inputs": {_rel(p): self.file_sha(p) for p in node.inputs},
+            "sha256": self.file_sha(node.output),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self._lock:
+            self.nodes[node.id] = entry
+            self.save()
+
+    def save(self):
+        with atomic_writer(self.path, "w") as f:
+            json.dump({"version": 1, "nodes": self.nodes}, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def _rel(path):
+    return os.path.relpath(os.path.abspath(path), PROJECT_ROOT)
+
+
+# ============================================
+# グラフ構築
+# ============================================
+
+def _image_nodes(source):
+    if source == "flux":
+        images = load_script("generate-images.py")
+        extra = load_script("generate-extra-images.py")
+        specs = [(sid, idx, p, images.image_key(p), images.generate_image) for sid, idx, p in images.SCENES]
+        specs += [(sid, idx, p, extra.image_key(p), extra.generate_image) for sid, idx, p in extra.EXTRA_IMAGES]
+        for scene_id, index, prompt, key, generate in specs:
+            yield Node(
+                f"image:{scene_id}_{index}", "images", scene_id,
+                os.path.join(images.OUTPUT_DIR, f"{scene_id}_{index}.png"), key,
+                lambda force, s=scene_id, i=index, p=prompt, g=generate: g(s, i, p, force=force),
+                pool="fal",
+            )
+        return
+
+    nano = load_script("batch-generate-images.py")
+    for scene_id, index, prompt in nano.SCENE_IMAGES:
+        yield Node(
+            f"image:{scene_id}_{index}", "images", scene_id,
+            nano.output_path_for(scene_id, index), nano.image_key(prompt),
+            lambda force, s=scene_id, i=index, p=prompt: nano.generate_one_image(s, i, p, force=force),
+            pool="nanobanana",
+        )
+
+
+def _video_nodes():
+    videos = load_script("generate-videos.py")
+    for scene_id, prompt in videos.VIDEO_SCENES:
+        yield Node(
+            f"video:{scene_id}", "videos", scene_id,
+            os.path.join(videos.OUTPUT_DIR, f"{scene_id}.mp4"),
+            cache_key(videos.MODEL, prompt),
+            lambda force, s=scene_id, p=prompt: videos.generate_video(s, p, force=force),
+            inputs=[videos.source_image_path(scene_id)], pool="fal",
+        )
+
+
+def _graphrec_nodes(skip_verify):
+    from graphrec_overlay import overlay_graphrec_text
+
+    graphrec = load_script("batch-generate-graphrec.py")
+    cache = get_cache()
+
+    def build_background(scene_id, index, prompt, force):
+        return graphrec.generate_background(scene_id, index, prompt, force=force, skip_verify=skip_verify)
+
+    def build_overlay(bg_path, final_path, text, theme, force):
+        # 生成キャッシュのキーは背景の実際の内容から（背景ノードの実行後に決まる）
+        key = graphrec.overlay_key(graphrec.background_digest(bg_path), text, theme)
+        if not force and cache.lookup(final_path, key, model=graphrec.OVERLAY_MODEL):
+            return "skip"
+        report("overlay")
+        overlay_graphrec_text(bg_path, final_path, text, theme=theme)
+        cache.store(key, final_path, model=graphrec.OVERLAY_MODEL)
+        return "ok"
+
+    for scene_id, index, bg_prompt, overlay_text in graphrec.GRAPHREC_SCENE_IMAGES:
+        final_path, bg_path = graphrec.image_paths(scene_id, index)
+        theme = graphrec.get_theme_for_scene(scene_id)
+        bg_key = graphrec.background_key(bg_prompt)
+        # 背景の内容は inputs で追うので、ノードのキーは背景のキーから
+        final_key = graphrec.overlay_key(bg_key, overlay_text, theme)
+        yield Node(
+            f"background:{scene_id}_{index}", "graphrec", scene_id, bg_path, bg_key,
+            lambda force, s=scene_id, i=index, p=bg_prompt: build_background(s, i, p, force),
+            pool="nanobanana",
+        )
+        yield Node(
+            f"overlay:{scene_id}_{index}", "graphrec", scene_id, final_path, final_key,
+            lambda force, b=bg_path, o=final_path, t=overlay_text, th=theme: build_overlay(b, o, t, th, force),
+            inputs=[bg_path],
+        )
+
+
+def _audio_nodes():
+    try:
+        audio = load_script("generate-audio.py")
+    except ImportError as e:
+        print(f"WARNING: audio stage unavailable ({e})", flush=True)
+        return
+    preprocessor = audio.JapaneseTextPreprocessor()
+    for scene_id, text in audio.SCENES:
+        # 前処理後のテキストで判定（text_preprocessor の辞書変更も検知する）
+        processed = preprocessor.preprocess(text)
+        key = audio.audio_key(processed)
+        yield Node(
+            f"audio:{scene_id}", "audio", scene_id,
+            os.path.join(audio.OUTPUT_DIR, f"{scene_id}.mp3"), key,
+            lambda force, s=scene_id, p=processed, t=text: audio.generate_audio(s, p, text=t, force=force),
+            pool="fish",
+        )
+
+
+def build_graph(stages, image_source="nanobanana", skip_verify=False):
+    """ノード一覧を作り、inputs が他ノードの出力なら依存として結ぶ"""
+    nodes = []
+    if "images" in stages:
+        nodes += _image_nodes(image_source)
+    if "videos" in stages:
+        nodes += _video_nodes()
+    if "graphrec" in stages:
+        nodes += _graphrec_nodes(skip_verify)
+    if "audio" in stages:
+        nodes += _audio_nodes()
+
+    producers = {}
+    for node in nodes:
+        path = os.path.abspath(node.output)
+        if path in producers:
+            raise ValueError(f"{node.id} and {producers[path].id} both write {_rel(path)}")
+        producers[path] = node
+    for node in nodes:
+        node.deps = [producers[os.path.abspath(p)] for p in node.inputs if os.path.abspath(p) in producers]
+    return nodes
+
+
+def topological_order(nodes):
+    """依存 → 被依存の順に並べる（循環は ValueError）"""
+    ordered = []
+    state = {}
+
+    def visit(node):
+        if state.get(node.id) == "done":
+            return
+        if state.get(node.id) == "visiting":
+            raise ValueError(f"dependency cycle at {node.id}")
+        state[node.id] = "visiting"
+        for dep in node.deps:
+            visit(dep)
+        state[node.id] = "done"
+        ordered.append(node)
+
+    for node in nodes:
+        visit(node)
+    return ordered
+
+
+def mark_stale(nodes, manifest, force=False, adopt=True):
+    """stale なノードに reason を付けて返す（上流が stale なら下流も stale）
+
+    adopt=False（--plan）はマニフェスト導入前の成果物を記録しない。
+    """
+    stale = []
+    for node in topological_order(nodes):
+        entry = manifest.nodes.get(node.id)
+        if force:
+            node.reason = "forced"
+        elif not asset_complete(node.output):
+            node.reason = "missing"
+        elif any(dep.reason for dep in node.deps):
+            node.reason = "upstream " + next(dep.id for dep in node.deps if dep.reason)
+        elif entry is None:
+            # マニフェスト導入前の成果物は現状の入力で採用する
+            if adopt:
+                manifest.record(node)
+            continue
+        elif entry["key"] != node.key:
+            node.reason = "inputs changed"
+        else:
+            changed = [p for p in node.inputs if manifest.file_sha(p) != entry["inputs"].get(_rel(p))]
+            if changed:
+                node.reason = f"{os.path.basename(changed[0])} changed"
+        if node.reason:
+            stale.append(node)
+    return stale
+
+
+# ============================================
+# 実行
+# ============================================
+
+def run_build(stale, manifest, concurrency):
+    """stale ノードを依存順・並列に実行し、成功したものをマニフェストへ記録"""
+    limits = {pool: threading.Semaphore(n) for pool, n in POOL_LIMITS.items()}
+
+    def execute(node):
+        # 出力が残っているのに stale → 生成スクリプト側のキャッシュ判定を飛ばして作り直す
+        # （欠けているだけなら生成キャッシュからの復元を許す）
+        waiting = time.monotonic()
+        with limits[node.pool]:
+            telemetry.record(f"{node.pool}.wait", waiting, time.monotonic())
+            with telemetry.span(node.stage):
+                result = node.action(force=node.reason != "missing")
+        if result in (True, "ok", "skip") and asset_complete(node.output):
+            manifest.record(node)
+        return result
+
+    jobs = {node.id: Job(node.id, execute, node) for node in stale}
+    for node in stale:
+        jobs[node.id].after(*(jobs[dep.id] for dep in node.deps if dep.id in jobs))
+
+    runner = JobRunner(concurrency=concurrency, label="build")
+    runner.run(jobs.values())
+    runner.print_summary()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アセットのインクリメンタルビルド")
+    parser.add_argument("--stages", default=",".join(DEFAULT_STAGES),
+                        help=f"カンマ区切り ({', '.join(ALL_STAGES)}) (default: %(default)s)")
+    parser.add_argument("--scene", help="指定シーンのノードのみ")
+    parser.add_argument("--image-source", choices=("nanobanana", "flux"), default="nanobanana",
+                        help="images ステージの生成元 (default: nanobanana)")
+    parser.add_argument("--plan", action="store_true", help="stale なノードを表示して終了")
+    parser.add_argument("--force", action="store_true", help="全ノードを作り直す")
+    parser.add_argument("--skip-verify", action="store_true", help="グラレコ背景の文字チェックを省略")
+    parser.add_argument("--concurrency", "-j", type=int, default=8,
+                        help="同時実行ノード数 (default: 8)")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(ALL_STAGES)
+    if unknown:
+        parser.error(f"unknown stage: {', '.join(sorted(unknown))}")
+
+    nodes = build_graph(stages, args.image_source, args.skip_verify)
+    manifest = BuildManifest()
+    stale = mark_stale(nodes, manifest, force=args.force, adopt=not args.plan)
+    if args.scene:
+        stale = [node for node in stale if node.scene_id == args.scene]
+
+    print(f"=== build: {', '.join(stages)} ===", flush=True)
+    print(f"Nodes: {len(nodes)}, stale: {len(stale)}", flush=True)
+    for node in stale:
+        print(f"  {node.id}: {node.reason}", flush=True)
+    if args.plan or not stale:
+        return
+
+    print("", flush=True)
+    telemetry.start_run("build")
+    runner = run_build(stale, manifest, args.concurrency)
+    if "videos" in stages or args.image_source == "flux" and "images" in stages:
+        get_client().print_stats()
+    telemetry.finish_run()
+    if set(runner.counts()) - {"ok", "skip"}:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""シーン画像の配信用バリアント（AVIF / WebP の幅ラダー + プレースホルダ）
+
+public/images/scenes/*.png（1080x1920）から幅ごとの AVIF / WebP と、
+読み込み中に表示する小さなプレースホルダ（LQIP の data URI と blurhash）を
+public/images/web/ に書き出す。生成・オーバーレイの後に実行する。
+
+  public/images/web/s01-hook_01-360.avif ... s01-hook_01-1080.webp
+  public/images/web/manifest.json   画像ごとのバリアント・バイト数・プレースホルダ
+
+エンコードはプロセスプールで並列に行い、元 PNG の SHA-256 と設定が
+前回と同じ画像は飛ばす（元画像がなくなったバリアントは削除する）。
+最後にシーン別・分岐経路別のバイト数（PNG → WebP / AVIF）を表示する。
+
+使い方:
+  python3 scripts/export-web-images.py
+  python3 scripts/export-web-images.py -j 4 --scene s01-hook
+  python3 scripts/export-web-images.py --report .cache/web-images-report.json
+  python3 scripts/export-web-images.py --force      # 全画像を書き出し直す
+"""
+
+import argparse
+import base64
+import glob
+import io
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, features
+
+import branch_structure
+from atomic_io import atomic_writer, sha256_file
+from image_pipeline import encode
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(PROJECT_ROOT, "public", "images", "scenes")
+OUTPUT_DIR = os.path.join(PROJECT_ROOT, "public", "images", "web")
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")
+PUBLIC_PREFIX = "/images/web"
+
+WIDTHS = (360, 540, 720, 1080)
+QUALITY = {"avif": 50, "webp": 75}
+REPORT_WIDTH = 720  # サイズ集計で代表にする幅（スマートフォン表示相当）
+LQIP_WIDTH = 16
+BLURHASH_COMPONENTS = (4, 7)  # 横 x 縦（9:16 の縦長なので縦を多めに）
+
+# 設定を変えたら上げる（全画像を書き出し直す）
+EXPORT_VERSION = 1
+
+
+def available_formats():
+    """この Pillow でエンコードできる形式（AVIF は Pillow 11.2+ か pillow-avif-plugin）"""
+    formats = ["webp"] if features.check("webp") else []
+    if not features.check("avif"):
+        try:
+            import pillow_avif  # noqa: F401  (AVIF プラグインを登録する)
+        except ImportError:
+            pass
+    if features.check("avif") or "AVIF" in Image.SAVE:
+        formats.insert(0, "avif")
+    return formats
+
+
+def settings(formats):
+    return {"version": EXPORT_VERSION, "widths": list(WIDTHS), "formats": formats,
+            "quality": {fmt: QUALITY[fmt] for fmt in formats}}
+
+
+# ============================================
+# プレースホルダ
+# ============================================
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value, length):
+    return "".join(_BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _to_linear(channel):
+    v = channel / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    return round((v * 12.92 if v <= 0.0031308 else 1.055 * v ** (1 / 2.4) - 0.055) * 255)
+
+
+def _sign_pow(value, exp):
+    return math.copysign(abs(value) ** exp, value)
+
+
+def blurhash(img, components=BLURHASH_COMPONENTS):
+    """blurhash 文字列（https://blurha.sh の仕様。縮小画像から計算する）"""
+    cx, cy = components
+    small = img.convert("RGB").resize((32, 32 * img.height // img.width), Image.Resampling.BOX)
+    width, height = small.size
+    raw = small.tobytes()
+    pixels = [tuple(_to_linear(c) for c in raw[i:i + 3]) for i in range(0, len(raw), 3)]
+    factors = []
+    for j in range(cy):
+        for i in range(cx):
+            norm = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                basis_y = math.cos(math.pi * j * y / height)
+                row = y * width
+                for x in range(width):
+                    basis = norm * math.cos(math.pi * i * x / width) * basis_y
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((cx - 1) + (cy - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(v) for f in ac for v in f)
+        quantized_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantized_max + 1) / 166
+    else:
+        quantized_max, max_value = 0, 1
+    result += _base83(quantized_max, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+    for f in ac:
+        q = [max(0, min(18, int(math.floor(_sign_pow(v / max_value, 0.5) * 9 + 9.5)))) for v in f]
+        result += _base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
+
+
+def lqip(img):
+    """幅 LQIP_WIDTH の WebP を data URI にしたもの（ブラウザ側でぼかして表示する）"""
+    height = max(1, round(img.height * LQIP_WIDTH / img.width))
+    small = img.resize((LQIP_WIDTH, height), Image.Resampling.BOX)
+    buf = io.BytesIO()
+    small.save(buf, "WEBP", quality=40)
+    return "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+# ============================================
+# 書き出し
+# ============================================
+
+def variant_path(stem, width, fmt):
+    return os.path.join(OUTPUT_DIR, f"{stem}-{width}.{fmt}")
+
+
+def export_one(source, stem, formats):
+    """1枚分のバリアントとプレースホルダを書き出して manifest の項目を返す
+
+    ProcessPoolExecutor から呼べるようトップレベル関数にしている。
+    """
+    started = time.perf_counter()
+    with Image.open(source) as opened:
+        img = opened.convert("RGB")
+    variants = {fmt: [] for fmt in formats}
+    for width in WIDTHS:
+        if width > img.width:
+            continue
+        height = round(img.height * width / img.width)
+        resized = img if width == img.width else img.resize((width, height), Image.Resampling.LANCZOS,
+                                                           reducing_gap=3.0)
+        for fmt in formats:
+            path = variant_path(stem, width, fmt)
+            size = encode(resized, path, quality=QUALITY[fmt])
+            variants[fmt].append({
+                "width": width,
+                "height": height,
+                "path": f"{PUBLIC_PREFIX}/{os.path.basename(path)}",
+                "bytes": size,
+            })
+    return {
+        "width": img.width,
+        "height": img.height,
+        "variants": variants,
+        "lqip": lqip(img),
+        "blurhash": blurhash(img),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _up_to_date(entry, source, current_settings):
+    """前回の書き出しがそのまま使えるか（サイズ・mtime が同じならハッシュは取らない）"""
+    if entry is None or entry.get("settings") != current_settings:
+        return False
+    if not all(os.path.exists(os.path.join(PROJECT_ROOT, "public", v["path"].lstrip("/")))
+               for variants in entry["variants"].values() for v in variants):
+        return False
+    stat = os.stat(source)
+    if stat.st_size == entry["source_bytes"] and stat.st_mtime_ns == entry.get("source_mtime_ns"):
+        return True
+    return sha256_file(source) == entry["sha256"]
+
+
+def _remove_variants(entry):
+    for variants in entry.get("variants", {}).values():
+        for v in variants:
+            path = os.path.join(PROJECT_ROOT, "public", v["path"].lstrip("/"))
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def source_images(scene=None):
+    """{stem: path}（_backgrounds などのサブディレクトリは含めない）"""
+    paths = sorted(glob.glob(os.path.join(SOURCE_DIR, "*.png")))
+    images = {os.path.splitext(os.path.basename(p))[0]: p for p in paths}
+    if scene:
+        images = {stem: p for stem, p in images.items() if scene_of(stem) == scene}
+    return images
+
+
+def scene_of(stem):
+    """s01-hook_03 → s01-hook"""
+    return stem.rsplit("_", 1)[0] if "_" in stem else stem
+
+
+def export_all(images, workers=None, force=False):
+    """images を書き出し、更新した manifest の images 部分を返す"""
+    formats = available_formats()
+    current_settings = settings(formats)
+    if "avif" not in formats:
+        print("WARNING: this Pillow cannot encode AVIF, writing WebP only", flush=True)
+
+    manifest = load_manifest()
+    entries = dict(manifest.get("images", {}))
+    todo = {
+        stem: path for stem, path in images.items()
+        if force or not _up_to_date(entries.get(stem), path, current_settings)
+    }
+    print(f"Images: {len(images)}, to export: {len(todo)}, formats: {', '.join(formats)}", flush=True)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 2
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(export_one, path, stem, formats): stem for stem, path in todo.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            stem = futures[future]
+            source = todo[stem]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"  [{done}/{len(todo)}] FAIL: {stem} ({e})", flush=True)
+                continue
+            stat = os.stat(source)
+            entry.update({
+                "source": os.path.relpath(source, os.path.join(PROJECT_ROOT, "public")),
+                "sha256": sha256_file(source),
+                "source_bytes": stat.st_size,
+                "source_mtime_ns": stat.st_mtime_ns,
+                "settings": current_settings,
+            })
+            old = entries.get(stem)
+            if old:
+                # 幅や形式が減った場合の残骸を消す
+                keep = {v["path"] for variants in entry["variants"].values() for v in variants}
+                _remove_variants({"variants": {
+                    fmt: [v for v in vs if v["path"] not in keep] for fmt, vs in old.get("variants", {}).items()
+                }})
+            entries[stem] = entry
+            print(f"  [{done}/{len(todo)}] OK: {stem} ({entry['seconds']:.1f}s)", flush=True)
+
+    # 元画像がなくなったものを削除（--scene 指定時は対象シーンのみ）
+    scenes = {scene_of(stem) for stem in images}
+    for stem in [s for s in entries if s not in source_images() and (not images or scene_of(s) in scenes)]:
+        _remove_variants(entries.pop(stem))
+        print(f"  REMOVED: {stem} (source image deleted)", flush=True)
+
+    elapsed = time.perf_counter() - started
+    with atomic_writer(MANIFEST_PATH, "w") as f:
+        json.dump({"version": EXPORT_VERSION, "images": entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    print(f"Exported {len(todo) - failed} images in {elapsed:.1f}s ({workers} workers)"
+          + (f", {failed} failed" if failed else ""), flush=True)
+    return entries, failed
+
+
+# ============================================
+# サイズ集計
+# ============================================
+
+def _variant_bytes(entry, fmt, width=REPORT_WIDTH):
+    for v in entry["variants"].get(fmt, []):
+        if v["width"] == width:
+            return v["bytes"]
+    return 0
+
+
+def size_report(entries):
+    """シーン別・経路別のバイト数（PNG と、REPORT_WIDTH の WebP / AVIF）"""
+    per_scene = {}
+    for stem, entry in entries.items():
+        row = per_scene.setdefault(scene_of(stem), {"images": 0, "png": 0, "webp": 0, "avif": 0})
+        row["images"] += 1
+        row["png"] += entry["source_bytes"]
+        row["webp"] += _variant_bytes(entry, "webp")
+        row["avif"] += _variant_bytes(entry, "avif")
+
+    per_branch = {}
+    try:
+        graph = branch_structure.load()
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"WARNING: branch structure unavailable ({e})", flush=True)
+        graph = None
+    if graph:
+        for path in branch_structure.paths(graph):
+            total = {"scenes": len(path), "png": 0, "webp": 0, "avif": 0}
+            for scene_id in path:
+                for key in ("png", "webp", "avif"):
+                    total[key] += per_scene.get(scene_id, {}).get(key, 0)
+            per_branch[branch_structure.branch_name(graph, path)] = total
+    return {"width": REPORT_WIDTH, "scenes": per_scene, "branches": per_branch}
+
+
+def _mb(n):
+    return f"{n / 1e6:7.2f}"
+
+
+def _saved(row):
+    """PNG に対する削減率（AVIF があれば AVIF、なければ WebP）"""
+    best = row["avif"] or row["webp"]
+    return f"{1 - best / row['png']:.0%}" if row["png"] and best else "-"
+
+
+def print_size_report(report):
+    width = report["width"]
+    print(f"\n  {'scene':<20} {'imgs':>4} {'PNG MB':>8} {f'WebP@{width}':>10} {f'AVIF@{width}':>10} {'saved':>6}",
+          flush=True)
+    totals = {"png": 0, "webp": 0, "avif": 0}
+    for scene_id, row in sorted(report["scenes"].items()):
+        for key in totals:
+            totals[key] += row[key]
+        print(f"  {scene_id:<20} {row['images']:>4} {_mb(row['png']):>8} {_mb(row['webp']):>10} "
+              f"{_mb(row['avif']):>10} {_saved(row):>6}", flush=True)
+    print(f"  {'total':<20} {'':>4} {_mb(totals['png']):>8} {_mb(totals['webp']):>10} "
+          f"{_mb(totals['avif']):>10} {_saved(totals):>6}", flush=True)
+    if report["branches"]:
+        print(f"\n  {'branch path':<20} {'scenes':>6} {'PNG MB':>8} {f'WebP@{width}':>10} {f'AVIF@{width}':>10} "
+              f"{'saved':>6}", flush=True)
+        for name, row in report["branches"].items():
+            print(f"  {name:<20} {row['scenes']:>6} {_mb(row['png']):>8} {_mb(row['webp']):>10} "
+                  f"{_mb(row['avif']):>10} {_saved(row):>6}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="シーン画像の AVIF / WebP 配信用バリアントを書き出す")
+    parser.add_argument("-j", "--jobs", type=int, help="エンコードのプロセス数 (default: CPU コア数)")
+    parser.add_argument("--scene", help="指定シーンの画像のみ（例: s01-hook）")
+    parser.add_argument("--force", action="store_true", help="変更がなくても書き出し直す")
+    parser.add_argument("--report", help="サイズ集計を JSON で保存するパス")
+    args = parser.parse_args()
+
+    images = source_images(args.scene)
+    if not images:
+        print(f"No images in {SOURCE_DIR}", flush=True)
+        return
+    entries, failed = export_all(images, args.jobs, args.force)
+    report = size_report(entries)
+    print_size_report(report)
+    if args.report:
+        with atomic_writer(args.report, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report saved to: {args.report}", flush=True)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+"""fal.ai キュー API 共通クライアント
+
+generate-images.py / generate-extra-images.py / generate-videos.py で
+共有する。認証・タイムアウトを一元化し、queue.fal.run と CDN への
+HTTPS コネクションを http_pool.HttpPool で使い回す。
+
+完了待ちは3方式:
+  poll     PollPolicy に従ったステータスポーリング（既定）
+  stream   /status/stream の Server-Sent Events を購読
+  webhook  fal_webhook で通知を受ける（ローカル WebhookReceiver）
+
+環境変数:
+  FAL_KEY            fal.ai API キー
+  FAL_QUEUE_URL      キュー API のベース URL (default: https://queue.fal.run)
+  FAL_COMPLETION     poll | stream | webhook (default: poll)
+  FAL_WEBHOOK_URL    fal から到達できる webhook の公開 URL（webhook 時必須）
+  FAL_WEBHOOK_PORT   WebhookReceiver の待ち受けポート (default: 8787)
+  FAL_STORAGE_URL    ストレージ API のベース URL (default: https://rest.alpha.fal.ai)
+  FAL_UPLOAD_TTL_DAYS  アップロード済み URL を再利用する日数 (default: 7)
+
+ローカル画像は upload_file() で fal storage に上げて URL を得る。
+同じ内容（SHA-256）のファイルは .cache/fal-uploads.json の記録を使い再送しない。
+
+submit / queue / generation / download / upload は telemetry のスパンとして記録する。
+
+ローカル検証は fal_fake_server.py を起動し FAL_QUEUE_URL をそちらへ向ける。
+"""
+
+import base64
+import contextlib
+import hashlib
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+import telemetry
+from atomic_io import atomic_writer
+from http_pool import HttpError, HttpPool
+
+FAL_KEY = os.environ.get("FAL_KEY", "fc376a81-a3e6-4e6d-aa14-5ed2b14e40fd:4d5a982f1a579818e1dc87822964da4a")
+FAL_QUEUE_URL = os.environ.get("FAL_QUEUE_URL", "https://queue.fal.run").rstrip("/")
+FAL_COMPLETION = os.environ.get("FAL_COMPLETION", "poll")
+FAL_WEBHOOK_URL = os.environ.get("FAL_WEBHOOK_URL", "")
+FAL_WEBHOOK_PORT = int(os.environ.get("FAL_WEBHOOK_PORT", "8787"))
+FAL_STORAGE_URL = os.environ.get("FAL_STORAGE_URL", "https://rest.alpha.fal.ai").rstrip("/")
+FAL_UPLOAD_TTL = float(os.environ.get("FAL_UPLOAD_TTL_DAYS", "7")) * 86400
+
+UPLOAD_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ".cache", "fal-uploads.json"
+)
+
+REQUEST_TIMEOUT = 30
+DOWNLOAD_TIMEOUT = 120
+STREAM_READ_TIMEOUT = 60
+
+
+class JobFailed(Exception):
+    """fal.ai 側でジョブが失敗した"""
+
+
+class JobTimeout(Exception):
+    """完了待ちがタイムアウトした"""
+
+
+class DownloadError(Exception):
+    """ダウンロード内容がサイズ・ハッシュ検証に失敗した"""
+
+
+class _Truncated(OSError):
+    """Content-Length に満たないまま接続が切れた（再開可能）"""
+
+
+def _retryable(error):
+    """HttpError のうち取り直せば通りうるもの（429 / 5xx）"""
+    return error.status == 429 or error.status >= 500
+
+
+def _range_total(headers):
+    """416 応答の Content-Range（bytes */N）から全体のバイト数 N（不明なら None）"""
+    value = headers.get("content-range") or ""
+    total = value.rpartition("/")[2].strip()
+    return int(total) if total.isdigit() else None
+
+
+def _md5_from_headers(headers):
+    """Content-MD5 / x-goog-hash から MD5 (hex) を取り出す"""
+    value = headers.get("content-md5")
+    if not value:
+        for part in headers.get("x-goog-hash", "").split(","):
+            key, _, encoded = part.strip().partition("=")
+            if key == "md5":
+                value = encoded
+    if not value:
+        return None
+    try:
+        return base64.b64decode(value).hex()
+    except ValueError:
+        return None
+
+
+# ============================================
+# ポーリング戦略
+# ============================================
+
+class PollPolicy:
+    """適応的ポーリング間隔
+
+    - 初回は短く (first)、以降は factor 倍で max_interval まで伸ばす
+    - IN_QUEUE の間は queue_position × per_position 秒を下限にする
+    - 処理中は想定所要時間 (expected) を超えない間隔にして完了直後を拾う
+    - ±jitter の揺らぎで多数ジョブのポーリングが同期しないようにする
+    """
+
+    def __init__(self, first, factor, max_interval, expected, per_position, timeout, jitter=0.2):
+        self.first = first
+        self.factor = factor
+        self.max_interval = max_interval
+        self.expected = expected
+        self.per_position = per_position
+        self.timeout = timeout
+        self.jitter = jitter
+
+    def next_delay(self, attempt, elapsed, status=None, rng=random):
+        """attempt 回目のポーリング前に待つ秒数"""
+        delay = self.first * (self.factor ** attempt)
+        state = (status or {}).get("status")
+        if state == "IN_QUEUE":
+            position = (status or {}).get("queue_position") or 0
+            delay = max(delay, position * self.per_position)
+        else:
+            remaining = self.expected - elapsed
+            if remaining > self.first:
+                delay = min(delay, remaining)
+        delay = min(delay, self.max_interval)
+        delay *= rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.2, delay)
+
+
+# Flux Pro 画像: 数秒〜十数秒で終わるので短い初回＋小さい上限
+IMAGE_POLL = PollPolicy(
+    first=1.0, factor=1.5, max_interval=5.0, expected=10.0, per_position=2.0, timeout=180,
+)
+# MiniMax 動画: 数分かかるので初回を遅らせ上限も大きく
+VIDEO_POLL = PollPolicy(
+    first=10.0, factor=1.5, max_interval=30.0, expected=180.0, per_position=10.0, timeout=600,
+)
+
+
+# ============================================
+# Webhook 受信
+# ============================================
+
+class WebhookReceiver:
+    """fal_webhook の通知を受けるローカル HTTP サーバー
+
+    fal からは FAL_WEBHOOK_URL（トンネル等の公開 URL）経由で到達させる。
+    """
+
+    def __init__(self, port=FAL_WEBHOOK_PORT, host="0.0.0.0"):
+        self._results = {}
+        self._cond = threading.Condition()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    payload = {}
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                receiver._deliver(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def _deliver(self, payload):
+        request_id = payload.get("request_id")
+        if not request_id:
+            return
+        with self._cond:
+            self._results[request_id] = payload
+            self._cond.notify_all()
+
+    def wait(self, request_id, timeout):
+        """request_id の通知を待って webhook ペイロードを返す"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while request_id not in self._results:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise JobTimeout(f"webhook timeout: {request_id}")
+                self._cond.wait(remaining)
+            return self._results.pop(request_id)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def sniff_content_type(data):
+    """先頭バイトから MIME タイプを決める（.png 名の JPEG があるため）"""
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp":
+        return "video/mp4"
+    return "application/octet-stream"
+
+
+def data_uri(path):
+    """ローカルファイルを data URI にする（アップロード不要・オフライン用）"""
+    with open(path, "rb") as f:
+        data = f.read()
+    return f"data:{sniff_content_type(data)};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+# ============================================
+# クライアント
+# ============================================
+
+class FalClient:
+    """fal.ai キュー API クライアント（スレッドセーフ）"""
+
+    def __init__(self, key=FAL_KEY, queue_url=FAL_QUEUE_URL, timeout=REQUEST_TIMEOUT, pool=None,
+                 completion=FAL_COMPLETION, webhook_url=FAL_WEBHOOK_URL, webhook_port=FAL_WEBHOOK_PORT):
+        if completion not in ("poll", "stream", "webhook"):
+            raise ValueError(f"unknown completion mode: {completion}")
+        if completion == "webhook" and not webhook_url:
+            raise ValueError("FAL_WEBHOOK_URL is required for webhook completion")
+        self.key = key
+        self.queue_url = queue_url.rstrip("/")
+        self.timeout = timeout
+        self.pool = pool or HttpPool(timeout=timeout)
+        self.completion = completion
+        self.webhook_url = webhook_url
+        self._webhook_port = webhook_port
+        self._webhook = None
+        self._webhook_lock = threading.Lock()
+        self.storage_url = FAL_STORAGE_URL
+        self._uploads = None
+        self._uploads_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.polls = 0  # クライアント全体のステータス問い合わせ回数
+        self.uploads = 0
+        self.uploads_reused = 0
+
+    def _url(self, path_or_url):
+        if path_or_url.startswith(("http://", "https://")):
+            return path_or_url
+        return f"{self.queue_url}/{path_or_url.lstrip('/')}"
+
+    def _receiver(self):
+        with self._webhook_lock:
+            if self._webhook is None:
+                self._webhook = WebhookReceiver(port=self._webhook_port)
+            return self._webhook
+
+    def request(self, method, url, data=None):
+        """fal.ai API へのリクエスト（JSON を返す）"""
+        headers = {
+            "Authorization": f"Key {self.key}",
+            "Content-Type": "application/json",
+        }
+        body = json.dumps(data).encode() if data else None
+        _, _, payload = self.pool.request(
+            method, self._url(url), body=body, headers=headers, timeout=self.timeout,
+        )
+        return json.loads(payload)
+
+    def submit(self, model, payload):
+        """ジョブを投入してレスポンスを返す（request_id を含む）"""
+        if self.completion == "webhook":
+            self._receiver()
+            model = f"{model}?fal_webhook={quote(self.webhook_url, safe='')}"
+        with telemetry.span("submit"):
+            return self.request("POST", model, payload)
+
+    def status(self, model_base, request_id):
+        with self._stats_lock:
+            self.polls += 1
+        return self.request("GET", f"{model_base}/requests/{request_id}/status")
+
+    def result(self, model_base, request_id):
+        return self.request("GET", f"{model_base}/requests/{request_id}")
+
+    def _poll(self, model_base, request_id, policy, on_status):
+        """完了までステータスをポーリングし、このジョブで問い合わせた回数を返す"""
+        started = time.monotonic()
+        status = None
+        attempt = 0
+        while True:
+            elapsed = time.monotonic() - started
+            delay = policy.next_delay(attempt, elapsed, status)
+            if elapsed + delay > policy.timeout:
+                raise JobTimeout(f"{request_id} after {elapsed:.0f}s")
+            time.sleep(delay)
+            attempt += 1
+            try:
+                status = self.status(model_base, request_id)
+            except HttpError as e:
+                # 401 / 403 / 404 などは待っても直らない（JobTimeout に化けさせない）
+                if not _retryable(e):
+                    raise
+                continue
+            except (OSError, http.client.HTTPException, ValueError):
+                continue
+            if on_status:
+                on_status(status, time.monotonic() - started)
+            state = status.get("status")
+            if state == "COMPLETED":
+                if status.get("error"):
+                    raise JobFailed(status["error"])
+                return attempt
+            if state in ("FAILED", "ERROR"):
+                raise JobFailed(status.get("error") or state)
+
+    def _stream(self, model_base, request_id, policy, on_status):
+        """SSE でステータスを購読（切断されたらポーリングへフォールバック）
+
+        Returns: フォールバックで問い合わせた回数
+        """
+        started = time.monotonic()
+        url = self._url(f"{model_base}/requests/{request_id}/status/stream")
+        headers = {"Authorization": f"Key {self.key}", "Accept": "text/event-stream"}
+        try:
+            with self.pool.open("GET", url, headers=headers, timeout=STREAM_READ_TIMEOUT) as resp:
+                for line in resp.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        status = json.loads(line[5:].strip())
+                    except ValueError:
+                        continue
+                    if on_status:
+                        on_status(status, time.monotonic() - started)
+                    state = status.get("status")
+                    if state == "COMPLETED":
+                        if status.get("error"):
+                            raise JobFailed(status["error"])
+                        return 0
+                    if state in ("FAILED", "ERROR"):
+                        raise JobFailed(status.get("error") or state)
+                    if time.monotonic() - started > policy.timeout:
+                        raise JobTimeout(f"{request_id} after {policy.timeout}s")
+        except (JobFailed, JobTimeout):
+            raise
+        except Exception:
+            pass
+        return self._poll(model_base, request_id, policy, on_status)
+
+    def wait_result(self, model_base, request_id, policy=IMAGE_POLL, on_status=None):
+        """完了を待って結果 JSON を返す
+
+        待ち時間は IN_PROGRESS になった時点で "queue" / "generation" の
+        スパンに分けて記録する（webhook は区別できないので "wait"）。
+
+        Raises:
+            JobFailed: fal.ai 側でジョブが失敗
+            JobTimeout: policy.timeout 以内に完了しなかった
+            HttpError: ステータス取得が 429 / 5xx 以外で失敗（キー・request_id の誤りなど）
+        """
+        started = time.monotonic()
+        running = []
+        polls = 0
+
+        def track(status, elapsed):
+            if not running and status.get("status") in ("IN_PROGRESS", "COMPLETED"):
+                running.append(time.monotonic())
+            if on_status:
+                on_status(status, elapsed)
+
+        outcome = "error"
+        try:
+            if self.completion == "webhook":
+                payload = self._receiver().wait(request_id, policy.timeout)
+                if payload.get("status") != "OK":
+                    raise JobFailed(payload.get("error") or payload.get("status"))
+                if payload.get("payload"):
+                    outcome = "ok"
+                    return payload["payload"]
+            elif self.completion == "stream":
+                polls = self._stream(model_base, request_id, policy, track)
+            else:
+                polls = self._poll(model_base, request_id, policy, track)
+            result = self.result(model_base, request_id)
+            outcome = "ok"
+            return result
+        finally:
+            ended = time.monotonic()
+            if running:
+                telemetry.record("queue", started, running[0], polls=polls)
+                telemetry.record("generation", running[0], ended, status=outcome)
+            else:
+                telemetry.record("wait", started, ended, status=outcome)
+
+    def _download_once(self, url, dest, part, expected_size, expected_sha256, resume):
+        offset = os.path.getsize(part) if resume and os.path.exists(part) else 0
+        sha = hashlib.sha256()
+        if offset:
+            with open(part, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(chunk)
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        try:
+            resp_cm = self.pool.open("GET", url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+        except HttpError as e:
+            if not (offset and e.status == 416):
+                raise
+            # .part が既に全体 → 続きはないので検証して置き換える
+            # （全体長も期待値もなく確かめられなければ捨てて最初から）
+            total = _range_total(e.headers)
+            if total != offset and (total is not None or not (expected_size or expected_sha256)):
+                os.remove(part)
+                raise _Truncated(f".part has {offset} bytes, server reports {total}") from e
+            return self._finish_part(part, dest, offset, sha.hexdigest(), expected_size, expected_sha256)
+
+        with resp_cm as resp:
+            if offset and resp.status != 206:
+                # Range 非対応 → 最初から取り直す
+                offset = 0
+                sha = hashlib.sha256()
+            declared = resp.headers.get("content-length")
+            declared = int(declared) if declared is not None else None
+            expected_md5 = _md5_from_headers(resp.headers) if offset == 0 else None
+            md5 = hashlib.md5() if expected_md5 else None
+
+            received = 0
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in resp.iter_chunks():
+                    f.write(chunk)
+                    sha.update(chunk)
+                    if md5:
+                        md5.update(chunk)
+                    received += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+
+        if declared is not None and received != declared:
+            raise _Truncated(f"received {received} of {declared} bytes")
+        return self._finish_part(part, dest, offset + received, sha.hexdigest(), expected_size, expected_sha256,
+                                 md5.hexdigest() if md5 else None, expected_md5)
+
+    @staticmethod
+    def _finish_part(part, dest, size, digest, expected_size, expected_sha256, md5=None, expected_md5=None):
+        """検証できたら .part を dest へ rename する"""
+        if expected_size and size != expected_size:
+            raise DownloadError(f"size mismatch: {size} != {expected_size}")
+        if expected_sha256 and digest != expected_sha256:
+            raise DownloadError(f"sha256 mismatch: {digest} != {expected_sha256}")
+        if expected_md5 and md5 != expected_md5:
+            raise DownloadError(f"md5 mismatch: {md5} != {expected_md5}")
+        os.replace(part, dest)
+        return size, digest
+
+    def download(self, url, dest, expected_size=None, expected_sha256=None, resume=False, attempts=3):
+        """生成物を dest へストリーミング保存し、検証後に原子的に置き換える
+
+        dest.part に書きながら SHA-256 を計算し、Content-Length・expected_size・
+        expected_sha256・CDN の MD5 ヘッダと照合できた場合のみ rename する。
+        resume=True なら残っている .part から HTTP Range で続きを取る（動画向け）。
+        .part が既に全体なら（416）検証だけして置き換える。
+        接続エラー・途中切断・429 / 5xx は attempts 回まで取り直す。
+
+        Returns: (bytes, sha256 hex)
+        """
+        part = dest + ".part"
+        for attempt in range(attempts):
+            try:
+                with telemetry.span("download", attempt=attempt + 1) as span:
+                    size, digest = self._download_once(url, dest, part, expected_size, expected_sha256, resume)
+                    span.set(bytes=size)
+                return size, digest
+            except DownloadError:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(part)
+                raise
+            except HttpError as e:
+                if not _retryable(e) or attempt + 1 >= attempts:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(part)
+                    raise
+                time.sleep(1 + attempt)
+            except (OSError, http.client.HTTPException):
+                if not resume:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(part)
+                if attempt + 1 >= attempts:
+                    raise
+                time.sleep(1 + attempt)
+        raise RuntimeError("unreachable")
+
+    def fetch(self, url, expected_size=None):
+        """生成物をメモリへストリーミング取得し、検証済みのバイト列を返す
+
+        画像はこのままプロセス内でデコード・リサイズするのでディスクを経由しない。
+        """
+        buf = bytearray()
+        with telemetry.span("download") as span, \
+                self.pool.open("GET", url, timeout=DOWNLOAD_TIMEOUT) as resp:
+            declared = resp.headers.get("content-length")
+            expected_md5 = _md5_from_headers(resp.headers)
+            for chunk in resp.iter_chunks():
+                buf.extend(chunk)
+            span.set(bytes=len(buf))
+        if declared is not None and len(buf) != int(declared):
+            raise DownloadError(f"received {len(buf)} of {declared} bytes")
+        if expected_size and len(buf) != expected_size:
+            raise DownloadError(f"size mismatch: {len(buf)} != {expected_size}")
+        if expected_md5 and hashlib.md5(buf).hexdigest() != expected_md5:
+            raise DownloadError("md5 mismatch")
+        return bytes(buf)
+
+    def upload(self, data, content_type, file_name):
+        """fal storage へアップロードし、モデル入力に使える URL を返す"""
+        with telemetry.span("upload", bytes=len(data)):
+            initiate = self.request("POST", f"{self.storage_url}/storage/upload/initiate", {
+                "content_type": content_type,
+                "file_name": file_name,
+            })
+            # 署名付き URL なので fal の Authorization は付けない
+            self.pool.request(
+                "PUT", initiate["upload_url"], body=data,
+                headers={"Content-Type": content_type}, timeout=DOWNLOAD_TIMEOUT,
+            )
+        with self._stats_lock:
+            self.uploads += 1
+        return initiate["file_url"]
+
+    def _upload_records(self):
+        if self._uploads is None:
+            try:
+                with open(UPLOAD_CACHE_PATH, encoding="utf-8") as f:
+                    self._uploads = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._uploads = {}
+        return self._uploads
+
+    def upload_file(self, path):
+        """ローカルファイルをアップロードして URL を返す（同じ内容は再送しない）"""
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with self._uploads_lock:
+            record = self._upload_records().get(digest)
+            if (record and record.get("storage") == self.storage_url
+                    and time.time() - record["uploaded"] < FAL_UPLOAD_TTL):
+                self.uploads_reused += 1
+                return record["url"]
+
+        url = self.upload(data, sniff_content_type(data), os.path.basename(path))
+        with self._uploads_lock:
+            records = self._upload_records()
+            records[digest] = {
+                "url": url,
+                "storage": self.storage_url,
+                "uploaded": time.time(),
+                "name": os.path.basename(path),
+            }
+            with atomic_writer(UPLOAD_CACHE_PATH, "w") as f:
+                json.dump(records, f, indent=1, sort_keys=True)
+        return url
+
+    def print_stats(self):
+        """接続再利用・レイテンシのカウンタを表示"""
+        print(self.pool.stats.format(), flush=True)
+        print(f"  status polls: {self.polls} (completion: {self.completion})", flush=True)
+        if self.uploads or self.uploads_reused:
+            print(f"  uploads: {self.uploads} (reused {self.uploads_reused})", flush=True)
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """プロセス共通の FalClient を返す"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = FalClient()
+        return _default_client
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""fal.ai キュー API のローカル偽サーバー
+
+実 API を叩かずにポーリング戦略・ストリーム・webhook・ダウンロードを
+検証するための最小実装。submit → IN_QUEUE → IN_PROGRESS → COMPLETED の
+遷移を時間で再現し、生成物は /files/ 以下から配信する（Range 対応）。
+ストレージアップロード（/storage/upload/initiate → PUT）も受け付ける。
+
+使い方:
+  python3 scripts/fal_fake_server.py --port 8765 --queue 2 --work 6
+  FAL_QUEUE_URL=http://127.0.0.1:8765 python3 scripts/generate-images.py
+  FAL_QUEUE_URL=http://127.0.0.1:8765 FAL_STORAGE_URL=http://127.0.0.1:8765 \
+    python3 scripts/generate-videos.py
+
+GET /_stats でエンドポイント別のリクエスト数を JSON で返す。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import urllib.request
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def _tiny_png(width=4, height=4, rgb=(200, 40, 40)):
+    """Pillow なしで単色 PNG を作る"""
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    raw = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+class FakeQueue:
+    """ジョブ状態を保持する"""
+
+    def __init__(self, queue_seconds, work_seconds, fail_every=0):
+        self.queue_seconds = queue_seconds
+        self.work_seconds = work_seconds
+        self.fail_every = fail_every
+        self.jobs = {}
+        self.files = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def count(self, kind):
+        with self.lock:
+            self.stats[kind] = self.stats.get(kind, 0) + 1
+
+    def submit(self, model, payload, webhook):
+        request_id = str(uuid.uuid4())
+        with self.lock:
+            number = len(self.jobs) + 1
+            self.jobs[request_id] = {
+                "model": model,
+                "payload": payload,
+                "submitted": time.monotonic(),
+                "failed": bool(self.fail_every) and number % self.fail_every == 0,
+            }
+        if webhook:
+            threading.Thread(
+                target=self._notify, args=(request_id, webhook), daemon=True,
+            ).start()
+        return request_id
+
+    def status(self, request_id):
+        job = self.jobs.get(request_id)
+        if job is None:
+            return None
+        elapsed = time.monotonic() - job["submitted"]
+        if elapsed < self.queue_seconds:
+            remaining = self.queue_seconds - elapsed
+            return {"status": "IN_QUEUE", "queue_position": int(remaining) + 1}
+        if elapsed < self.queue_seconds + self.work_seconds:
+            return {"status": "IN_PROGRESS", "logs": []}
+        if job["failed"]:
+            return {"status": "COMPLETED", "error": "fake failure"}
+        return {"status": "COMPLETED"}
+
+    def result(self, request_id, base_url):
+        job = self.jobs[request_id]
+        is_video = "video" in job["model"]
+        name = f"{request_id}.{'mp4' if is_video else 'png'}"
+        if name not in self.files:
+            if is_video:
+                seed = hashlib.sha256(request_id.encode()).digest()
+                self.files[name] = seed * 4096
+            else:
+                self.files[name] = _tiny_png()
+        data = self.files[name]
+        entry = {
+            "url": f"{base_url}/files/{name}",
+            "content_type": "video/mp4" if is_video else "image/png",
+            "file_size": len(data),
+        }
+        if is_video:
+            return {"video": entry}
+        return {"images": [dict(entry, width=4, height=4)], "seed": 1}
+
+    def _notify(self, request_id, webhook):
+        time.sleep(self.queue_seconds + self.work_seconds)
+        job = self.jobs[request_id]
+        body = {"request_id": request_id, "status": "ERROR" if job["failed"] else "OK"}
+        if job["failed"]:
+            body["error"] = "fake failure"
+        else:
+            body["payload"] = self.result(request_id, job["base_url"])
+        req = urllib.request.Request(
+            webhook, data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        try:
+            urllib.request.urlopen(req, timeout=10).close()
+        except Exception as e:
+            print(f"[fake-fal] webhook error: {e}", flush=True)
+
+
+def make_handler(queue):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _base_url(self):
+            return f"http://{self.headers.get('Host')}"
+
+        def _json(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_PUT(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(length)
+            name = urlsplit(self.path).path.rsplit("/", 1)[-1]
+            queue.count("upload")
+            queue.files[name] = data
+            self._json(200, {})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            parts = urlsplit(self.path)
+            if parts.path == "/storage/upload/initiate":
+                name = f"{uuid.uuid4()}-{payload.get('file_name', 'upload')}"
+                return self._json(200, {
+                    "upload_url": f"{self._base_url()}/_upload/{name}",
+                    "file_url": f"{self._base_url()}/files/{name}",
+                })
+            webhook = parse_qs(parts.query).get("fal_webhook", [None])[0]
+            queue.count("submit")
+            request_id = queue.submit(parts.path.strip("/"), payload, webhook)
+            queue.jobs[request_id]["base_url"] = self._base_url()
+            self._json(200, {"request_id": request_id})
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == "/_stats":
+                return self._json(200, queue.stats)
+            if path.startswith("/files/"):
+                return self._file(path[len("/files/"):])
+            if "/requests/" not in path:
+                return self._json(404, {"detail": "not found"})
+
+            rest = path.split("/requests/", 1)[1].strip("/").split("/")
+            request_id = rest[0]
+            if request_id not in queue.jobs:
+                return self._json(404, {"detail": "unknown request"})
+            if rest[1:] == ["status"]:
+                queue.count("status")
+                return self._json(200, queue.status(request_id))
+            if rest[1:] == ["status", "stream"]:
+                queue.count("stream")
+                return self._stream(request_id)
+            queue.count("result")
+            return self._json(200, queue.result(request_id, self._base_url()))
+
+        def _stream(self, request_id):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            while True:
+                status = queue.status(request_id)
+                self.wfile.write(f"data: {json.dumps(status)}\n\n".encode())
+                self.wfile.flush()
+                if status["status"] == "COMPLETED":
+                    return
+                time.sleep(0.5)
+
+        def _file(self, name):
+            data = queue.files.get(name)
+            if data is None:
+                return self._json(404, {"detail": "no such file"})
+            queue.count("download")
+            start = 0
+            status = 200
+            range_header = self.headers.get("Range")
+            if range_header and range_header.startswith("bytes="):
+                start = int(range_header[6:].split("-")[0] or 0)
+                status = 206
+            body = data[start:]
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            if os.environ.get("FAKE_FAL_VERBOSE"):
+                super().log_message(*args)
+
+    return Handler
+
+
+def serve(port=8765, queue_seconds=2.0, work_seconds=5.0, fail_every=0):
+    """偽サーバーを起動して (server, queue) を返す（バックグラウンドスレッド）"""
+    queue = FakeQueue(queue_seconds, work_seconds, fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(queue))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fal.ai queue API fake server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--queue", type=float, default=2.0, help="IN_QUEUE 秒数")
+    parser.add_argument("--work", type=float, default=5.0, help="IN_PROGRESS 秒数")
+    parser.add_argument("--fail-every", type=int, default=0, help="N 件ごとに失敗させる")
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, args.queue, args.work, args.fail_every)
+    print(f"[fake-fal] listening on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
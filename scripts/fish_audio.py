@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Fish Audio TTS 共通クライアント
+
+generate-audio.py / build.py で共有する。api.fish.audio への HTTPS
+コネクションを http_pool.HttpPool で使い回し、並行ワーカー全体の
+リクエストレートを retry_policy.TokenBucket で抑える。
+
+429 / 503 を受けたら Retry-After（なければクラス別バックオフ）の間、
+バケットを止めて全ワーカーを待たせてから同じリクエストを再送する。
+タイムアウト・接続断は transient として指数バックオフで再送する。
+
+synthesize_to() は応答をメモリに溜めず、届いたチャンクから順に
+ファイルへ書く（完了時に原子的に置き換える）。
+
+環境変数:
+  FISH_AUDIO_API_KEY   API キー
+  FISH_API_URL         TTS エンドポイント (default: https://api.fish.audio/v1/tts)
+  FISH_RATE_PER_MINUTE 全ワーカー合計の上限 (default: 60, 0 で無制限)
+"""
+
+import json
+import os
+import threading
+import time
+
+import telemetry
+from atomic_io import atomic_writer
+from http_pool import HttpError, HttpPool
+from retry_policy import RetryTracker, TokenBucket, classify, parse_retry_after
+
+FISH_API_URL = os.environ.get("FISH_API_URL", "https://api.fish.audio/v1/tts")
+FISH_RATE_PER_MINUTE = float(os.environ.get("FISH_RATE_PER_MINUTE", "60"))
+REQUEST_TIMEOUT = 120
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Retry-After を尊重して待つステータス
+_THROTTLE_STATUSES = (429, 503)
+
+
+class FishAudioClient:
+    """Fish Audio TTS クライアント（スレッドセーフ）"""
+
+    def __init__(self, api_key=None, url=FISH_API_URL, rate_per_minute=FISH_RATE_PER_MINUTE,
+                 timeout=REQUEST_TIMEOUT, pool=None):
+        self.api_key = api_key if api_key is not None else os.environ.get("FISH_AUDIO_API_KEY")
+        self.url = url
+        self.timeout = timeout
+        self.pool = pool or HttpPool(timeout=timeout)
+        self.bucket = TokenBucket(rate_per_minute / 60)
+        self.retries = RetryTracker()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.throttle_wait = 0.0
+
+    def _throttle(self, error, delay):
+        """429 / 503: Retry-After（なければバックオフ）の間、全ワーカーを止める"""
+        retry_after = parse_retry_after(error.headers.get("retry-after"))
+        wait = delay if retry_after is None else retry_after
+        with self._lock:
+            self.throttled += 1
+            self.throttle_wait += wait
+        self.bucket.hold(wait)
+        suffix = f" (Retry-After {retry_after:.0f}s)" if retry_after is not None else ""
+        print(f"    [tts] HTTP {error.status}, pausing {wait:.0f}s{suffix}", flush=True)
+
+    def _with_retries(self, text, reference_id, format, receive):
+        """TTS リクエストを送り receive(resp, span) の戻り値を返す（レート制限・リトライ込み）"""
+        if not self.api_key:
+            raise RuntimeError("FISH_AUDIO_API_KEY not set")
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        body = json.dumps({"text": text, "reference_id": reference_id, "format": format}).encode()
+        attempts = {}
+        while True:
+            self.bucket.acquire()
+            with self._lock:
+                self.requests += 1
+            try:
+                with telemetry.span("tts", chars=len(text), retries=sum(attempts.values())) as span:
+                    with self.pool.open("POST", self.url, body=body, headers=headers,
+                                        timeout=self.timeout) as resp:
+                        return receive(resp, span)
+            except Exception as e:
+                throttled = isinstance(e, HttpError) and e.status in _THROTTLE_STATUSES
+                failure_class = "quota" if throttled else classify(e)
+                delay = self.retries.next_delay(attempts, failure_class)
+                if delay is None:
+                    raise
+                if throttled:
+                    self._throttle(e, delay)
+                else:
+                    print(f"    [tts] {failure_class} error, retry in {delay:.0f}s: {str(e)[:120]}", flush=True)
+                    time.sleep(delay)
+
+    def synthesize(self, text, reference_id, format="mp3"):
+        """text を合成して音声のバイト列を返す"""
+        def receive(resp, span):
+            data = resp.read()
+            span.set(bytes=len(data))
+            return data
+
+        return self._with_retries(text, reference_id, format, receive)
+
+    def synthesize_to(self, text, reference_id, dest, format="mp3"):
+        """text を合成し、届いたチャンクから dest へ書く
+
+        Returns: (書き込んだバイト数, 送信から最初のチャンクが届くまでの秒数)
+        """
+        def receive(resp, span):
+            first_chunk = None
+            written = 0
+            with atomic_writer(dest) as f:
+                for chunk in resp.iter_chunks(STREAM_CHUNK_SIZE):
+                    if first_chunk is None:
+                        first_chunk = time.monotonic() - span.start
+                    f.write(chunk)
+                    written += len(chunk)
+            span.set(bytes=written, first_chunk=round(first_chunk or 0.0, 3))
+            return written, first_chunk or 0.0
+
+        return self._with_retries(text, reference_id, format, receive)
+
+    def print_stats(self):
+        """リクエスト数・スロットリング・接続再利用のカウンタを表示"""
+        print(self.pool.stats.format(), flush=True)
+        print(f"  TTS requests: {self.requests}, throttled {self.throttled} "
+              f"(paused {self.throttle_wait:.0f}s), rate wait {self.bucket.waited:.1f}s", flush=True)
+        print(f"  Retries: {self.retries.summary()}", flush=True)
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """プロセス共通の FishAudioClient を返す"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = FishAudioClient()
+        return _default_client
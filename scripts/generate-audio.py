@@ -9,13 +9,44 @@ Fish Audio APIに送信する。
   python3 scripts/generate-audio.py
   python3 scripts/generate-audio.py --dry-run   # プレビューのみ
   python3 scripts/generate-audio.py --scene s01-hook  # 1シーンだけ
+  python3 scripts/generate-audio.py -j 6              # 6 シーン並行
+  python3 scripts/generate-audio.py --whole-scene     # 1シーン1リクエストで合成
+  python3 scripts/generate-audio.py --force           # キャッシュを使わず作り直す
+
+合成は fish_audio.py のクライアントで並行に行う（接続の使い回し、
+全ワーカー共有のレート制限、429 の Retry-After に従った一時停止）。
+終了時にシーンごとのレイテンシと、壁時計1秒あたりの生成音声秒数を表示する。
+
+ナレーションは文末（。？！）で区切って文ごとに並行合成し、MP3 の
+フレーム単位でつなぐ（再エンコードなし）。最初の音声が届くまでの時間と、
+失敗時に作り直す量が、シーンではなく1文分になる。
+--whole-scene は1シーン1リクエストで、応答は届いた分から MP3 へ書き出す。
+
+音声と一緒に public/audio/scenes/{scene}.json / .vtt（scene_timing.py）を書く。
+文ごとの MP3 の実際の長さから求めた字幕の開始・終了時刻と、画像の
+切り替え時刻。プレイヤーは文字数からの見積もりの代わりにこれを使う。
+
+キャッシュ（asset_cache）:
+  シーン  前処理後のテキスト + VOICE_ID + 形式 のキー。変わっていなければ API を呼ばない
+  文      同じく文ごとのキーで .cache/assets/objects に保存。1文だけ直した
+          シーンはその文だけ合成し、残りはキャッシュからつなぎ直す
 """
 
-import json
+import argparse
 import os
+import re
 import sys
+import threading
 import time
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import mp3_frames
+import scene_timing
+import telemetry
+from asset_cache import cache_key, get_cache
+from atomic_io import atomic_writer
+from fish_audio import get_client
+from job_runner import Job, JobRunner, report
 
 # text_preprocessor.py をインポート
 sys.path.insert(
@@ -26,8 +57,9 @@ sys.path.insert(
 )
 from text_preprocessor import JapaneseTextPreprocessor
 
-FISH_API_URL = "https://api.fish.audio/v1/tts"
+MODEL = "fish-audio"
 VOICE_ID = "d4c86c697b3e4fc090cf056f17530b2a"
+AUDIO_FORMAT = "mp3"
 OUTPUT_DIR = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
     "public",
@@ -59,36 +91,146 @@ SCENES = [
 ]
 
 
-def generate_audio(scene_id, text, preprocessor, api_key):
-    """1シーンの音声を生成"""
-    output_file = os.path.join(OUTPUT_DIR, f"{scene_id}.mp3")
+_SENTENCE_END = re.compile(r"(?<=[。？！?!])")
 
-    # text_preprocessor で前処理（数字読み + 固有名詞変換）
-    processed = preprocessor.preprocess(text)
+# シーン → 最初の音声が届くまでの秒数、文キャッシュの件数（サマリー用）
+_first_audio = {}
+_sentence_counts = {"synthesized": 0, "reused": 0}
+_stats_lock = threading.Lock()
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    data = json.dumps({
-        "text": processed,
-        "reference_id": VOICE_ID,
-        "format": "mp3",
-    }).encode()
 
-    req = urllib.request.Request(FISH_API_URL, data=data, headers=headers)
-    with urllib.request.urlopen(req, timeout=120) as resp:
-        audio_data = resp.read()
+def audio_key(text):
+    """前処理後のテキスト（シーン全体または1文）の音声キャッシュキー"""
+    return cache_key(MODEL, text, voice=VOICE_ID, format=AUDIO_FORMAT)
 
-    with open(output_file, "wb") as f:
-        f.write(audio_data)
 
-    return len(audio_data)
+def split_sentences(text):
+    """文末（。？！）で区切った文のリスト（区切り文字は文に含める）"""
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
 
 
-def main():
-    import argparse
+def _note_first_audio(scene_id, seconds):
+    with _stats_lock:
+        _first_audio[scene_id] = seconds
+
+
+def _count_sentence(kind):
+    with _stats_lock:
+        _sentence_counts[kind] += 1
+
+
+def synthesize_chunked(scene_id, processed, output_file, client, workers=4, force=False):
+    """文ごとに並行合成し、MP3 フレーム単位でつないで output_file へ書く
 
+    キャッシュにある文は合成せずに使う（force=True なら全文を合成し直す）。
+    Returns: 文ごとの音声の秒数
+    """
+    sentences = split_sentences(processed)
+    cache = get_cache()
+    ext = f".{AUDIO_FORMAT}"
+    started = time.monotonic()
+
+    def synthesize(index):
+        key = audio_key(sentences[index])
+        data = None if force else cache.load_object(key, ext)
+        if data is not None:
+            _count_sentence("reused")
+        else:
+            data = client.synthesize(sentences[index], VOICE_ID, format=AUDIO_FORMAT)
+            cache.save_object(key, data, ext)
+            _count_sentence("synthesized")
+        if index == 0:
+            _note_first_audio(scene_id, time.monotonic() - started)
+        return data
+
+    report("tts", f"{len(sentences)} sentences")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        parts = list(pool.map(synthesize, range(len(sentences))))
+
+    report("write")
+    audio_data = mp3_frames.concat(parts)
+    with telemetry.span("write", bytes=len(audio_data), sentences=len(sentences)):
+        with atomic_writer(output_file) as f:
+            f.write(audio_data)
+    return [mp3_frames.duration(part) for part in parts]
+
+
+def cached_sentence_durations(processed):
+    """文キャッシュから文ごとの秒数を求める（1文でも欠けていれば None）"""
+    cache = get_cache()
+    durations = []
+    for sentence in split_sentences(processed):
+        data = cache.load_object(audio_key(sentence), f".{AUDIO_FORMAT}")
+        if data is None:
+            return None
+        durations.append(mp3_frames.duration(data))
+    return durations
+
+
+def write_timing(scene_id, text, processed, output_file, key, durations=None):
+    """字幕・画像切り替えのタイミングを書き出す（durations がなければ文字数で按分）"""
+    with telemetry.span("timing"):
+        timing = scene_timing.build(scene_id, output_file, split_sentences(text), split_sentences(processed),
+                                    durations, key=key)
+        scene_timing.write(output_file, timing)
+    return timing
+
+
+def generate_audio(scene_id, processed, client=None, whole_scene=False, chunk_workers=4, force=False,
+                   text=None):
+    """1シーンの音声とタイミングを生成（processed は前処理済み、text は字幕に出す元のテキスト）
+
+    Returns: "ok" | "skip"
+    """
+    output_file = os.path.join(OUTPUT_DIR, f"{scene_id}.mp3")
+    text = text or processed
+    key = audio_key(processed)
+    hit = get_cache().lookup(output_file, key, model=MODEL, force=force)
+    if hit:
+        # 音声がそのままでも、タイミングがない・古ければ書き出す
+        if not scene_timing.current(output_file, key):
+            # 1シーン1リクエストで合成した音声は文キャッシュとつなぎ目が合わない
+            entry = get_cache().entry(output_file) or {}
+            durations = None if entry.get("whole_scene") else cached_sentence_durations(processed)
+            write_timing(scene_id, text, processed, output_file, key, durations)
+        print(f"  SKIP: {scene_id} ({hit})", flush=True)
+        return "skip"
+
+    client = client or get_client()
+    durations = None
+    if whole_scene:
+        report("tts")
+        _, first_chunk = client.synthesize_to(processed, VOICE_ID, output_file, format=AUDIO_FORMAT)
+        _note_first_audio(scene_id, first_chunk)
+    else:
+        durations = synthesize_chunked(scene_id, processed, output_file, client, chunk_workers, force)
+    get_cache().store(key, output_file, model=MODEL, voice=VOICE_ID, whole_scene=whole_scene)
+    report("timing")
+    write_timing(scene_id, text, processed, output_file, key, durations)
+    return "ok"
+
+
+def print_audio_summary(jobs, wall_time):
+    """シーンごとのレイテンシと、壁時計1秒あたりに生成した音声の秒数"""
+    generated = 0.0
+    print("\n  scene                latency  first audio    audio", flush=True)
+    for job in jobs:
+        if job.result == "skip":
+            continue
+        path = os.path.join(OUTPUT_DIR, f"{job.name}.mp3")
+        seconds = mp3_frames.duration(path) if job.result == "ok" else 0.0
+        generated += seconds
+        first = _first_audio.get(job.name)
+        first = f"{first:10.1f}s" if first is not None else f"{'-':>11}"
+        print(f"  {job.name:<20} {job.elapsed:6.1f}s  {first}  {seconds:6.1f}s  {job.result}", flush=True)
+    rate = generated / wall_time if wall_time else 0.0
+    print(f"  Audio: {generated:.1f}s generated in {wall_time:.1f}s wall ({rate:.1f} audio-s/s)", flush=True)
+    if any(_sentence_counts.values()):
+        print(f"  Sentences: {_sentence_counts['synthesized']} synthesized, "
+              f"{_sentence_counts['reused']} reused from cache", flush=True)
+
+
+def main():
     parser = argparse.ArgumentParser(
         description="全20シーンのTTS音声を再生成"
     )
@@ -100,14 +242,24 @@ def main():
         "--scene", type=str,
         help="指定シーンのみ生成（例: s01-hook）"
     )
+    parser.add_argument(
+        "--concurrency", "-j", type=int, default=4,
+        help="同時に合成するシーン数 (default: 4、レートは FISH_RATE_PER_MINUTE)"
+    )
+    parser.add_argument(
+        "--whole-scene", action="store_true",
+        help="文に分けず1シーン1リクエストで合成（シーン単位のキャッシュのみ）"
+    )
+    parser.add_argument(
+        "--chunk-workers", type=int, default=4,
+        help="1シーン内で同時に合成する文の数 (default: 4)"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="シーン・文のキャッシュを使わず作り直す"
+    )
     args = parser.parse_args()
 
-    api_key = os.environ.get("FISH_AUDIO_API_KEY")
-    if not api_key and not args.dry_run:
-        print("ERROR: FISH_AUDIO_API_KEY environment variable not set")
-        print("  export FISH_AUDIO_API_KEY='your-api-key'")
-        sys.exit(1)
-
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     preprocessor = JapaneseTextPreprocessor()
 
@@ -118,41 +270,39 @@ def main():
             print(f"ERROR: Scene '{args.scene}' not found")
             sys.exit(1)
 
-    total = len(scenes)
-    success = 0
-    fail = 0
+    # 前処理はシーンごとに1回だけ
+    processed = [(scene_id, text, preprocessor.preprocess(text)) for scene_id, text in scenes]
+    total = len(processed)
 
     mode = "DRY-RUN" if args.dry_run else "GENERATE"
     print(f"=== Fish Audio TTS {mode} ({total} scenes) ===")
     print(f"Voice ID: {VOICE_ID}")
     print(f"Output: {OUTPUT_DIR}\n")
 
-    for i, (scene_id, text) in enumerate(scenes, 1):
-        print(f"[{i}/{total}] {scene_id}")
-        processed = preprocessor.preprocess(text)
-
-        if args.dry_run:
+    if args.dry_run:
+        for i, (scene_id, text, processed_text) in enumerate(processed, 1):
+            print(f"[{i}/{total}] {scene_id}")
             print(f"  Original: {text[:60]}...")
-            print(f"  Processed: {processed[:60]}...")
-            success += 1
-            continue
+            print(f"  Processed: {processed_text[:60]}...")
+        print(f"\n=== Done ===")
+        print(f"Success: {total}/{total}")
+        return
 
-        try:
-            size = generate_audio(scene_id, text, preprocessor, api_key)
-            print(f"  OK: {size} bytes", flush=True)
-            success += 1
-        except Exception as e:
-            print(f"  ERROR: {e}", flush=True)
-            fail += 1
-
-        # Small delay to avoid rate limiting
-        if i < total:
-            time.sleep(1)
-
-    print(f"\n=== Done ===")
-    print(f"Success: {success}/{total}")
-    if fail > 0:
-        print(f"Failed: {fail}/{total}")
+    telemetry.start_run("generate-audio")
+    client = get_client()
+    runner = JobRunner(concurrency=args.concurrency, label="Fish Audio TTS")
+    jobs = runner.run(
+        Job(scene_id, generate_audio, scene_id, processed_text, client,
+            whole_scene=args.whole_scene, chunk_workers=args.chunk_workers, force=args.force, text=text)
+        for scene_id, text, processed_text in processed
+    )
+    runner.print_summary()
+    print_audio_summary(jobs, runner.wall_time)
+    if client.requests:
+        client.print_stats()
+    telemetry.finish_run()
+    if set(runner.counts()) - {"ok", "skip"}:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 """fal.ai Flux Pro - imageCount > 3 のシーン用追加画像生成 (11枚)"""
 
-import json
+import argparse
 import os
-import subprocess
 import sys
-import time
-import urllib.request
 
-FAL_KEY = os.environ.get("FAL_KEY", "fc376a81-a3e6-4e6d-aa14-5ed2b14e40fd:4d5a982f1a579818e1dc87822964da4a")
-OUTPUT_DIR = "/Users/matsumototoshihiko/Desktop/dev/2026kakumei/interactive-vsl-v2/vsl-player/public/images/scenes"
+import telemetry
+from asset_cache import cache_key, get_cache
+from fal_client import IMAGE_POLL, JobTimeout, get_client
+from image_pipeline import get_pool
+
+OUTPUT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "public", "images", "scenes"
+)
+MODEL = "fal-ai/flux-pro/v1.1"
+IMAGE_SIZE = {"width": 1080, "height": 1920}
 MANGA_STYLE = "dramatic Japanese manga illustration style, bold black ink outlines, cel-shading, screentone halftone textures, dynamic speed lines, high contrast shadows, vibrant saturated colors, emotional intensity, professional manga art quality"
 
 # Only scenes that need _04 or _05 (imageCount > 3)
@@ -45,31 +51,26 @@ EXTRA_IMAGES = [
 ]
 
 
-def fal_request(method, url, data=None):
-    """fal.ai APIへのHTTPリクエスト"""
-    headers = {
-        "Authorization": f"Key {FAL_KEY}",
-        "Content-Type": "application/json",
-    }
-    req = urllib.request.Request(url, headers=headers, method=method)
-    if data:
-        req.data = json.dumps(data).encode()
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read())
+def image_key(prompt):
+    """generate-images.py と同じキー → 同一プロンプトは生成済み成果物を共有する"""
+    return cache_key(MODEL, prompt, seed=None, resample="lanczos", **IMAGE_SIZE)
 
 
-def generate_image(scene_id, suffix, prompt):
+def generate_image(scene_id, suffix, prompt, force=False):
     """1枚の画像を生成してダウンロード"""
+    client = get_client()
     output_file = os.path.join(OUTPUT_DIR, f"{scene_id}_{suffix}.png")
-    if os.path.exists(output_file):
-        print(f"  SKIP: {scene_id}_{suffix} (exists)", flush=True)
+    key = image_key(prompt)
+    hit = get_cache().lookup(output_file, key, model=MODEL, force=force)
+    if hit:
+        print(f"  SKIP: {scene_id}_{suffix} ({hit})", flush=True)
         return True
 
     # Submit
     try:
-        resp = fal_request("POST", "https://queue.fal.run/fal-ai/flux-pro/v1.1", {
+        resp = client.submit(MODEL, {
             "prompt": prompt,
-            "image_size": {"width": 1080, "height": 1920},
+            "image_size": IMAGE_SIZE,
             "num_images": 1,
         })
     except Exception as e:
@@ -81,39 +82,24 @@ def generate_image(scene_id, suffix, prompt):
         print(f"  ERROR: no request_id for {scene_id}_{suffix}", flush=True)
         return False
 
-    # Poll
-    for _ in range(60):
-        time.sleep(3)
-        try:
-            status_resp = fal_request("GET",
-                f"https://queue.fal.run/fal-ai/flux-pro/requests/{request_id}/status")
-            if status_resp.get("status") == "COMPLETED":
-                break
-        except Exception:
-            pass
-    else:
-        print(f"  TIMEOUT: {scene_id}_{suffix}", flush=True)
-        return False
-
-    # Download
+    # Wait (adaptive polling / stream / webhook)
     try:
-        result = fal_request("GET",
-            f"https://queue.fal.run/fal-ai/flux-pro/requests/{request_id}")
+        result = client.wait_result("fal-ai/flux-pro", request_id, IMAGE_POLL)
         image_url = result["images"][0]["url"]
+    except JobTimeout:
+        print(f"  TIMEOUT: {scene_id}_{suffix}", flush=True)
+        return False
     except Exception as e:
         print(f"  ERROR result {scene_id}_{suffix}: {e}", flush=True)
         return False
 
-    tmp_file = f"/tmp/fal_{scene_id}_{suffix}.jpg"
+    # Download → プロセス内で 1080x1920 にリサイズして最終 PNG を原子的に書き込む
     try:
-        urllib.request.urlretrieve(image_url, tmp_file)
-        # Resize to exact 1080x1920 using sips
-        subprocess.run(
-            ["sips", "-z", "1920", "1080", tmp_file, "--out", output_file],
-            capture_output=True, check=True,
-        )
-        os.remove(tmp_file)
-        size = os.path.getsize(output_file)
+        data = client.fetch(image_url, expected_size=result["images"][0].get("file_size"))
+        with telemetry.span("resize") as span:
+            size = get_pool().resize(data, output_file)
+            span.set(bytes=size)
+        get_cache().store(key, output_file, model=MODEL, seed=result.get("seed"))
         print(f"  OK: {scene_id}_{suffix} ({size:,} bytes)", flush=True)
         return True
     except Exception as e:
@@ -122,6 +108,10 @@ def generate_image(scene_id, suffix, prompt):
 
 
 def main():
+    parser = argparse.ArgumentParser(description="fal.ai Flux Pro 追加画像生成 (imageCount > 3 のシーン用)")
+    parser.add_argument("--force", action="store_true", help="キャッシュが新しくても作り直す")
+    args = parser.parse_args()
+
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     total = len(EXTRA_IMAGES)
@@ -131,9 +121,13 @@ def main():
     print(f"=== fal.ai Flux Pro 追加画像生成 ===", flush=True)
     print(f"Total: {total} images (imageCount > 3 のシーン用)\n", flush=True)
 
+    telemetry.start_run("generate-extra-images")
     for i, (scene_id, suffix, prompt) in enumerate(EXTRA_IMAGES, 1):
         print(f"[{i}/{total}] {scene_id}_{suffix}", flush=True)
-        if generate_image(scene_id, suffix, prompt):
+        with telemetry.item(f"{scene_id}_{suffix}") as span:
+            ok = generate_image(scene_id, suffix, prompt, force=args.force)
+            span.set(result="ok" if ok else "fail")
+        if ok:
             success += 1
         else:
             fail += 1
@@ -142,6 +136,8 @@ def main():
     print(f"成功: {success}/{total}", flush=True)
     if fail > 0:
         print(f"失敗: {fail}/{total}", flush=True)
+    get_client().print_stats()
+    telemetry.finish_run()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 """fal.ai Flux Pro で9:16漫画風画像を一括生成"""
 
-import json
+import argparse
 import os
-import subprocess
-import sys
-import time
-import urllib.request
 
-FAL_KEY = "fc376a81-a3e6-4e6d-aa14-5ed2b14e40fd:4d5a982f1a579818e1dc87822964da4a"
-OUTPUT_DIR = "/Users/matsumototoshihiko/Desktop/dev/2026kakumei/interactive-vsl-v2/vsl-player/public/images/scenes"
+import telemetry
+from asset_cache import cache_key, get_cache
+from fal_client import IMAGE_POLL, JobTimeout, get_client
+from image_pipeline import RESAMPLE_FILTERS, get_pool
+from job_runner import Job, JobRunner, report
+
+OUTPUT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "public", "images", "scenes"
+)
+MODEL = "fal-ai/flux-pro/v1.1"
+IMAGE_SIZE = {"width": 1080, "height": 1920}
 MANGA_STYLE = "dramatic Japanese manga illustration style, bold black ink outlines, cel-shading, screentone halftone textures, dynamic speed lines, high contrast shadows, vibrant saturated colors, emotional intensity, professional manga art quality"
 
 SCENES = [
@@ -115,117 +121,98 @@ SCENES = [
 ]
 
 
-def fal_request(method, url, data=None):
-    """fal.ai APIへのHTTPリクエスト"""
-    headers = {
-        "Authorization": f"Key {FAL_KEY}",
-        "Content-Type": "application/json",
-    }
-    req = urllib.request.Request(url, headers=headers, method=method)
-    if data:
-        req.data = json.dumps(data).encode()
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read())
+def image_key(prompt, resample="lanczos"):
+    """生成キャッシュ / ビルドグラフ共通のキー"""
+    return cache_key(MODEL, prompt, seed=None, resample=resample, **IMAGE_SIZE)
 
 
-def generate_image(scene_id, suffix, prompt):
-    """1枚の画像を生成してダウンロード"""
+def _report_status(status, elapsed):
+    report("polling", f"{status.get('status')} {elapsed:.0f}s")
+
+
+def generate_image(scene_id, suffix, prompt, resample="lanczos", force=False):
+    """1枚の画像を生成してダウンロード
+
+    Returns: "ok" | "skip" | "fail" | "timeout"
+    """
+    client = get_client()
     output_file = os.path.join(OUTPUT_DIR, f"{scene_id}_{suffix}.png")
-    if os.path.exists(output_file):
-        print(f"  SKIP: {scene_id}_{suffix} (exists)")
-        return True
+    key = image_key(prompt, resample)
+    hit = get_cache().lookup(output_file, key, model=MODEL, force=force)
+    if hit:
+        print(f"  SKIP: {scene_id}_{suffix} ({hit})", flush=True)
+        return "skip"
 
     # Submit
+    report("submit")
     try:
-        resp = fal_request("POST", "https://queue.fal.run/fal-ai/flux-pro/v1.1", {
+        resp = client.submit(MODEL, {
             "prompt": prompt,
-            "image_size": {"width": 1080, "height": 1920},
+            "image_size": IMAGE_SIZE,
             "num_images": 1,
         })
     except Exception as e:
-        print(f"  ERROR submit {scene_id}_{suffix}: {e}")
-        return False
+        print(f"  ERROR submit {scene_id}_{suffix}: {e}", flush=True)
+        return "fail"
 
     request_id = resp.get("request_id")
     if not request_id:
-        print(f"  ERROR: no request_id for {scene_id}_{suffix}")
-        return False
-
-    # Poll
-    for _ in range(60):
-        time.sleep(3)
-        try:
-            status_resp = fal_request("GET",
-                f"https://queue.fal.run/fal-ai/flux-pro/requests/{request_id}/status")
-            if status_resp.get("status") == "COMPLETED":
-                break
-        except Exception:
-            pass
-    else:
-        print(f"  TIMEOUT: {scene_id}_{suffix}")
-        return False
-
-    # Download
+        print(f"  ERROR: no request_id for {scene_id}_{suffix}", flush=True)
+        return "fail"
+
+    # Wait (adaptive polling / stream / webhook)
     try:
-        result = fal_request("GET",
-            f"https://queue.fal.run/fal-ai/flux-pro/requests/{request_id}")
+        result = client.wait_result("fal-ai/flux-pro", request_id, IMAGE_POLL, on_status=_report_status)
         image_url = result["images"][0]["url"]
+    except JobTimeout:
+        print(f"  TIMEOUT: {scene_id}_{suffix}", flush=True)
+        return "timeout"
     except Exception as e:
-        print(f"  ERROR result {scene_id}_{suffix}: {e}")
-        return False
+        print(f"  ERROR result {scene_id}_{suffix}: {e}", flush=True)
+        return "fail"
 
-    tmp_file = f"/tmp/fal_{scene_id}_{suffix}.jpg"
+    report("download")
+    # Download → プロセス内で 1080x1920 にリサイズして最終 PNG を原子的に書き込む
     try:
-        urllib.request.urlretrieve(image_url, tmp_file)
-        # Resize to exact 1080x1920 using sips
-        subprocess.run(
-            ["sips", "-z", "1920", "1080", tmp_file, "--out", output_file],
-            capture_output=True, check=True,
-        )
-        os.remove(tmp_file)
-        print(f"  OK: {scene_id}_{suffix}")
-        return True
+        data = client.fetch(image_url, expected_size=result["images"][0].get("file_size"))
+        report("resize")
+        with telemetry.span("resize") as span:
+            span.set(bytes=get_pool().resize(data, output_file, resample=resample))
+        get_cache().store(key, output_file, model=MODEL, seed=result.get("seed"))
+        return "ok"
     except Exception as e:
-        print(f"  ERROR download {scene_id}_{suffix}: {e}")
-        return False
+        print(f"  ERROR download {scene_id}_{suffix}: {e}", flush=True)
+        return "fail"
 
 
 def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    parser = argparse.ArgumentParser(description="fal.ai Flux Pro 画像一括生成")
+    parser.add_argument("--concurrency", "-j", type=int, default=8,
+                        help="同時に投入する fal.ai ジョブ数 (default: 8)")
+    parser.add_argument("--scene", help="指定シーンのみ生成（例: s01-hook）")
+    parser.add_argument("--resample", choices=sorted(RESAMPLE_FILTERS), default="lanczos",
+                        help="リサイズフィルタ (default: lanczos)")
+    parser.add_argument("--force", action="store_true", help="キャッシュが新しくても作り直す")
+    args = parser.parse_args()
 
-    # Support --batch N argument for parallel execution
-    batch = None
-    if len(sys.argv) > 2 and sys.argv[1] == "--batch":
-        batch = int(sys.argv[2])
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     scenes = SCENES
-    if batch is not None:
-        chunk_size = len(SCENES) // 3
-        if batch == 1:
-            scenes = SCENES[:chunk_size]
-        elif batch == 2:
-            scenes = SCENES[chunk_size:chunk_size * 2]
-        elif batch == 3:
-            scenes = SCENES[chunk_size * 2:]
-
-    total = len(scenes)
-    success = 0
-    fail = 0
-
-    label = f" (batch {batch})" if batch else ""
-    print(f"=== fal.ai Flux Pro 画像生成{label} ===")
-    print(f"Total: {total} images\n")
-
-    for i, (scene_id, suffix, prompt) in enumerate(scenes, 1):
-        print(f"[{i}/{total}] {scene_id}_{suffix}")
-        if generate_image(scene_id, suffix, prompt):
-            success += 1
-        else:
-            fail += 1
-
-    print(f"\n=== 完了{label} ===")
-    print(f"成功: {success}/{total}")
-    print(f"失敗: {fail}/{total}")
+    if args.scene:
+        scenes = [item for item in SCENES if item[0] == args.scene]
+
+    print(f"=== fal.ai Flux Pro 画像生成 ===", flush=True)
+    print(f"Total: {len(scenes)} images (concurrency {args.concurrency})\n", flush=True)
+
+    telemetry.start_run("generate-images")
+    runner = JobRunner(concurrency=args.concurrency, label="fal.ai Flux Pro")
+    runner.run(
+        Job(f"{scene_id}_{suffix}", generate_image, scene_id, suffix, prompt, resample=args.resample, force=args.force)
+        for scene_id, suffix, prompt in scenes
+    )
+    runner.print_summary()
+    get_client().print_stats()
+    telemetry.finish_run()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,33 @@
 #!/usr/bin/env python3
-"""fal.ai MiniMax Hailuo I2V で動画クリップを生成"""
+"""fal.ai MiniMax Hailuo I2V で動画クリップを生成
 
-import json
+入力画像の渡し方 (--image-source):
+  upload    ローカルの {scene}_01.png を fal storage へアップロード（既定）
+  data-uri  ローカル画像を data URI で直接埋め込む
+  url       デプロイ済みの Vercel 上の画像 URL（従来の挙動）
+
+upload / data-uri はデプロイを待たずに画像 → 動画を続けて生成できる。
+ローカル画像がなければ url にフォールバックする。
+"""
+
+import argparse
 import os
-import sys
-import time
-import urllib.request
 
-FAL_KEY = "fc376a81-a3e6-4e6d-aa14-5ed2b14e40fd:4d5a982f1a579818e1dc87822964da4a"
-OUTPUT_DIR = "/Users/matsumototoshihiko/Desktop/dev/2026kakumei/interactive-vsl-v2/vsl-player/public/video/scenes"
+import telemetry
+from asset_cache import cache_key, get_cache
+from atomic_io import sha256_file
+from fal_client import VIDEO_POLL, JobFailed, JobTimeout, data_uri, get_client
+
+OUTPUT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "public", "video", "scenes"
+)
 IMAGE_BASE_URL = "https://vsl-player.vercel.app/images/scenes"
+IMAGE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "public", "images", "scenes"
+)
+IMAGE_SOURCES = ("upload", "data-uri", "url")
 MODEL = "fal-ai/minimax-video/image-to-video"
 # fal.ai queue API: subpath is used for submit only, NOT for status/result
 MODEL_BASE = "fal-ai/minimax-video"
@@ -32,28 +50,49 @@ VIDEO_SCENES = [
 ]
 
 
-def fal_request(method, url, data=None):
-    headers = {
-        "Authorization": f"Key {FAL_KEY}",
-        "Content-Type": "application/json",
-    }
-    req = urllib.request.Request(url, headers=headers, method=method)
-    if data:
-        req.data = json.dumps(data).encode()
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read())
+def source_image_path(scene_id):
+    """I2V の入力にするローカル画像"""
+    return os.path.join(IMAGE_DIR, f"{scene_id}_01.png")
+
+
+def video_key(scene_id, prompt):
+    """入力画像も生成パラメータ: ローカルの元画像が変われば動画も作り直す"""
+    source_image = source_image_path(scene_id)
+    if os.path.exists(source_image):
+        image_ref = sha256_file(source_image)
+    else:
+        image_ref = f"{IMAGE_BASE_URL}/{scene_id}_01.png"
+    return cache_key(MODEL, prompt, image=image_ref)
 
 
-def generate_video(scene_id, prompt):
+def resolve_image_url(scene_id, image_source="upload"):
+    """I2V に渡す image_url を作る"""
+    source_image = source_image_path(scene_id)
+    if image_source == "url" or not os.path.exists(source_image):
+        return f"{IMAGE_BASE_URL}/{scene_id}_01.png"
+    if image_source == "data-uri":
+        return data_uri(source_image)
+    return get_client().upload_file(source_image)
+
+
+def generate_video(scene_id, prompt, force=False, image_source="upload"):
+    client = get_client()
     output_file = os.path.join(OUTPUT_DIR, f"{scene_id}.mp4")
-    if os.path.exists(output_file):
-        print(f"  SKIP: {scene_id} (exists)", flush=True)
+
+    key = video_key(scene_id, prompt)
+    hit = get_cache().lookup(output_file, key, model=MODEL, force=force)
+    if hit:
+        print(f"  SKIP: {scene_id} ({hit})", flush=True)
         return True
 
-    image_url = f"{IMAGE_BASE_URL}/{scene_id}_01.png"
+    try:
+        image_url = resolve_image_url(scene_id, image_source)
+    except Exception as e:
+        print(f"  ERROR upload {scene_id}: {e}", flush=True)
+        return False
 
     try:
-        resp = fal_request("POST", f"https://queue.fal.run/{MODEL}", {
+        resp = client.submit(MODEL, {
             "prompt": prompt,
             "image_url": image_url,
         })
@@ -68,38 +107,33 @@ def generate_video(scene_id, prompt):
 
     print(f"  Submitted: {request_id}", flush=True)
 
-    # Poll (up to 10 minutes for video generation)
-    for attempt in range(200):
-        time.sleep(3)
-        try:
-            status_resp = fal_request("GET",
-                f"https://queue.fal.run/{MODEL_BASE}/requests/{request_id}/status")
-            status = status_resp.get("status", "UNKNOWN")
-            if status == "COMPLETED":
-                break
-            if status == "FAILED":
-                print(f"  FAILED: {scene_id}", flush=True)
-                return False
-            if attempt % 10 == 0:
-                print(f"  Polling {scene_id}: {status} ({attempt * 3}s)", flush=True)
-        except Exception:
-            pass
-    else:
-        print(f"  TIMEOUT: {scene_id}", flush=True)
-        return False
+    last_status = [None]
+
+    def on_status(status, elapsed):
+        if status.get("status") != last_status[0]:
+            last_status[0] = status.get("status")
+            print(f"  Polling {scene_id}: {last_status[0]} ({elapsed:.0f}s)", flush=True)
 
-    # Download
+    # Wait (adaptive polling / stream / webhook, up to 10 minutes)
     try:
-        result = fal_request("GET",
-            f"https://queue.fal.run/{MODEL_BASE}/requests/{request_id}")
-        video_url = result["video"]["url"]
+        result = client.wait_result(MODEL_BASE, request_id, VIDEO_POLL, on_status=on_status)
+        video = result["video"]
+    except JobTimeout:
+        print(f"  TIMEOUT: {scene_id}", flush=True)
+        return False
+    except JobFailed as e:
+        print(f"  FAILED: {scene_id} ({e})", flush=True)
+        return False
     except Exception as e:
         print(f"  ERROR result {scene_id}: {e}", flush=True)
         return False
 
     try:
-        urllib.request.urlretrieve(video_url, output_file)
-        file_size = os.path.getsize(output_file)
+        # .part へストリーミング保存（中断時は次回 Range で再開）→ 検証後に rename
+        file_size, _ = client.download(
+            video["url"], output_file, expected_size=video.get("file_size"), resume=True,
+        )
+        get_cache().store(key, output_file, model=MODEL)
         print(f"  OK: {scene_id} ({file_size} bytes)", flush=True)
         return True
     except Exception as e:
@@ -108,11 +142,16 @@ def generate_video(scene_id, prompt):
 
 
 def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    parser = argparse.ArgumentParser(description="fal.ai MiniMax I2V 動画生成")
+    parser.add_argument("--batch", type=int, choices=(1, 2), help="前半 / 後半のみ生成")
+    parser.add_argument("--scene", help="指定シーンのみ生成（例: s04b-gap）")
+    parser.add_argument("--image-source", choices=IMAGE_SOURCES, default="upload",
+                        help="入力画像の渡し方 (default: upload)")
+    parser.add_argument("--force", action="store_true", help="キャッシュが新しくても作り直す")
+    args = parser.parse_args()
+    batch = args.batch
 
-    batch = None
-    if len(sys.argv) > 2 and sys.argv[1] == "--batch":
-        batch = int(sys.argv[2])
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     scenes = VIDEO_SCENES
     if batch is not None:
@@ -121,6 +160,8 @@ def main():
             scenes = VIDEO_SCENES[:half]
         elif batch == 2:
             scenes = VIDEO_SCENES[half:]
+    if args.scene:
+        scenes = [item for item in scenes if item[0] == args.scene]
 
     total = len(scenes)
     success = 0
@@ -130,9 +171,13 @@ def main():
     print(f"=== fal.ai MiniMax I2V 動画生成{label} ===", flush=True)
     print(f"Total: {total} videos\n", flush=True)
 
+    telemetry.start_run("generate-videos")
     for i, (scene_id, prompt) in enumerate(scenes, 1):
         print(f"[{i}/{total}] {scene_id}", flush=True)
-        if generate_video(scene_id, prompt):
+        with telemetry.item(scene_id) as span:
+            ok = generate_video(scene_id, prompt, force=args.force, image_source=args.image_source)
+            span.set(result="ok" if ok else "fail")
+        if ok:
             success += 1
         else:
             fail += 1
@@ -140,6 +185,8 @@ def main():
     print(f"\n=== 完了{label} ===", flush=True)
     print(f"成功: {success}/{total}", flush=True)
     print(f"失敗: {fail}/{total}", flush=True)
+    get_client().print_stats()
+    telemetry.finish_run()
 
 
 if __name__ == "__main__":
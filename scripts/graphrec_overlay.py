@@ -7,15 +7,39 @@ Pillow で正確な日本語テキストをグラレコ風にオーバーレイ
 フォント検索・描画の基盤は anime-slide-generator から移植。
 グラレコ風の装飾（吹き出し背景、マーカー風下線）を新規追加。
 
+フォントはプロセス内で共有する: パス解決は style ごとに1回、
+FreeTypeFont は (style, size) ごとに LRU キャッシュし、文字送り幅も
+フォントごとにキャッシュする（サイズ調整・折り返しは足し算だけで済む）。
+
+レイアウトは文節（budoux があれば BudouX、なければ1文字）ごとの幅と
+カーニングの累積で線形に折り返し、テロップ領域の幅・高さの両方に収まる
+最大のフォントサイズを二分探索で決める。
+
+縁取りは各行のグリフマスクを1回だけラスタライズし、マスクの膨張
+（MaxFilter）で作る。effect で縁取り / 二重縁取り / ぼかし影を選べる。
+合成は吹き出しの外接矩形（ROI）だけで行い、全面の RGBA 変換はしない。
+
 対応OS: macOS, Windows, Linux
 """
 
+import functools
 import math
 import os
 import platform
+import re
+import threading
+import time
 import urllib.request
+from concurrent.futures import ProcessPoolExecutor
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+from image_pipeline import FRAME_SIZE, encode, load_frame
+
+try:
+    import budoux
+except ImportError:
+    budoux = None
 
 # ============================================
 # クロスプラットフォーム フォント設定
@@ -69,6 +93,33 @@ BUNDLED_FONT_URL = (
     "https://github.com/googlefonts/noto-cjk/raw/main/Sans/OTF/Japanese/NotoSansCJKjp-Bold.otf"
 )
 
+# (style, size) ごとに保持する FreeTypeFont の上限
+FONT_CACHE_SIZE = 64
+
+# 描画結果のバージョン。レイアウト・文字効果・フォント選択など出力が
+# 変わる修正をしたら上げる（テロップ入り画像のキャッシュキーに入る）
+RENDERER_VERSION = 1
+
+# テロップの文字効果
+#   outline  正方形の縁取り（旧 (2w+1)² ループと同じ形をマスク膨張で作る）
+#   stroke   Pillow の stroke_width（FreeType の丸い縁取り）
+#   thick    縁取りの外側にテーマ色の太い縁をもう1本
+#   shadow   縁取り + ぼかしたドロップシャドウ
+TEXT_EFFECTS = ("outline", "stroke", "thick", "shadow")
+OUTLINE_WIDTH = 3
+SHADOW_OFFSET = (4, 6)
+SHADOW_BLUR = 6
+SHADOW_COLOR = (0, 0, 0, 160)
+
+# テロップの最大行数（収まらなければ最小サイズで行数を増やす）
+TELOP_MAX_LINES = 2
+
+# budoux がないときの折り返し単位: 英数字の連続（と後続スペース）か1文字
+_FALLBACK_SEGMENT = re.compile(r"[!-~]+ *|.", re.S)
+
+# 行頭に置かない文字（1文字分はみ出しても前の行に付ける）
+NO_LINE_START = set("、。，．,.！？!?）」』】〕…ー～っゃゅょァィゥェォッャュョ")
+
 
 def _get_os_type():
     """OSタイプを取得"""
@@ -98,8 +149,9 @@ def _download_bundled_font():
         return None
 
 
+@functools.lru_cache(maxsize=None)
 def find_font(style="bold"):
-    """利用可能なフォントパスを検索"""
+    """利用可能なフォントパスを検索（style ごとに1回だけ探す）"""
     os_type = _get_os_type()
 
     font_map = {
@@ -124,8 +176,9 @@ def find_font(style="bold"):
     return None
 
 
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
 def get_font(style="bold", size=48):
-    """フォントを取得（クロスプラットフォーム対応）"""
+    """フォントを取得（クロスプラットフォーム対応・(style, size) ごとにキャッシュ）"""
     font_path = find_font(style)
 
     if font_path:
@@ -138,51 +191,247 @@ def get_font(style="bold", size=48):
     return ImageFont.load_default()
 
 
+class GlyphMetrics:
+    """フォント1つ分の文字送り幅・カーニング・行高キャッシュ"""
+
+    def __init__(self, font):
+        self.font = font
+        self._advances = {}
+        self._kerning = {}
+        if hasattr(font, "getmetrics"):
+            ascent, descent = font.getmetrics()
+        else:
+            ascent, descent = font.getbbox("Ag")[3], 0
+        self.line_height = ascent + descent
+
+    def advance(self, char):
+        width = self._advances.get(char)
+        if width is None:
+            width = self._advances[char] = self.font.getlength(char)
+        return width
+
+    def kern(self, left, right):
+        """left の直後に right を置いたときの補正量（ペアごとに1回だけ測る）"""
+        pair = left + right
+        value = self._kerning.get(pair)
+        if value is None:
+            value = self._kerning[pair] = (
+                self.font.getlength(pair) - self.advance(left) - self.advance(right)
+            )
+        return value
+
+    def width(self, text):
+        """文字送り幅 + カーニングの合計（textbbox で描画せずに行幅を見積もる）"""
+        total = 0.0
+        previous = None
+        for char in text:
+            total += self.advance(char)
+            if previous is not None:
+                total += self.kern(previous, char)
+            previous = char
+        return total
+
+
+_metrics_lock = threading.Lock()
+
+
+def font_metrics(font):
+    """font の GlyphMetrics（フォントオブジェクト自身に持たせ、フォントと一緒に解放する）"""
+    with _metrics_lock:
+        metrics = getattr(font, "_glyph_metrics", None)
+        if metrics is None:
+            metrics = font._glyph_metrics = GlyphMetrics(font)
+        return metrics
+
+
 # ============================================
 # テキスト描画ユーティリティ
 # ============================================
 
 def draw_text_with_outline(draw, position, text, font, fill_color, outline_color, outline_width):
-    """アウトライン付きテキストを描画"""
-    x, y = position
+    """アウトライン付きテキストを描画（stroke_width で1回のラスタライズ）"""
+    draw.text(
+        position, text, font=font, fill=fill_color,
+        stroke_width=outline_width, stroke_fill=outline_color,
+    )
 
-    for dx in range(-outline_width, outline_width + 1):
-        for dy in range(-outline_width, outline_width + 1):
-            if dx != 0 or dy != 0:
-                draw.text((x + dx, y + dy), text, font=font, fill=outline_color)
 
-    draw.text((x, y), text, font=font, fill=fill_color)
+def _glyph_mask(text, font, margin):
+    """行のグリフマスクを1回だけ描く（margin は縁取り・影の余白）
 
+    Returns: (mask, (dx, dy)) — dx, dy は描画位置からマスク左上までのずれ
+    """
+    left, top, right, bottom = font.getbbox(text)
+    mask = Image.new("L", (right - left + margin * 2, bottom - top + margin * 2), 0)
+    ImageDraw.Draw(mask).text((margin - left, margin - top), text, font=font, fill=255)
+    return mask, (left - margin, top - margin)
 
-def _auto_font_size(draw, text, max_width, style="bold", max_size=72, min_size=24):
-    """テキストが max_width に収まるようフォントサイズを自動調整"""
-    for size in range(max_size, min_size - 1, -2):
-        font = get_font(style, size)
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        if text_width <= max_width:
-            return font, size
-    return get_font(style, min_size), min_size
 
+def _dilate(mask, radius):
+    """正方形カーネルで radius 画素ふくらませる（3x3 の MaxFilter を radius 回）"""
+    for _ in range(radius):
+        mask = mask.filter(ImageFilter.MaxFilter(3))
+    return mask
 
-def _wrap_text(draw, text, font, max_width):
-    """テキストを max_width に収まるよう改行する"""
-    lines = []
-    current_line = ""
-
-    for char in text:
-        test_line = current_line + char
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        if bbox[2] - bbox[0] > max_width and current_line:
-            lines.append(current_line)
-            current_line = char
-        else:
-            current_line = test_line
 
-    if current_line:
-        lines.append(current_line)
+def _colorize(mask, color):
+    """マスクを不透明度とした単色 RGBA レイヤーにする"""
+    layer = Image.new("RGBA", mask.size, tuple(color[:3]) + (0,))
+    alpha = color[3] if len(color) > 3 else 255
+    if alpha < 255:
+        mask = mask.point(lambda v: v * alpha // 255)
+    layer.putalpha(mask)
+    return layer
+
+
+def render_text_layer(text, font, fill_color, outline_color, outline_width=OUTLINE_WIDTH,
+                      effect="outline", accent_color=(255, 255, 255, 255)):
+    """1行分の文字レイヤーを作る（グリフのラスタライズは1回だけ）
+
+    Returns: (RGBA レイヤー, (dx, dy)) — draw.text と同じ位置に置くためのずれ
+    """
+    if effect not in TEXT_EFFECTS:
+        raise ValueError(f"unknown text effect: {effect}")
+    outer = outline_width * 2 if effect == "thick" else outline_width
+    margin = outer + 1
+    if effect == "shadow":
+        margin += SHADOW_BLUR * 2 + max(SHADOW_OFFSET)
+    mask, offset = _glyph_mask(text, font, margin)
+    outline_mask = _dilate(mask, outline_width)
+
+    layer = Image.new("RGBA", mask.size, (0, 0, 0, 0))
+    if effect == "shadow":
+        shadow = ImageChops.offset(outline_mask, *SHADOW_OFFSET)
+        layer.alpha_composite(_colorize(shadow.filter(ImageFilter.GaussianBlur(SHADOW_BLUR)), SHADOW_COLOR))
+    elif effect == "thick":
+        layer.alpha_composite(_colorize(_dilate(outline_mask, outer - outline_width), accent_color))
+    layer.alpha_composite(_colorize(outline_mask, outline_color))
+    layer.alpha_composite(_colorize(mask, fill_color))
+    return layer, offset
+
+
+def _draw_line(overlay, draw, position, text, font, fill_color, outline_color, effect, accent_color):
+    """テロップ1行を overlay に描く"""
+    if effect == "stroke":
+        draw_text_with_outline(draw, position, text, font, fill_color, outline_color, OUTLINE_WIDTH)
+        return
+    layer, (dx, dy) = render_text_layer(
+        text, font, fill_color, outline_color, OUTLINE_WIDTH, effect, accent_color,
+    )
+    x, y = position[0] + dx, position[1] + dy
+    overlay.alpha_composite(layer, dest=(max(x, 0), max(y, 0)), source=(max(-x, 0), max(-y, 0)))
+
+
+@functools.lru_cache(maxsize=1)
+def _phrase_parser():
+    return budoux.load_default_japanese_parser() if budoux is not None else None
+
+
+@functools.lru_cache(maxsize=1024)
+def _segments(text):
+    """折り返し単位（BudouX の文節、なければ1文字ずつ）"""
+    parser = _phrase_parser()
+    if parser is None:
+        return tuple(_FALLBACK_SEGMENT.findall(text))
+    return tuple(parser.parse(text))
+
 
-    return lines
+def wrap_text(text, font, max_width):
+    """テキストを max_width に収まるよう改行する（文節ごとに1回測るだけの線形処理）
+
+    Returns: (lines, line_widths)
+    """
+    metrics = font_metrics(font)
+    lines = []
+    widths = []
+    line = ""
+    width = 0.0
+
+    for segment in _segments(text):
+        segment_width = metrics.width(segment)
+        # 1文節で1行を超える場合だけ文字単位に分ける
+        pieces = [(segment, segment_width)]
+        if segment_width > max_width and len(segment) > 1:
+            pieces = [(char, metrics.advance(char)) for char in segment]
+        for piece, piece_width in pieces:
+            join = metrics.kern(line[-1], piece[0]) if line else 0.0
+            if line and width + join + piece_width > max_width and piece[0] not in NO_LINE_START:
+                _end_line(lines, widths, line, width, metrics)
+                line, width = piece, piece_width
+            else:
+                line += piece
+                width += join + piece_width
+
+    if line:
+        _end_line(lines, widths, line, width, metrics)
+    return lines, widths
+
+
+def _end_line(lines, widths, line, width, metrics):
+    trimmed = line.rstrip(" ")
+    if trimmed != line:
+        width = metrics.width(trimmed)
+    lines.append(trimmed)
+    widths.append(width)
+
+
+class TextLayout:
+    """fit_text() の結果"""
+
+    def __init__(self, font, size, lines, line_widths, line_height, line_spacing):
+        self.font = font
+        self.size = size
+        self.lines = lines
+        self.line_widths = line_widths
+        self.line_height = line_height
+        self.line_spacing = line_spacing
+
+    @property
+    def width(self):
+        return max(self.line_widths, default=0)
+
+    @property
+    def height(self):
+        count = len(self.lines)
+        return count * self.line_height + self.line_spacing * max(count - 1, 0)
+
+
+def layout_text(text, max_width, size, style="bold", spacing=0.3):
+    """size で折り返したレイアウト"""
+    font = get_font(style, size)
+    lines, widths = wrap_text(text, font, max_width)
+    return TextLayout(font, size, lines, widths, font_metrics(font).line_height, int(size * spacing))
+
+
+def fit_text(text, max_width, max_height, style="bold", max_size=64, min_size=28,
+             spacing=0.3, max_lines=None):
+    """幅・高さ（・行数）に収まる最大サイズを二分探索する
+
+    収まるサイズがなければ min_size のレイアウトを返す。
+    """
+    def fits(layout):
+        return (
+            layout.width <= max_width
+            and layout.height <= max_height
+            and (max_lines is None or len(layout.lines) <= max_lines)
+        )
+
+    # 多くのテロップは最大サイズで収まるので先に確認する
+    layout = layout_text(text, max_width, max_size, style, spacing)
+    if fits(layout):
+        return layout
+
+    best = None
+    low, high = min_size, max_size - 1
+    while low <= high:
+        size = (low + high) // 2
+        layout = layout_text(text, max_width, size, style, spacing)
+        if fits(layout):
+            best = layout
+            low = size + 1
+        else:
+            high = size - 1
+    return best or layout_text(text, max_width, min_size, style, spacing)
 
 
 # ============================================
@@ -223,55 +472,55 @@ def _draw_marker_underline(draw, x, y, width, color, thickness=6):
 # メインオーバーレイ関数
 # ============================================
 
-def overlay_graphrec_text(bg_path, output_path, text, theme=None):
-    """グラレコ風テキストオーバーレイを適用
+# 吹き出しの外側に描かれうる幅（縁取り・影・下線の波）
+ROI_MARGIN = OUTLINE_WIDTH * 2 + SHADOW_BLUR * 2 + max(SHADOW_OFFSET) + 8
+
+
+def composite_graphrec_overlay(img, text, theme=None, effect=None):
+    """RGB 画像の吹き出し周辺だけにグラレコ風テロップを合成する（img をその場で書き換える）
+
+    全面 RGBA 変換・全面オーバーレイの代わりに、吹き出しの外接矩形
+    （ROI）だけを切り出して合成し、貼り戻す。
 
     Args:
-        bg_path: テキストなし背景画像パス
-        output_path: 出力画像パス
+        img: 背景画像 (PIL.Image, RGB)
         text: オーバーレイするテキスト
         theme: カラーテーマ辞書 (None の場合はデフォルト)
+        effect: 文字効果 (TEXT_EFFECTS。None ならテーマの text_effect か outline)
 
     Returns:
-        output_path
+        合成した領域 (left, top, right, bottom)
     """
     from graphrec_config import COLOR_THEMES, DEFAULT_THEME
 
     if theme is None:
         theme = COLOR_THEMES[DEFAULT_THEME]
+    if effect is None:
+        effect = theme.get("text_effect", "outline")
 
-    img = Image.open(bg_path).convert("RGBA")
     img_width, img_height = img.size
 
-    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(overlay)
-
     # テキストエリア設定（下部 25% をテロップゾーンに）
     telop_zone_top = int(img_height * 0.75)
     telop_zone_height = img_height - telop_zone_top
     padding_x = 40
     max_text_width = img_width - (padding_x * 2)
+    bubble_padding_x = 30
+    bubble_padding_y = 20
 
-    # フォントサイズ自動調整
-    font, font_size = _auto_font_size(draw, text, max_text_width, "bold", max_size=64, min_size=28)
-
-    # テキスト折り返し
-    lines = _wrap_text(draw, text, font, max_text_width)
-
-    # 各行のサイズを計算
-    line_heights = []
-    line_widths = []
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font)
-        line_widths.append(bbox[2] - bbox[0])
-        line_heights.append(bbox[3] - bbox[1])
-
-    line_spacing = int(font_size * 0.3)
-    total_text_height = sum(line_heights) + line_spacing * (len(lines) - 1)
+    # 幅・高さに収まる最大サイズで折り返す
+    layout = fit_text(
+        text, max_text_width, telop_zone_height - bubble_padding_y * 2,
+        "bold", max_size=64, min_size=28, max_lines=TELOP_MAX_LINES,
+    )
+    font = layout.font
+    lines = layout.lines
+    line_widths = [math.ceil(w) for w in layout.line_widths]
+    line_heights = [layout.line_height] * len(lines)
+    line_spacing = layout.line_spacing
+    total_text_height = layout.height
 
     # 吹き出し風背景の描画
-    bubble_padding_x = 30
-    bubble_padding_y = 20
     max_line_width = max(line_widths) if line_widths else 0
 
     bubble_width = max_line_width + bubble_padding_x * 2
@@ -280,6 +529,20 @@ def overlay_graphrec_text(bg_path, output_path, text, theme=None):
     bubble_x = (img_width - bubble_width) // 2
     bubble_y = telop_zone_top + (telop_zone_height - bubble_height) // 2
 
+    # 吹き出しの外接矩形だけを切り出し、以降の座標は ROI 基準にする
+    roi = (
+        max(bubble_x - ROI_MARGIN, 0),
+        max(bubble_y - ROI_MARGIN, 0),
+        min(bubble_x + bubble_width + ROI_MARGIN, img_width),
+        min(bubble_y + bubble_height + ROI_MARGIN, img_height),
+    )
+    origin_x, origin_y = roi[:2]
+    region = img.crop(roi).convert("RGBA")
+    overlay = Image.new("RGBA", region.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    bubble_x -= origin_x
+    bubble_y -= origin_y
+
     # 吹き出し背景（半透明ダーク + テーマカラーボーダー）
     bg_color = (20, 20, 30, 210)
     border_color = theme.get("text_bg", (255, 107, 107, 255))
@@ -311,26 +574,105 @@ def overlay_graphrec_text(bg_path, output_path, text, theme=None):
 
     current_y = text_start_y
     for i, line in enumerate(lines):
-        line_x = (img_width - line_widths[i]) // 2
-        draw_text_with_outline(
-            draw,
-            (line_x, current_y),
-            line,
-            font,
-            fill_color=text_color,
-            outline_color=outline_color,
-            outline_width=3,
+        line_x = (img_width - line_widths[i]) // 2 - origin_x
+        _draw_line(
+            overlay, draw, (line_x, current_y), line, font,
+            text_color, outline_color, effect, border_color[:3] + (255,),
         )
         current_y += line_heights[i] + line_spacing
 
-    # オーバーレイを合成
-    result = Image.alpha_composite(img, overlay)
-    result = result.convert("RGB")
-    result.save(output_path, quality=95)
+    # ROI だけ合成して貼り戻す
+    region.alpha_composite(overlay)
+    img.paste(region.convert("RGB"), roi[:2])
+    return roi
 
+
+def render_graphrec_overlay(img, text, theme=None, effect=None):
+    """デコード済み画像にグラレコ風テロップを描画した RGB 画像を返す（img は変更しない）
+
+    Args:
+        img: 背景画像 (PIL.Image)
+        text: オーバーレイするテキスト
+        theme: カラーテーマ辞書 (None の場合はデフォルト)
+        effect: 文字効果 (TEXT_EFFECTS。None ならテーマの text_effect か outline)
+    """
+    result = img.copy() if img.mode == "RGB" else img.convert("RGB")
+    composite_graphrec_overlay(result, text, theme, effect)
+    return result
+
+
+def overlay_graphrec_text(bg_path, output_path, text, theme=None, size=FRAME_SIZE, effect=None):
+    """グラレコ風テキストオーバーレイを適用
+
+    デコード1回 → size へリサイズ → オーバーレイ → エンコードを1パスで行う。
+    オーバーレイは吹き出し周辺だけを合成し、デコードしたフレームへ直接貼り戻す。
+
+    Args:
+        bg_path: テキストなし背景画像パス
+        output_path: 出力画像パス（拡張子で形式を決める）
+        text: オーバーレイするテキスト
+        theme: カラーテーマ辞書 (None の場合はデフォルト)
+        size: 出力サイズ (None なら背景のまま)
+        effect: 文字効果 (None ならテーマ既定)
+
+    Returns:
+        output_path
+    """
+    img = load_frame(bg_path, size)
+    composite_graphrec_overlay(img, text, theme, effect)
+    encode(img, output_path)
     return output_path
 
 
+# ============================================
+# プロセスプール
+# ============================================
+
+def timed_overlay(bg_path, output_path, text, theme=None, size=FRAME_SIZE, effect=None):
+    """overlay_graphrec_text と同じ処理を行い、段階ごとの秒数を返す
+
+    Returns: {"decode": 秒, "render": 秒, "encode": 秒, "bytes": 書き込みバイト数}
+    """
+    start = time.perf_counter()
+    img = load_frame(bg_path, size)
+    decoded = time.perf_counter()
+    composite_graphrec_overlay(img, text, theme, effect)
+    rendered = time.perf_counter()
+    written = encode(img, output_path)
+    return {
+        "decode": decoded - start,
+        "render": rendered - decoded,
+        "encode": time.perf_counter() - rendered,
+        "bytes": written,
+    }
+
+
+def preload_fonts(styles=("bold",), min_size=28, max_size=64):
+    """fit_text が使うサイズのフォント・文字送り幅と文節解析器を先読みする"""
+    for style in styles:
+        for size in range(min_size, max_size + 1):
+            font_metrics(get_font(style, size))
+    _phrase_parser()
+
+
+class OverlayPool:
+    """overlay_graphrec_text をプロセスプールで並列実行する
+
+    各ワーカーは起動時に1回だけフォントを読み込み、以降はキャッシュを使う。
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 2
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=preload_fonts)
+
+    def submit(self, bg_path, output_path, text, theme=None, size=FRAME_SIZE, effect=None):
+        """Future の結果は各段階の秒数と書き込みバイト数（timed_overlay）"""
+        return self._executor.submit(timed_overlay, bg_path, output_path, text, theme, size, effect)
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
 # ============================================
 # CLI
 # ============================================
@@ -339,8 +681,9 @@ if __name__ == "__main__":
     import sys
 
     if len(sys.argv) < 4:
-        print("Usage: python graphrec_overlay.py <bg_image> <output> <text> [theme_key]")
+        print("Usage: python graphrec_overlay.py <bg_image> <output> <text> [theme_key] [effect]")
         print("  theme_key: vivid_colorful, pastel_pop, natural_warm, bright_energy")
+        print(f"  effect: {', '.join(TEXT_EFFECTS)}")
         sys.exit(1)
 
     bg_image = sys.argv[1]
@@ -352,6 +695,7 @@ if __name__ == "__main__":
         from graphrec_config import COLOR_THEMES
         theme_key = sys.argv[4]
         theme_dict = COLOR_THEMES.get(theme_key)
+    text_effect = sys.argv[5] if len(sys.argv) > 5 else None
 
-    overlay_graphrec_text(bg_image, output, overlay_text, theme=theme_dict)
+    overlay_graphrec_text(bg_image, output, overlay_text, theme=theme_dict, effect=text_effect)
     print(f"[graphrec-overlay] Generated: {output}")
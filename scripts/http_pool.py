@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""ホスト単位の keep-alive HTTP コネクションプール
+
+urllib.request.urlopen はリクエストごとに TCP + TLS 接続を張り直すため、
+ステータスポーリングのように同じホストへ何百回もアクセスする処理では
+ハンドシェイクが無視できないコストになる。
+
+HttpPool は (scheme, host, port) ごとに http.client のコネクションを
+保持して再利用し、接続数・再利用率・レイテンシのカウンタを公開する。
+複数スレッドから同時に使ってよい（1コネクションは同時に1リクエストのみ）。
+"""
+
+import http.client
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+MAX_REDIRECTS = 5
+
+# 再利用したコネクションが切れていた場合に1回だけ張り直すエラー
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class HttpError(Exception):
+    """HTTP ステータス 4xx / 5xx"""
+
+    def __init__(self, status, reason, url, body=b"", headers=None):
+        self.status = status
+        self.reason = reason
+        self.url = url
+        self.body = body
+        self.headers = headers or {}
+        preview = body[:200].decode("utf-8", "replace") if body else ""
+        super().__init__(f"HTTP {status} {reason}: {url} {preview}".rstrip())
+
+
+class PoolStats:
+    """接続・リクエストのカウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.latency = {}  # host -> [count, total_sec, max_sec]
+
+    def record(self, host, elapsed, reused, nbytes=0, error=False):
+        with self._lock:
+            self.requests += 1
+            if reused:
+                self.connections_reused += 1
+            else:
+                self.connections_opened += 1
+            if error:
+                self.errors += 1
+            self.bytes_received += nbytes
+            entry = self.latency.setdefault(host, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": self.connections_reused,
+                "errors": self.errors,
+                "bytes_received": self.bytes_received,
+                "latency": {
+                    host: {
+                        "count": count,
+                        "avg_ms": round(total / count * 1000, 1) if count else 0.0,
+                        "max_ms": round(peak * 1000, 1),
+                    }
+                    for host, (count, total, peak) in self.latency.items()
+                },
+            }
+
+    def format(self):
+        """1〜数行の人間向けサマリー"""
+        data = self.as_dict()
+        total = data["requests"]
+        ratio = data["connections_reused"] / total * 100 if total else 0.0
+        lines = [
+            f"HTTP: {total} requests, {data['connections_opened']} connections opened, "
+            f"{ratio:.0f}% reused, {data['errors']} errors, "
+            f"{data['bytes_received'] / 1e6:.1f} MB received"
+        ]
+        for host, lat in sorted(data["latency"].items()):
+            lines.append(
+                f"  {host}: {lat['count']} req, avg {lat['avg_ms']:.0f}ms, max {lat['max_ms']:.0f}ms"
+            )
+        return "\n".join(lines)
+
+
+class PooledResponse:
+    """ストリーミング読み出し用のレスポンス
+
+    with 文で使い、終了時に本文を読み切っていればコネクションをプールへ返す。
+    """
+
+    def __init__(self, pool, key, conn, resp, url, started, reused):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self._started = started
+        self._reused = reused
+        self._nbytes = 0
+        self.url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = {k.lower(): v for k, v in resp.getheaders()}
+
+    def read(self, amt=None):
+        data = self._resp.read(amt)
+        self._nbytes += len(data)
+        return data
+
+    def iter_lines(self):
+        """行単位で読み出す（Server-Sent Events 用）"""
+        while True:
+            line = self._resp.readline()
+            if not line:
+                return
+            self._nbytes += len(line)
+            yield line.decode("utf-8", "replace").rstrip("\r\n")
+
+    def iter_chunks(self, chunk_size=64 * 1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if self._conn is None:
+            return
+        reusable = self._resp.isclosed() and not self._resp.will_close
+        elapsed = time.monotonic() - self._started
+        self._pool.stats.record(self._key[1], elapsed, self._reused, self._nbytes)
+        if reusable:
+            self._pool._release(self._key, self._conn)
+        else:
+            self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HttpPool:
+    """スレッドセーフな keep-alive コネクションプール"""
+
+    def __init__(self, timeout=30, max_idle_per_host=16):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.stats = PoolStats()
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _new_connection(self, scheme, host, port, timeout):
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _acquire(self, key, timeout):
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port = key
+        return self._new_connection(scheme, host, port, timeout), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """保持中のコネクションをすべて閉じる"""
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+    def _send(self, method, url, body, headers, timeout):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        default_port = 443 if scheme == "https" else 80
+        key = (scheme, parts.hostname, parts.port or default_port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        for attempt in range(2):
+            conn, reused = self._acquire(key, timeout)
+            started = time.monotonic()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                return PooledResponse(self, key, conn, resp, url, started, reused)
+            except _STALE_ERRORS:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                self.stats.record(key[1], time.monotonic() - started, reused, error=True)
+                raise
+            except Exception:
+                conn.close()
+                self.stats.record(key[1], time.monotonic() - started, reused, error=True)
+                raise
+        raise RuntimeError("unreachable")
+
+    def open(self, method, url, body=None, headers=None, timeout=None):
+        """リクエストを送り、ストリーミング用の PooledResponse を返す
+
+        3xx はリダイレクト先を追い、4xx / 5xx は HttpError を送出する。
+        """
+        timeout = timeout or self.timeout
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(method, url, body, headers, timeout)
+            if resp.status in (301, 302, 303, 307, 308) and "location" in resp.headers:
+                resp.read()
+                resp.close()
+                url = urljoin(url, resp.headers["location"])
+                if resp.status == 303:
+                    method, body = "GET", None
+                continue
+            if resp.status >= 400:
+                err_body = resp.read()
+                resp.close()
+                raise HttpError(resp.status, resp.reason, url, err_body, resp.headers)
+            return resp
+        raise HttpError(310, "Too many redirects", url)
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """リクエストを送り (status, headers, body) を返す"""
+        with self.open(method, url, body=body, headers=headers, timeout=timeout) as resp:
+            data = resp.read()
+            return resp.status, resp.headers, data
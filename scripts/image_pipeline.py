@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""画像のデコード・リサイズ・エンコードを行うプロセス内ステージ
+
+macOS 専用の sips サブプロセスの置き換え。ダウンロードしたバイト列を
+そのままデコードし、1080x1920 ちょうどにリサイズして最終形式で書き出す。
+pyvips があれば libvips を使い、なければ Pillow を使う
+（IMAGE_BACKEND=pillow で Pillow を強制）。
+
+CPU 処理なので ResizePool（プロセスプール）で並列化できる。
+graphrec_overlay.py からも load_frame() / encode() を使い、
+デコード1回・リサイズ・オーバーレイ・エンコードを1パスで行う。
+"""
+
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from atomic_io import atomic_write_bytes
+
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+FRAME_SIZE = (1080, 1920)
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+# libvips の kernel 名（nearest / linear / cubic / lanczos3）
+_VIPS_KERNELS = {
+    "nearest": "nearest",
+    "box": "linear",
+    "bilinear": "linear",
+    "hamming": "cubic",
+    "bicubic": "cubic",
+    "lanczos": "lanczos3",
+}
+
+_FORMATS = {
+    ".png": "PNG",
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".webp": "WEBP",
+    ".avif": "AVIF",
+}
+
+
+def _use_vips():
+    return pyvips is not None and os.environ.get("IMAGE_BACKEND", "auto") != "pillow"
+
+
+def format_for_path(path):
+    """拡張子から出力形式を決める"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _FORMATS:
+        raise ValueError(f"unsupported image format: {path}")
+    return _FORMATS[ext]
+
+
+# ============================================
+# Pillow
+# ============================================
+
+def fit_frame(img, size=FRAME_SIZE, resample="lanczos"):
+    """アスペクト比を保って拡大縮小し、中央を size ちょうどに切り出す"""
+    if img.size == tuple(size):
+        return img
+    width, height = size
+    scale = max(width / img.width, height / img.height)
+    scaled = (max(width, round(img.width * scale)), max(height, round(img.height * scale)))
+    img = img.resize(scaled, RESAMPLE_FILTERS[resample])
+    left = (scaled[0] - width) // 2
+    top = (scaled[1] - height) // 2
+    return img.crop((left, top, left + width, top + height))
+
+
+def load_frame(source, size=FRAME_SIZE, resample="lanczos"):
+    """パスまたはバイト列をデコードして size の RGB 画像にする"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        if size is not None:
+            img.draft("RGB", size)  # JPEG は縮小デコードで読み込みを軽くする
+        frame = img.convert("RGB")
+    if size is None:
+        return frame
+    return fit_frame(frame, size, resample)
+
+
+def encode(img, path, quality=95):
+    """拡張子の形式でエンコードし、原子的に書き込む（書き込みバイト数を返す）"""
+    fmt = format_for_path(path)
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    options = {"compress_level": 6} if fmt == "PNG" else {"quality": quality}
+    buf = io.BytesIO()
+    img.save(buf, fmt, **options)
+    return atomic_write_bytes(path, buf.getvalue())
+
+
+# ============================================
+# libvips
+# ============================================
+
+def _vips_resize_bytes(data, output_path, size, resample, quality):
+    width, height = size
+    if resample == "lanczos":
+        # thumbnail はデコード時の縮小読み込みも使えるので最速
+        img = pyvips.Image.thumbnail_buffer(data, width, height=height, crop="centre")
+    else:
+        img = pyvips.Image.new_from_buffer(data, "")
+        scale = max(width / img.width, height / img.height)
+        img = img.resize(scale, kernel=_VIPS_KERNELS[resample])
+        img = img.crop((img.width - width) // 2, (img.height - height) // 2, width, height)
+    if img.hasalpha():
+        img = img.flatten()
+    ext = os.path.splitext(output_path)[1].lower()
+    options = "" if ext == ".png" else f"[Q={quality}]"
+    return atomic_write_bytes(output_path, img.write_to_buffer(ext + options))
+
+
+# ============================================
+# ステージ
+# ============================================
+
+def resize_bytes(data, output_path, size=FRAME_SIZE, resample="lanczos", quality=95):
+    """ダウンロード済みバイト列 → size ちょうどの最終画像（書き込みバイト数を返す）
+
+    ProcessPoolExecutor から呼べるようトップレベル関数にしている。
+    """
+    if resample not in RESAMPLE_FILTERS:
+        raise ValueError(f"unknown resample filter: {resample}")
+    if _use_vips():
+        return _vips_resize_bytes(data, output_path, size, resample, quality)
+    return encode(load_frame(data, size, resample), output_path, quality=quality)
+
+
+class ResizePool:
+    """resize_bytes をプロセスプールで並列実行する"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 2
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, data, output_path, size=FRAME_SIZE, resample="lanczos", quality=95):
+        return self._executor.submit(resize_bytes, data, output_path, size, resample, quality)
+
+    def resize(self, data, output_path, **kwargs):
+        """submit して完了を待つ（スレッドから同期的に使う）"""
+        return self.submit(data, output_path, **kwargs).result()
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_pool():
+    """プロセス共通の ResizePool を返す"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ResizePool()
+        return _default_pool
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""並列ジョブ実行エンジン
+
+fal.ai などリモートキューへのジョブを同時に最大 N 件まで投入し、
+各ジョブの状態（submit → queue → download …）を追跡しながら
+全体の進捗をまとめて表示する。
+
+ジョブ関数側は report("polling") のように現在の状態を報告するだけでよく、
+シグネチャを変える必要はない（ランナー外で呼ばれた場合は何もしない）。
+
+job.after(other) で依存を付けると、依存ジョブが成功してから実行する
+（依存が失敗したジョブは実行せず "blocked" になる）。
+
+各ジョブは telemetry の "item" スパンで囲むので、中で記録したスパンに
+ジョブ名が付く。
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import telemetry
+
+_local = threading.local()
+
+# 後続ジョブを進めてよい結果
+OK_RESULTS = ("ok", "skip", "dry")
+
+
+def report(state, detail=""):
+    """実行中ジョブの状態を更新（ランナー外では無視）"""
+    job = getattr(_local, "job", None)
+    if job is None:
+        return
+    job.state = state
+    job.detail = detail
+
+
+def _normalize_result(value):
+    """ジョブ関数の戻り値を "ok" / "fail" などの結果文字列にそろえる"""
+    if value is True:
+        return "ok"
+    if value is False or value is None:
+        return "fail"
+    return str(value)
+
+
+class Job:
+    """1ジョブの状態"""
+
+    def __init__(self, name, func, *args, **kwargs):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.state = "pending"
+        self.detail = ""
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.deps = []
+
+    def after(self, *jobs):
+        """jobs の完了後に実行する（self を返す）"""
+        self.deps.extend(jobs)
+        return self
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+
+class JobRunner:
+    """ThreadPoolExecutor で最大 concurrency 件のジョブを並行実行する"""
+
+    def __init__(self, concurrency=4, label=""):
+        self.concurrency = max(1, int(concurrency))
+        self.label = label
+        self._lock = threading.Lock()
+        self._jobs = []
+        self._done = 0
+        self._started_at = None
+        self._finished_at = None
+
+    def _run_job(self, job):
+        _local.job = job
+        job.started_at = time.monotonic()
+        job.state = "running"
+        try:
+            with telemetry.item(job.name) as span:
+                try:
+                    job.result = _normalize_result(job.func(*job.args, **job.kwargs))
+                except Exception as e:
+                    job.error = e
+                    job.result = "error"
+                span.set(result=job.result)
+        finally:
+            job.finished_at = time.monotonic()
+            job.state = "done"
+            _local.job = None
+        self._on_finished(job)
+        return job
+
+    def _on_finished(self, job):
+        with self._lock:
+            self._done += 1
+            done = self._done
+            counts = self.counts()
+            in_flight = sum(1 for j in self._jobs if j.state not in ("pending", "done"))
+        total = len(self._jobs)
+        tally = ", ".join(f"{k}: {v}" for k, v in sorted(counts.items()))
+        suffix = f" ({job.error})" if job.error else ""
+        print(
+            f"[{done}/{total}] {job.result.upper()}: {job.name} "
+            f"{job.elapsed:.1f}s{suffix} | in-flight {in_flight} | {tally}",
+            flush=True,
+        )
+
+    def counts(self):
+        """結果ごとの件数"""
+        counts = {}
+        for job in self._jobs:
+            if job.result is not None:
+                counts[job.result] = counts.get(job.result, 0) + 1
+        return counts
+
+    def _block(self, job):
+        failed = next(d for d in job.deps if d.result not in OK_RESULTS)
+        job.result = "blocked"
+        job.detail = f"{failed.name}: {failed.result}"
+        job.state = "done"
+        self._on_finished(job)
+
+    def _run_graph(self, pool):
+        """依存が解決したジョブから順に投入する"""
+        pending = list(self._jobs)
+        running = {}
+        while pending or running:
+            ready = [j for j in pending if all(d.state == "done" for d in j.deps)]
+            for job in ready:
+                pending.remove(job)
+                if all(d.result in OK_RESULTS for d in job.deps):
+                    running[pool.submit(self._run_job, job)] = job
+                else:
+                    self._block(job)
+            if not running:
+                if pending and not ready:
+                    names = ", ".join(j.name for j in pending[:5])
+                    raise ValueError(f"dependency cycle or unknown dependency: {names}")
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                running.pop(future)
+                future.result()
+
+    def run(self, jobs):
+        """全ジョブを実行し、完了した Job のリストを入力順で返す"""
+        self._jobs = list(jobs)
+        self._done = 0
+        self._started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            if any(job.deps for job in self._jobs):
+                self._run_graph(pool)
+            else:
+                futures = [pool.submit(self._run_job, job) for job in self._jobs]
+                for future in futures:
+                    future.result()
+        self._finished_at = time.monotonic()
+        return self._jobs
+
+    @property
+    def wall_time(self):
+        if self._started_at is None:
+            return 0.0
+        end = self._finished_at if self._finished_at is not None else time.monotonic()
+        return end - self._started_at
+
+    def print_summary(self):
+        """全体のサマリーを表示"""
+        counts = self.counts()
+        total = len(self._jobs)
+        busy = sum(job.elapsed for job in self._jobs)
+        slowest = sorted(self._jobs, key=lambda j: j.elapsed, reverse=True)[:3]
+        label = f" {self.label}" if self.label else ""
+
+        print(f"\n=== Summary{label} ===", flush=True)
+        for result, count in sorted(counts.items()):
+            print(f"  {result}: {count}/{total}", flush=True)
+        print(
+            f"  Wall time: {self.wall_time:.1f}s "
+            f"(serial sum {busy:.1f}s, concurrency {self.concurrency})",
+            flush=True,
+        )
+        if slowest and slowest[0].elapsed > 0:
+            names = ", ".join(f"{j.name} {j.elapsed:.1f}s" for j in slowest)
+            print(f"  Slowest: {names}", flush=True)
+        failed = [j for j in self._jobs if j.result not in OK_RESULTS]
+        for job in failed:
+            reason = job.error or job.detail or job.result
+            print(f"  FAILED: {job.name} ({reason})", flush=True)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""MP3 のフレームヘッダ解析（デコードせずに長さを求める）
+
+MPEG-1/2/2.5 Layer I/II/III のフレームヘッダを先頭から辿り、
+フレームごとのサンプル数を合計して再生時間を出す。VBR でも正確。
+先頭の ID3v2 タグ・末尾の ID3v1 タグは読み飛ばし、Xing / Info / VBRI の
+メタデータフレーム（無音の1フレーム）は音声に数えない。
+
+concat() は複数の MP3 を音声フレーム単位でつなぐ（再エンコードなし）。
+
+使い方:
+  python3 scripts/mp3_frames.py public/audio/scenes/*.mp3
+"""
+
+import argparse
+import collections
+import sys
+
+# ビットレート (kbps): [MPEG-1 か][layer]
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# サンプリング周波数: version ビット (0=2.5, 2=2, 3=1) → index
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+_INFO_TAGS = (b"Xing", b"Info", b"VBRI")
+
+Frame = collections.namedtuple("Frame", "offset size samples sample_rate bitrate is_info")
+
+
+def parse_header(data, offset=0):
+    """offset のフレームヘッダを解析して (size, samples, sample_rate, bitrate) を返す（不正なら None）"""
+    if offset + 4 > len(data):
+        return None
+    b1, b2 = data[offset + 1], data[offset + 2]
+    if data[offset] != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None  # reserved / free format
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, bitrate
+    if layer == 3 and not mpeg1:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate, bitrate
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate, bitrate
+
+
+def id3v2_size(data):
+    """先頭の ID3v2 タグのバイト数（なければ 0）"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _audio_end(data):
+    return len(data) - 128 if len(data) >= 128 and data[-128:-125] == b"TAG" else len(data)
+
+
+def iter_frames(data):
+    """data（MP3 全体のバイト列）のフレームを順に返す
+
+    同期が外れた箇所は次のフレームヘッダまで読み飛ばす
+    （ヘッダに見えるゴミを避けるため、次のフレームも続くことを確認する）。
+    """
+    end = _audio_end(data)
+    offset = id3v2_size(data)
+    first = True
+    while offset + 4 <= end:
+        header = parse_header(data, offset)
+        if header is None or offset + header[0] > end:
+            offset += 1
+            continue
+        size, samples, sample_rate, bitrate = header
+        following = offset + size
+        if following + 4 <= end and parse_header(data, following) is None:
+            offset += 1
+            continue
+        is_info = first and any(tag in data[offset + 4:offset + min(size, 48)] for tag in _INFO_TAGS)
+        yield Frame(offset, size, samples, sample_rate, bitrate, is_info)
+        first = False
+        offset = following
+
+
+def _read(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def duration(source):
+    """MP3（パスまたはバイト列）の再生秒数"""
+    return sum(frame.samples / frame.sample_rate for frame in iter_frames(_read(source)) if not frame.is_info)
+
+
+def concat(parts):
+    """複数の MP3（バイト列）を音声フレームだけ取り出して順につなぐ
+
+    各パートの ID3 タグと Xing / Info フレームは落とす。
+    サンプリング周波数が揃っていなければ ValueError。
+    """
+    out = bytearray()
+    sample_rate = None
+    for index, data in enumerate(parts):
+        frames = [frame for frame in iter_frames(data) if not frame.is_info]
+        if not frames:
+            raise ValueError(f"part {index}: no MPEG audio frames")
+        if sample_rate is None:
+            sample_rate = frames[0].sample_rate
+        elif frames[0].sample_rate != sample_rate:
+            raise ValueError(f"part {index}: {frames[0].sample_rate} Hz != {sample_rate} Hz")
+        for frame in frames:
+            out += data[frame.offset:frame.offset + frame.size]
+    return bytes(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MP3 duration from frame headers")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    total = 0.0
+    for path in args.paths:
+        frames = [frame for frame in iter_frames(_read(path)) if not frame.is_info]
+        if not frames:
+            print(f"  {path}: no MPEG audio frames", file=sys.stderr, flush=True)
+            continue
+        seconds = sum(frame.samples / frame.sample_rate for frame in frames)
+        kbps = sum(frame.bitrate for frame in frames) / len(frames) / 1000
+        total += seconds
+        print(f"  {path}: {seconds:.2f}s ({len(frames)} frames, {frames[0].sample_rate} Hz, avg {kbps:.0f} kbps)",
+              flush=True)
+    if len(args.paths) > 1:
+        print(f"Total: {total:.2f}s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
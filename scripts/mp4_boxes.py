@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""MP4 の box 構造の解析と faststart 化（再エンコードなし）
+
+MiniMax の MP4 は ftyp → mdat → moov の順で、moov（インデックス）が
+末尾にある。ブラウザは moov を読むまで再生を始められないので、
+faststart() で moov を mdat の前へ移し、チャンクオフセット（stco / co64）を
+移動量だけずらす。映像・音声データ自体は1バイトも変えない。
+
+使い方:
+  python3 scripts/mp4_boxes.py public/video/scenes/*.mp4   # box 順・長さ・解像度を表示
+"""
+
+import argparse
+import collections
+import struct
+
+Box = collections.namedtuple("Box", "type offset header size")
+
+# stco / co64 まで降りるコンテナ box
+_CONTAINERS = (b"moov", b"trak", b"mdia", b"minf", b"stbl")
+
+
+def iter_boxes(data, start=0, end=None):
+    """data[start:end] の box を順に返す（サイズ不正なら ValueError）"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                raise ValueError(f"truncated box header at {offset}")
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset  # 末尾まで続く box
+        if size < header or offset + size > end:
+            raise ValueError(f"bad {box_type!r} box size {size} at {offset}")
+        yield Box(box_type.decode("latin-1"), offset, header, size)
+        offset += size
+
+
+def find(data, path, start=0, end=None):
+    """"moov/mvhd" のようなパスで最初の box を返す（なければ None）"""
+    first, _, rest = path.partition("/")
+    for box in iter_boxes(data, start, end):
+        if box.type == first:
+            if not rest:
+                return box
+            return find(data, rest, box.offset + box.header, box.offset + box.size)
+    return None
+
+
+def is_faststart(data):
+    """moov が最初の mdat より前にあるか"""
+    for box in iter_boxes(data):
+        if box.type == "moov":
+            return True
+        if box.type == "mdat":
+            return False
+    return False
+
+
+def _patch_offsets(moov, shift_from, shift_to, shift, start=None, end=None):
+    """moov（bytearray）内の stco / co64 のうち [shift_from, shift_to) を指すオフセットを shift ずらす"""
+    start = 8 if start is None else start
+    end = len(moov) if end is None else end
+    for box in iter_boxes(moov, start, end):
+        kind = box.type.encode("latin-1")
+        body = box.offset + box.header
+        if kind in _CONTAINERS:
+            _patch_offsets(moov, shift_from, shift_to, shift, body, box.offset + box.size)
+        elif kind in (b"stco", b"co64"):
+            fmt, width = (">I", 4) if kind == b"stco" else (">Q", 8)
+            count = struct.unpack_from(">I", moov, body + 4)[0]
+            for i in range(count):
+                at = body + 8 + i * width
+                value = struct.unpack_from(fmt, moov, at)[0]
+                if shift_from <= value < shift_to:
+                    value += shift
+                    if kind == b"stco" and value > 0xFFFFFFFF:
+                        raise ValueError("chunk offset overflows stco (needs co64 rewrite)")
+                    struct.pack_into(fmt, moov, at, value)
+
+
+def faststart(data):
+    """moov を先頭側（最初の mdat の直前）へ移した MP4 を返す（既に faststart ならそのまま）
+
+    分割 MP4（moof）や、オフセットが 32bit に収まらなくなる場合は ValueError。
+    """
+    boxes = list(iter_boxes(data))
+    types = [box.type for box in boxes]
+    if "moov" not in types or "mdat" not in types:
+        raise ValueError("not a progressive MP4 (no moov/mdat)")
+    if "moof" in types:
+        raise ValueError("fragmented MP4 is not supported")
+    moov = next(box for box in boxes if box.type == "moov")
+    first_mdat = next(box for box in boxes if box.type == "mdat")
+    if moov.offset < first_mdat.offset:
+        return data
+    if moov.header != 8:
+        raise ValueError("64-bit moov box is not supported")
+
+    # first_mdat から旧 moov 位置までのデータが moov のサイズ分うしろへずれる
+    moov_data = bytearray(data[moov.offset:moov.offset + moov.size])
+    _patch_offsets(moov_data, first_mdat.offset, moov.offset, moov.size)
+    return b"".join((
+        data[:first_mdat.offset],
+        bytes(moov_data),
+        data[first_mdat.offset:moov.offset],
+        data[moov.offset + moov.size:],
+    ))
+
+
+def info(data):
+    """{"duration": 秒, "width": px, "height": px, "faststart": bool}（映像トラックがなければ幅高さ 0）"""
+    mvhd = find(data, "moov/mvhd")
+    if mvhd is None:
+        raise ValueError("no moov/mvhd box")
+    body = mvhd.offset + mvhd.header
+    if data[body] == 1:
+        timescale, length = struct.unpack_from(">IQ", data, body + 20)
+    else:
+        timescale, length = struct.unpack_from(">II", data, body + 12)
+    result = {"duration": length / timescale if timescale else 0.0, "width": 0, "height": 0,
+              "faststart": is_faststart(data)}
+
+    moov = find(data, "moov")
+    for trak in iter_boxes(data, moov.offset + moov.header, moov.offset + moov.size):
+        if trak.type != "trak":
+            continue
+        hdlr = find(data, "mdia/hdlr", trak.offset + trak.header, trak.offset + trak.size)
+        if hdlr is None or data[hdlr.offset + hdlr.header + 8:hdlr.offset + hdlr.header + 12] != b"vide":
+            continue
+        tkhd = find(data, "tkhd", trak.offset + trak.header, trak.offset + trak.size)
+        # tkhd の末尾 8 バイトが 16.16 固定小数点の幅・高さ
+        width, height = struct.unpack_from(">II", data, tkhd.offset + tkhd.size - 8)
+        result["width"], result["height"] = width >> 16, height >> 16
+        break
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MP4 box layout / duration")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        layout = " ".join(box.type for box in iter_boxes(data))
+        meta = info(data)
+        print(f"  {path}: {layout}  {meta['duration']:.2f}s {meta['width']}x{meta['height']}"
+              f"{'' if meta['faststart'] else '  (moov at end)'}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""NanoBanana Pro 常駐ワーカー
+
+1枚ごとに `run.py image_generator.py ...` のサブプロセスを起動すると、
+毎回インタプリタ起動・import・認証・セッション確立のコストがかかる。
+このワーカーは1プロセスで常駐し、ローカルの Unix ソケット上で
+JSON-lines の要求を受けて画像を生成する（同時に複数件を処理できる）。
+
+  要求: {"id": "1", "op": "generate", "prompt": "...", "output": "/abs/path.png", "timeout": 180}
+  応答: {"id": "1", "ok": true, "size": 123456, "error": null,
+         "timings": {"queued": 0.0, "generate": 41.2, "total": 41.2}}
+  ほか: {"op": "ping"} / {"op": "stats"} / {"op": "shutdown"}
+
+バックエンド:
+  skill       スキルの image_generator を1回だけ import し、クライアントを温めたまま使う
+              （generate_image(prompt, output_path, timeout=...) がない版は subprocess。
+              スキルが THREAD_SAFE を宣言していなければ1件ずつしか呼べないので、
+              --concurrency 2 以上では同時生成できる subprocess にする）
+  subprocess  従来どおり要求ごとに run.py を起動する
+  fake        API を呼ばずに数秒待ってダミー画像を書く（オフライン検証用）
+
+batch-generate-images.py / batch-generate-graphrec.py は generate_image() を
+呼ぶだけでよく、ワーカーがなければ自動で起動する。環境変数:
+  NANOBANANA_WORKER   auto（既定）| fake | subprocess | off（従来のサブプロセス直接実行）
+  NANOBANANA_SOCKET   ソケットのパス（既定: .cache/nanobanana.sock）
+
+使い方:
+  python3 scripts/nanobanana_worker.py serve --concurrency 2
+  python3 scripts/nanobanana_worker.py serve --fake --delay 3
+  python3 scripts/nanobanana_worker.py stats
+  python3 scripts/nanobanana_worker.py stop
+"""
+
+import argparse
+import hashlib
+import importlib
+import inspect
+import io
+import itertools
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from atomic_io import atomic_write_bytes
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NANOBANANA_DIR = os.path.expanduser("~/.claude/skills/nanobanana-pro")
+DEFAULT_SOCKET = os.environ.get("NANOBANANA_SOCKET", os.path.join(PROJECT_ROOT, ".cache", "nanobanana.sock"))
+WORKER_MODE = os.environ.get("NANOBANANA_WORKER", "auto")
+LOG_PATH = os.path.join(PROJECT_ROOT, ".cache", "nanobanana-worker.log")
+
+DEFAULT_CONCURRENCY = 2
+IDLE_TIMEOUT = 900  # 要求がなければ 15 分で終了する
+START_TIMEOUT = 30
+
+
+# ============================================
+# バックエンド
+# ============================================
+
+class SubprocessBackend:
+    """要求ごとに run.py image_generator.py を起動する（従来の方式）"""
+
+    name = "subprocess"
+
+    def generate(self, prompt, output_path, timeout=180):
+        cmd = [
+            sys.executable,
+            os.path.join(NANOBANANA_DIR, "scripts", "run.py"),
+            "image_generator.py",
+            "--prompt", prompt,
+            "--output", output_path,
+            "--timeout", str(timeout),
+        ]
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=timeout + 60,
+                cwd=NANOBANANA_DIR,
+            )
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"generation exceeded {timeout + 60}s")
+        if result.returncode != 0 or not os.path.exists(output_path):
+            raise RuntimeError(f"rc={result.returncode} {result.stderr[:200]}".strip())
+
+
+class SkillBackend:
+    """スキルの image_generator をプロセス内に読み込んで使い回す
+
+    スキルがスレッドセーフとは限らないので、モジュールが THREAD_SAFE = True を
+    宣言していない限り呼び出しは1件ずつに直列化する。同時生成が要るときは
+    make_backend が subprocess バックエンドを選ぶ。
+    """
+
+    name = "skill"
+
+    def __init__(self):
+        scripts_dir = os.path.join(NANOBANANA_DIR, "scripts")
+        if scripts_dir not in sys.path:
+            sys.path.append(scripts_dir)
+        module = importlib.import_module("image_generator")
+        self._generate = getattr(module, "generate_image", None)
+        if self._generate is None:
+            raise ImportError("image_generator has no generate_image()")
+        try:
+            inspect.signature(self._generate).bind("prompt", "output", timeout=180)
+        except (TypeError, ValueError) as e:
+            raise ImportError(f"unexpected generate_image() signature: {e}") from e
+        self.thread_safe = bool(getattr(module, "THREAD_SAFE", False))
+        self._lock = None if self.thread_safe else threading.Lock()
+
+    def generate(self, prompt, output_path, timeout=180):
+        if self._lock is None:
+            result = self._generate(prompt, output_path, timeout=timeout)
+        else:
+            with self._lock:
+                result = self._generate(prompt, output_path, timeout=timeout)
+        if result is False or not os.path.exists(output_path):
+            raise RuntimeError("generator returned no image")
+
+
+class FakeBackend:
+    """API を呼ばずに delay 秒待って 1080x1920 のダミー画像を書く"""
+
+    name = "fake"
+
+    def __init__(self, delay=2.0, fail_every=0):
+        self.delay = delay
+        self.fail_every = fail_every
+        self._count = itertools.count(1)
+
+    def generate(self, prompt, output_path, timeout=180):
+        from PIL import Image
+
+        time.sleep(self.delay)
+        if self.fail_every and next(self._count) % self.fail_every == 0:
+            raise RuntimeError("fake failure")
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        base = Image.new("RGB", (1080, 1920), tuple(digest[:3]))
+        noise = Image.effect_noise(base.size, 48).convert("RGB")
+        buf = io.BytesIO()
+        Image.blend(base, noise, 0.25).save(buf, "PNG", compress_level=1)
+        atomic_write_bytes(output_path, buf.getvalue())
+
+
+def make_backend(mode, delay=2.0, fail_every=0, concurrency=DEFAULT_CONCURRENCY):
+    """mode に対応するバックエンド
+
+    auto は skill。読めないとき、またはスレッドセーフでないスキルで
+    concurrency が 2 以上のとき（1件ずつになってしまう）は subprocess。
+    """
+    if mode == "fake":
+        return FakeBackend(delay, fail_every)
+    if mode == "subprocess":
+        return SubprocessBackend()
+    try:
+        backend = SkillBackend()
+    except Exception as e:
+        print(f"[nanobanana-worker] skill backend unavailable ({e}), using subprocess", flush=True)
+        return SubprocessBackend()
+    if concurrency > 1 and not backend.thread_safe:
+        print(f"[nanobanana-worker] skill is not THREAD_SAFE, using subprocess for {concurrency} "
+              "concurrent generations (--concurrency 1 keeps the in-process skill)", flush=True)
+        return SubprocessBackend()
+    return backend
+
+
+# ============================================
+# サーバー
+# ============================================
+
+class WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """JSON-lines の要求を backend で処理する Unix ソケットサーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, backend, concurrency=DEFAULT_CONCURRENCY, idle_timeout=IDLE_TIMEOUT):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        self.backend = backend
+        self.concurrency = concurrency
+        self.idle_timeout = idle_timeout
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.stats = {"requests": 0, "ok": 0, "fail": 0, "generate_seconds": 0.0}
+        self.stats_lock = threading.Lock()
+        self.last_activity = time.monotonic()
+        self.started = time.time()
+        super().__init__(socket_path, _Handler)
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def run_generate(self, request, received):
+        """1要求を実行して応答 dict を返す（executor のスレッドで動く）"""
+        started = time.monotonic()
+        response = {"id": request.get("id"), "ok": False, "size": 0, "error": None}
+        try:
+            self.backend.generate(request["prompt"], request["output"], int(request.get("timeout", 180)))
+            response["ok"] = True
+            response["size"] = os.path.getsize(request["output"])
+        except TimeoutError as e:
+            response["error"] = f"timeout: {e}"
+        except Exception as e:
+            response["error"] = str(e) or type(e).__name__
+        finished = time.monotonic()
+        response["timings"] = {
+            "queued": round(started - received, 3),
+            "generate": round(finished - started, 3),
+            "total": round(finished - received, 3),
+        }
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["ok" if response["ok"] else "fail"] += 1
+            self.stats["generate_seconds"] += finished - started
+        self.touch()
+        return response
+
+    def snapshot(self):
+        with self.stats_lock:
+            return {
+                **self.stats,
+                "backend": self.backend.name,
+                "concurrency": self.concurrency,
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started, 1),
+            }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """1接続で複数要求を受け、完了した順に応答を書く"""
+
+    def handle(self):
+        write_lock = threading.Lock()
+
+        def send(payload):
+            line = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+            with write_lock:
+                self.wfile.write(line)
+                self.wfile.flush()
+
+        futures = []
+        for raw in self.rfile:
+            self.server.touch()
+            try:
+                request = json.loads(raw)
+            except ValueError:
+                send({"ok": False, "error": "invalid json"})
+                continue
+            op = request.get("op", "generate")
+            if op == "ping":
+                send({"id": request.get("id"), "ok": True, "backend": self.server.backend.name})
+            elif op == "stats":
+                send({"id": request.get("id"), "ok": True, "stats": self.server.snapshot()})
+            elif op == "shutdown":
+                send({"id": request.get("id"), "ok": True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            elif op == "generate":
+                future = self.server.executor.submit(self.server.run_generate, request, time.monotonic())
+                future.add_done_callback(lambda f: send(f.result()))
+                futures.append(future)
+            else:
+                send({"id": request.get("id"), "ok": False, "error": f"unknown op: {op}"})
+        # クライアントが書き込みを閉じても、実行中の要求の応答は返す
+        for future in futures:
+            future.result()
+
+
+def _watch_idle(server):
+    while True:
+        time.sleep(10)
+        if time.monotonic() - server.last_activity > server.idle_timeout:
+            print("[nanobanana-worker] idle timeout, exiting", flush=True)
+            server.shutdown()
+            return
+
+
+def serve(socket_path=DEFAULT_SOCKET, backend=None, concurrency=DEFAULT_CONCURRENCY, idle_timeout=IDLE_TIMEOUT):
+    """ワーカーを起動して要求を待つ（shutdown まで戻らない）"""
+    server = WorkerServer(socket_path, backend or make_backend("auto", concurrency=concurrency), concurrency,
+                          idle_timeout)
+    if idle_timeout:
+        threading.Thread(target=_watch_idle, args=(server,), daemon=True).start()
+    print(
+        f"[nanobanana-worker] {server.backend.name} backend x{concurrency} on {socket_path} (pid {os.getpid()})",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.executor.shutdown(wait=False)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# ============================================
+# クライアント
+# ============================================
+
+class WorkerClient:
+    """ワーカーへの要求（1要求1接続なのでスレッドから同時に呼んでよい）"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        self.socket_path = socket_path
+        self._ids = itertools.count(1)
+
+    def call(self, payload, timeout=None):
+        payload = {"id": str(next(self._ids)), **payload}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("worker closed the connection")
+        return json.loads(line)
+
+    def ping(self):
+        return self.backend() is not None
+
+    def backend(self):
+        """稼働中ワーカーのバックエンド名（応答がなければ None）"""
+        try:
+            response = self.call({"op": "ping"}, timeout=2)
+        except OSError:
+            return None
+        return response.get("backend") if response.get("ok") else None
+
+    def stats(self):
+        return self.call({"op": "stats"}, timeout=5)["stats"]
+
+    def shutdown(self):
+        return self.call({"op": "shutdown"}, timeout=5)
+
+    def generate(self, prompt, output_path, timeout=180):
+        """生成して応答 dict を返す（ok / size / error / timings）"""
+        return self.call(
+            {"op": "generate", "prompt": prompt, "output": os.path.abspath(output_path), "timeout": timeout},
+            timeout=timeout + 120,
+        )
+
+
+def start_worker(socket_path=DEFAULT_SOCKET, mode=WORKER_MODE, concurrency=DEFAULT_CONCURRENCY):
+    """ワーカーをバックグラウンドで起動し、応答するまで待つ"""
+    cmd = [sys.executable, os.path.abspath(__file__), "serve", "--socket", socket_path,
+           "--concurrency", str(concurrency)]
+    if mode == "fake":
+        cmd.append("--fake")
+    elif mode == "subprocess":
+        cmd.append("--subprocess")
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    with open(LOG_PATH, "a") as log:
+        subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                         start_new_session=True)
+    client = WorkerClient(socket_path)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if client.ping():
+            return client
+        time.sleep(0.2)
+    raise RuntimeError(f"nanobanana worker did not start (see {LOG_PATH})")
+
+
+def backend_matches(backend, mode=WORKER_MODE):
+    """稼働中ワーカーのバックエンドが mode の要求を満たすか
+
+    auto は skill か（skill が読めないときの）subprocess。fake のワーカーは
+    fake を指定したときだけ使う（本番の実行にダミー画像を返さないように）。
+    """
+    if mode in ("fake", "subprocess"):
+        return backend == mode
+    return backend in ("skill", "subprocess")
+
+
+def _stop_worker(client, timeout=START_TIMEOUT):
+    """ワーカーを止め、ソケットに応答しなくなるまで待つ"""
+    try:
+        client.shutdown()
+    except OSError:
+        pass
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and client.ping():
+        time.sleep(0.2)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_worker():
+    """起動済みのワーカー（なければ起動する）。NANOBANANA_WORKER=off なら None
+
+    別のモードで起動したワーカーが残っていれば止めて起動し直す。
+    """
+    global _client
+    if WORKER_MODE == "off":
+        return None
+    with _client_lock:
+        client = _client or WorkerClient(DEFAULT_SOCKET)
+        backend = client.backend()
+        if backend is not None and not backend_matches(backend):
+            print(f"    [nanobanana] worker runs the {backend} backend but NANOBANANA_WORKER={WORKER_MODE}, "
+                  "restarting", flush=True)
+            _stop_worker(client)
+            backend = None
+        _client = client if backend is not None else start_worker(DEFAULT_SOCKET, WORKER_MODE)
+        return _client
+
+
+def generate_image(prompt, output_path, timeout=180):
+    """NanoBanana Pro で1枚生成し、応答 dict（ok / size / error / timings）を返す
+
+    ワーカーが使えなければ（NANOBANANA_WORKER=off・起動失敗）その場でサブプロセスを起動する。
+    """
+    try:
+        worker = get_worker()
+    except (OSError, RuntimeError) as e:
+        print(f"    [nanobanana] worker unavailable ({e}), running subprocess", flush=True)
+        worker = None
+    if worker is not None:
+        return worker.generate(prompt, output_path, timeout)
+
+    start = time.monotonic()
+    response = {"ok": False, "size": 0, "error": None}
+    try:
+        SubprocessBackend().generate(prompt, output_path, timeout)
+        response.update(ok=True, size=os.path.getsize(output_path))
+    except TimeoutError as e:
+        response["error"] = f"timeout: {e}"
+    except Exception as e:
+        response["error"] = str(e)
+    elapsed = round(time.monotonic() - start, 3)
+    response["timings"] = {"queued": 0.0, "generate": elapsed, "total": elapsed}
+    return response
+
+
+def format_timings(response):
+    """応答の所要時間を1行にする"""
+    timings = response.get("timings") or {}
+    return f"queued {timings.get('queued', 0):.1f}s, generate {timings.get('generate', 0):.1f}s"
+
+
+# ============================================
+# CLI
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="NanoBanana Pro persistent worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="ワーカーを起動（フォアグラウンド）")
+    serve_parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    serve_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同時生成数")
+    serve_parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT, help="無通信で終了する秒数 (0 で無効)")
+    backend_group = serve_parser.add_mutually_exclusive_group()
+    backend_group.add_argument("--fake", action="store_true", help="ダミー画像を返す偽バックエンド")
+    backend_group.add_argument("--subprocess", action="store_true", help="要求ごとに run.py を起動")
+    serve_parser.add_argument("--delay", type=float, default=2.0, help="偽バックエンドの生成秒数")
+    serve_parser.add_argument("--fail-every", type=int, default=0, help="偽バックエンドで N 件ごとに失敗させる")
+
+    for name, help_text in (("stats", "統計を表示"), ("stop", "ワーカーを停止")):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("--socket", default=DEFAULT_SOCKET)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        mode = "fake" if args.fake else "subprocess" if args.subprocess else "auto"
+        backend = make_backend(mode, args.delay, args.fail_every, args.concurrency)
+        serve(args.socket, backend, args.concurrency, args.idle_timeout)
+        return
+
+    client = WorkerClient(args.socket)
+    if not client.ping():
+        print(f"[nanobanana-worker] not running ({args.socket})", flush=True)
+        sys.exit(1)
+    if args.command == "stats":
+        print(json.dumps(client.stats(), ensure_ascii=False, indent=2), flush=True)
+    else:
+        client.shutdown()
+        print("[nanobanana-worker] stopped", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""段階パイプライン（ステージ間に上限付きキュー）
+
+各ステージは独自のワーカー数を持つスレッド群で、前段の出力キューから
+アイテムを取り出して処理し、次段のキューへ渡す。キューには上限があり、
+後段が詰まれば前段は put で待つ（バックプレッシャー）。
+
+リモート生成（N+1..N+k 枚目）を回しながら N 枚目をローカルで検証・
+オーバーレイできるので、全体時間は各ステージの合計ではなく
+最も遅いステージに近づく。
+
+ステージ関数の戻り値:
+  アイテム           次のステージへ（最終ステージなら完了）
+  None               ここで完了（スキップ・失敗など）
+  Requeue("name", d) 同じアイテムを指定ステージへ d 秒後に戻す（リトライ）
+例外は on_error に渡し、そのアイテムは完了扱いにする。
+
+戻したアイテムはキューの末尾扱いで、新しいアイテムが尽きたときに取り出す
+（delay 秒たつまでは取り出さない）。ワーカーは待たずに次へ進む。
+
+各ステージの処理は telemetry のスパン（ステージ名）、キュー待ちは
+"<ステージ名>.wait"、投入から完了までは "item" として記録する。
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+import telemetry
+
+_POLL_INTERVAL = 0.05
+
+
+class Requeue:
+    """アイテムを stage へ戻す指示（検証 NG → 再生成など、delay 秒後から）"""
+
+    def __init__(self, stage, delay=0.0):
+        self.stage = stage
+        self.delay = delay
+
+
+class Stage:
+    """1ステージの設定と集計"""
+
+    def __init__(self, name, func, workers=1, queue_size=4):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.processed = 0
+        self.requeued = 0
+        self.busy = 0.0
+        self.max_depth = 0
+
+    def summary(self, elapsed):
+        """処理件数・稼働率などの1行"""
+        utilization = self.busy / (elapsed * self.workers) if elapsed else 0.0
+        return (
+            f"{self.name:<10} x{self.workers}  {self.processed:4d} items  "
+            f"busy {self.busy:7.1f}s  util {utilization:4.0%}  "
+            f"max queue {self.max_depth}/{self.queue_size}"
+            + (f"  requeued {self.requeued}" if self.requeued else "")
+        )
+
+
+class Pipeline:
+    """Stage を直列につないで items を流す"""
+
+    def __init__(self, stages, on_done=None, on_error=None, label=str, attributes=None):
+        if not stages:
+            raise ValueError("pipeline needs at least one stage")
+        self.stages = list(stages)
+        self._index = {stage.name: i for i, stage in enumerate(self.stages)}
+        self.on_done = on_done
+        self.on_error = on_error
+        self.label = label  # スパンに付けるアイテム名
+        self.attributes = attributes  # 完了時の "item" スパンに付ける属性 (item -> dict)
+        # 前段からの流れは上限付き、Requeue は無制限（循環で詰まらないように）
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self._retries = [[] for _ in self.stages]  # (ready_at, seq, item) のヒープ
+        self._seq = itertools.count()
+        self._enqueued = {}  # id(item) → (投入時刻, 現ステージのキューに入った時刻)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._fed_all = False
+        self.elapsed = 0.0
+
+    def _take_retry(self, i):
+        with self._lock:
+            retries = self._retries[i]
+            if retries and retries[0][0] <= time.monotonic():
+                return heapq.heappop(retries)[2]
+        return None
+
+    def _take(self, i):
+        try:
+            return self._queues[i].get_nowait()
+        except queue.Empty:
+            pass
+        item = self._take_retry(i)
+        if item is not None:
+            return item
+        try:
+            return self._queues[i].get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            return None
+
+    def _finished(self):
+        with self._lock:
+            return self._fed_all and self._pending == 0
+
+    def _complete(self, item):
+        if self.on_done is not None:
+            self.on_done(item)
+        with self._lock:
+            self._pending -= 1
+            born, _ = self._enqueued.pop(id(item), (None, None))
+        if born is not None:
+            attributes = self.attributes(item) if self.attributes else {}
+            telemetry.record("item", born, time.monotonic(), self.label(item), **attributes)
+
+    def _mark(self, item, ready_at=None):
+        now = time.monotonic()
+        with self._lock:
+            born, _ = self._enqueued.get(id(item), (now, None))
+            self._enqueued[id(item)] = (born, ready_at or now)
+
+    def _put(self, i, item):
+        stage = self.stages[i]
+        self._mark(item)
+        self._queues[i].put(item)
+        stage.max_depth = max(stage.max_depth, self._queues[i].qsize())
+
+    def _worker(self, i):
+        stage = self.stages[i]
+        while True:
+            item = self._take(i)
+            if item is None:
+                if self._finished():
+                    return
+                continue
+
+            label = self.label(item)
+            with self._lock:
+                _, queued_at = self._enqueued.get(id(item), (None, None))
+            start = time.perf_counter()
+            if queued_at is not None:
+                telemetry.record(f"{stage.name}.wait", queued_at, time.monotonic(), label)
+            try:
+                with telemetry.context(label), telemetry.span(stage.name):
+                    out = stage.func(item)
+            except Exception as e:
+                out = None
+                if self.on_error is not None:
+                    self.on_error(item, stage.name, e)
+            finally:
+                with self._lock:
+                    stage.busy += time.perf_counter() - start
+                    stage.processed += 1
+
+            if isinstance(out, Requeue):
+                self._mark(item, time.monotonic() + out.delay)
+                with self._lock:
+                    stage.requeued += 1
+                    heapq.heappush(
+                        self._retries[self._index[out.stage]],
+                        (time.monotonic() + out.delay, next(self._seq), item),
+                    )
+            elif out is None or i + 1 == len(self.stages):
+                self._complete(item if out is None else out)
+            else:
+                self._put(i + 1, out)
+
+    def run(self, items):
+        """items を全ステージに流し、全件の完了を待つ"""
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._worker, args=(i,), name=f"{stage.name}-{n}", daemon=True)
+            for i, stage in enumerate(self.stages)
+            for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        for item in items:
+            with self._lock:
+                self._pending += 1
+            self._put(0, item)
+        with self._lock:
+            self._fed_all = True
+
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+        return self.elapsed
+
+    def print_summary(self):
+        """ステージごとの集計を表示（最も忙しいステージがボトルネック）"""
+        print(f"Pipeline: {self.elapsed:.1f}s", flush=True)
+        for stage in self.stages:
+            print(f"  {stage.summary(self.elapsed)}", flush=True)
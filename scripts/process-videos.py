@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""動画クリップの配信用後処理（faststart・ビットレートラダー・ポスター）
+
+generate-videos.py がダウンロードしたままの public/video/scenes/*.mp4 は
+moov（インデックス）が末尾にあり、プレイヤーは最後まで読まないと
+再生を始められない。生成の後にこのスクリプトを実行する。
+
+  1. faststart   moov を mdat の前へ移す（mp4_boxes.faststart、再エンコードなし）。
+                 元のパスのまま置き換えるので、プレイヤー側の変更は不要。
+  2. poster      最初のフレームを public/video/web/{scene}-poster.webp に書き出す
+                 （ffmpeg がなければ I2V の入力画像 {scene}_01.png から作る）
+  3. --ladder    540p / 720p（短辺）の H.264 を public/video/web/{scene}-{width}p.mp4 に（要 ffmpeg）
+  4. --hls       ラダーの各段を HLS（2 秒セグメント）にし、master.m3u8 でまとめる（要 ffmpeg）
+
+結果は public/video/web/manifest.json に記録し、クリップの SHA-256 と設定が
+前回と同じなら何もしない。並列数は -j（ffmpeg を起動するのでスレッドで十分）。
+
+使い方:
+  python3 scripts/process-videos.py
+  python3 scripts/process-videos.py --ladder --hls -j 2
+  python3 scripts/process-videos.py --scene s04b-gap --force
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+import mp4_boxes
+import telemetry
+from asset_cache import get_cache
+from atomic_io import atomic_write_bytes, atomic_writer, sha256_file
+from image_pipeline import encode, load_frame
+from job_runner import Job, JobRunner, report
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(PROJECT_ROOT, "public", "video", "scenes")
+IMAGE_DIR = os.path.join(PROJECT_ROOT, "public", "images", "scenes")
+OUTPUT_DIR = os.path.join(PROJECT_ROOT, "public", "video", "web")
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")
+PUBLIC_PREFIX = "/video/web"
+
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")
+FFMPEG_TIMEOUT = 600
+# (短辺 = 縦動画の幅, 映像ビットレート, 音声ビットレート)。元クリップ（MiniMax）は 720x1280
+LADDER = ((540, "900k", "64k"), (720, "2000k", "96k"))
+HLS_SEGMENT_SECONDS = 2
+POSTER_QUALITY = 80
+
+# 設定を変えたら上げる（全クリップを処理し直す）
+PROCESS_VERSION = 2
+
+
+def ffmpeg_available():
+    return shutil.which(FFMPEG) is not None
+
+
+def settings(ladder, hls):
+    return {"version": PROCESS_VERSION, "ladder": [list(rung) for rung in LADDER] if ladder else [],
+            "hls": hls, "poster_quality": POSTER_QUALITY}
+
+
+def _run_ffmpeg(*args):
+    """ffmpeg を実行し、標準出力を返す（失敗時は RuntimeError に stderr の末尾を入れる）"""
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", *args]
+    result = subprocess.run(cmd, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace')[-300:]}")
+    return result.stdout
+
+
+def _public(path):
+    return f"{PUBLIC_PREFIX}/{os.path.relpath(path, OUTPUT_DIR).replace(os.sep, '/')}"
+
+
+# ============================================
+# 各処理
+# ============================================
+
+def make_faststart(path):
+    """moov を先頭側へ移して置き換える。書き換えたら True
+
+    mp4_boxes で扱えない構造なら ffmpeg -c copy -movflags +faststart で remux する。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if mp4_boxes.is_faststart(data):
+        return False
+    try:
+        with telemetry.span("faststart", bytes=len(data)):
+            atomic_write_bytes(path, mp4_boxes.faststart(data))
+    except ValueError as e:
+        if not ffmpeg_available():
+            raise
+        print(f"    [video] {os.path.basename(path)}: {e}, remuxing with ffmpeg", flush=True)
+        tmp = path + ".faststart.mp4"
+        try:
+            with telemetry.span("faststart", bytes=len(data), tool="ffmpeg"):
+                _run_ffmpeg("-i", path, "-map", "0", "-c", "copy", "-movflags", "+faststart", tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    # 生成キャッシュの記録を更新しないと、内容が変わったので作り直しと判定される
+    get_cache().refresh(path, faststart=True)
+    return True
+
+
+def make_poster(scene_id, path, width, height):
+    """最初のフレームを WebP で書き出し、(出力パス, 取り出し方) を返す"""
+    dest = os.path.join(OUTPUT_DIR, f"{scene_id}-poster.webp")
+    with telemetry.span("poster"):
+        if ffmpeg_available():
+            png = _run_ffmpeg("-i", path, "-frames:v", "1", "-f", "image2pipe", "-c:v", "png", "-")
+            frame, source = load_frame(png, size=None), "frame"
+        else:
+            # I2V はこの画像を1フレーム目として動画化しているので、ほぼ同じ絵になる
+            image = os.path.join(IMAGE_DIR, f"{scene_id}_01.png")
+            if not os.path.exists(image):
+                raise FileNotFoundError(f"no ffmpeg and no source image for poster: {image}")
+            frame, source = load_frame(image, size=(width, height)), "source-image"
+        encode(frame, dest, quality=POSTER_QUALITY)
+    return dest, source
+
+
+def make_rendition(scene_id, path, width, bitrate, audio_bitrate):
+    """幅 width の H.264 / AAC（faststart）を書き出す
+
+    HLS は再エンコードせずにキーフレームで切るので、HLS_SEGMENT_SECONDS ごとに
+    キーフレームを強制してセグメント長を揃える。
+    """
+    dest = os.path.join(OUTPUT_DIR, f"{scene_id}-{width}p.mp4")
+    tmp = dest + ".part.mp4"
+    maxrate = int(bitrate.rstrip("k")) * 3 // 2
+    with telemetry.span("encode", width=width):
+        _run_ffmpeg(
+            "-i", path, "-vf", f"scale={width}:-2", "-c:v", "libx264", "-preset", "slow",
+            "-profile:v", "high", "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+            "-b:v", bitrate, "-maxrate", f"{maxrate}k", "-bufsize", f"{maxrate * 2}k",
+            "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", audio_bitrate, "-movflags", "+faststart", tmp,
+        )
+    os.replace(tmp, dest)
+    return dest
+
+
+def make_hls(scene_id, renditions):
+    """各段を HLS に切り、master.m3u8 を書く（セグメントは再エンコードせずに切る）"""
+    out_dir = os.path.join(OUTPUT_DIR, scene_id)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for rendition in renditions:
+        name = f"{rendition['width']}p"
+        with telemetry.span("hls", width=rendition["width"]):
+            _run_ffmpeg(
+                "-i", os.path.join(PROJECT_ROOT, "public", rendition["path"].lstrip("/")), "-c", "copy",
+                "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+                "-hls_segment_filename", os.path.join(out_dir, f"{name}_%03d.ts"),
+                os.path.join(out_dir, f"{name}.m3u8"),
+            )
+        bandwidth = int(rendition["bytes"] * 8 / rendition["duration"]) if rendition["duration"] else 0
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},"
+                     f"RESOLUTION={rendition['width']}x{rendition['height']}")
+        lines.append(f"{name}.m3u8")
+    master = os.path.join(out_dir, "master.m3u8")
+    with atomic_writer(master, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return master
+
+
+# ============================================
+# マニフェスト
+# ============================================
+
+class VideoManifest:
+    """public/video/web/manifest.json（クリップごとの処理結果）"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.clips = json.load(f).get("clips", {})
+        except (FileNotFoundError, ValueError):
+            self.clips = {}
+
+    def up_to_date(self, scene_id, path, current_settings):
+        """前回の処理結果がそのまま使えるか（サイズ・mtime が同じならハッシュは取らない）"""
+        with self._lock:
+            entry = self.clips.get(scene_id)
+        if entry is None or entry.get("settings") != current_settings:
+            return False
+        outputs = [entry["poster"], *(r["path"] for r in entry["renditions"])]
+        if entry["hls"]:
+            outputs.append(entry["hls"])
+        if not all(os.path.exists(os.path.join(PROJECT_ROOT, "public", p.lstrip("/"))) for p in outputs):
+            return False
+        stat = os.stat(path)
+        if stat.st_size == entry["bytes"] and stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        return sha256_file(path) == entry["sha256"]
+
+    def set(self, scene_id, entry):
+        with self._lock:
+            self.clips[scene_id] = entry
+            self._save()
+
+    def prune(self, scene_ids):
+        """元クリップがなくなった項目と出力を削除する
+
+        前方一致で消すと s01 の削除で s01-hook の出力まで消えるため、
+        このスクリプトが書く名前だけを消す。
+        """
+        removed = [s for s in self.clips if s not in scene_ids]
+        for scene_id in removed:
+            # 記録済みの段と今のラダーの段（ラダーを変えた後でも消し残さない）
+            widths = {width for width, _, _ in LADDER}
+            widths.update(r["width"] for r in self.clips[scene_id].get("renditions", []))
+            names = [f"{scene_id}-poster.webp"]
+            for width in sorted(widths):
+                names += [f"{scene_id}-{width}p.mp4", f"{scene_id}-{width}p.mp4.part.mp4"]
+            for name in names:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(OUTPUT_DIR, name))
+            shutil.rmtree(os.path.join(OUTPUT_DIR, scene_id), ignore_errors=True)
+            with self._lock:
+                del self.clips[scene_id]
+            print(f"  REMOVED: {scene_id} (source clip deleted)", flush=True)
+        if removed:
+            with self._lock:
+                self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with atomic_writer(self.path, "w") as f:
+            json.dump({"version": PROCESS_VERSION, "clips": self.clips}, f, ensure_ascii=False, indent=1,
+                      sort_keys=True)
+
+
+def process_clip(scene_id, path, manifest, ladder=False, hls=False, force=False):
+    """1クリップを後処理する。"ok" / "skip" を返す"""
+    current_settings = settings(ladder, hls)
+    if not force and manifest.up_to_date(scene_id, path, current_settings):
+        return "skip"
+
+    report("faststart")
+    rewritten = make_faststart(path)
+    with open(path, "rb") as f:
+        meta = mp4_boxes.info(f.read())
+
+    report("poster")
+    poster, poster_source = make_poster(scene_id, path, meta["width"], meta["height"])
+
+    renditions = []
+    for width, bitrate, audio_bitrate in (LADDER if ladder else ()):
+        report("encode", f"{width}p")
+        dest = make_rendition(scene_id, path, width, bitrate, audio_bitrate)
+        with open(dest, "rb") as f:
+            rendition = mp4_boxes.info(f.read())
+        renditions.append({
+            "path": _public(dest),
+            "width": rendition["width"],
+            "height": rendition["height"],
+            "duration": round(rendition["duration"], 3),
+            "bytes": os.path.getsize(dest),
+        })
+
+    master = None
+    if hls:
+        report("hls")
+        master = _public(make_hls(scene_id, renditions))
+
+    stat = os.stat(path)
+    manifest.set(scene_id, {
+        "source": f"/video/scenes/{os.path.basename(path)}",
+        "sha256": sha256_file(path),
+        "bytes": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "duration": round(meta["duration"], 3),
+        "width": meta["width"],
+        "height": meta["height"],
+        "poster": _public(poster),
+        "poster_source": poster_source,
+        "renditions": renditions,
+        "hls": master,
+        "settings": current_settings,
+    })
+    print(f"    {scene_id}: {'faststart, ' if rewritten else ''}poster ({poster_source})"
+          + (f", {len(renditions)} renditions" if renditions else "") + (", hls" if master else ""), flush=True)
+    return "ok"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="動画クリップの faststart 化・ポスター・ビットレートラダー")
+    parser.add_argument("-j", "--concurrency", type=int, default=2, help="同時に処理するクリップ数 (default: 2)")
+    parser.add_argument("--scene", help="指定シーンのみ（例: s04b-gap）")
+    parser.add_argument("--ladder", action="store_true", help="540p / 720p の H.264 を書き出す（要 ffmpeg）")
+    parser.add_argument("--hls", action="store_true", help="ラダーを HLS にする（--ladder を含む、要 ffmpeg）")
+    parser.add_argument("--force", action="store_true", help="変更がなくても処理し直す")
+    args = parser.parse_args()
+    ladder = args.ladder or args.hls
+
+    if ladder and not ffmpeg_available():
+        parser.error(f"--ladder / --hls need ffmpeg ({FFMPEG} not found)")
+    if not ffmpeg_available():
+        print("WARNING: ffmpeg not found, posters are made from the I2V source images", flush=True)
+
+    clips = {os.path.splitext(os.path.basename(p))[0]: p
+             for p in sorted(glob.glob(os.path.join(SOURCE_DIR, "*.mp4")))}
+    manifest = VideoManifest()
+    if not args.scene:
+        manifest.prune(clips)
+    else:
+        clips = {s: p for s, p in clips.items() if s == args.scene}
+    if not clips:
+        print(f"No clips in {SOURCE_DIR}", flush=True)
+        return
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    print(f"=== Video post-processing: {len(clips)} clips ===", flush=True)
+    telemetry.start_run("process-videos")
+    runner = JobRunner(concurrency=args.concurrency, label="video post-processing")
+    jobs = runner.run([
+        Job(scene_id, process_clip, scene_id, path, manifest, ladder=ladder, hls=args.hls, force=args.force)
+        for scene_id, path in clips.items()
+    ])
+    runner.print_summary()
+    telemetry.finish_run()
+    if any(job.result not in ("ok", "skip") for job in jobs):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""画像 QA サービス（テキスト検証・vision QA）
+
+japanese-text-verifier の BackgroundVerifier と agentic-vision の
+AgenticVisionAnalyzer はワーカースレッドごとに1回だけ作って使い回す
+（OCR・vision モデルの初期化を画像ごとに払わない）。どちらのスキルも
+スレッドセーフとはされていないので、インスタンスはスレッド間で共有しない。
+
+判定結果は画像内容の SHA-256 をキーに .cache/qa/results.json へ保存し、
+同じ内容の画像は再実行しても検証しない。検証器が使えない・エラーに
+なった結果（スキップ扱い）はキャッシュしない。
+
+使い方:
+  python3 scripts/qa_service.py verify public/images/scenes/_backgrounds/*.png
+  python3 scripts/qa_service.py vision public/images/scenes/s01-hook_01.png
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from atomic_io import atomic_writer, sha256_file
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VERIFIER_DIR = os.path.expanduser("~/.claude/skills/japanese-text-verifier/scripts")
+VISION_DIR = os.path.expanduser("~/.claude/skills/agentic-vision/scripts")
+CACHE_PATH = os.environ.get("QA_CACHE_PATH", os.path.join(PROJECT_ROOT, ".cache", "qa", "results.json"))
+
+# 判定ロジックを変えたら上げる（古い結果を使わない）
+QA_VERSION = 1
+VISION_PASS_SCORE = 60
+
+_skill_import_lock = threading.Lock()
+
+
+def _import_from_skill(skill_dir, module_name):
+    """スキルのモジュールを import する（スレッドから同時に呼んでもよい）
+
+    スキルのディレクトリは sys.path の末尾に一度だけ追加し、そのまま残す
+    （遅延 import するサブモジュールも解決できるように）。
+    """
+    with _skill_import_lock:
+        if skill_dir not in sys.path:
+            sys.path.append(skill_dir)
+        return importlib.import_module(module_name)
+
+
+def _judge_text(extracted):
+    """抽出テキストが許容できるか（日本語を含む・短いものは OK）"""
+    has_japanese = any(
+        "\u3041" <= ch <= "\u3096"  # ひらがな
+        or "\u30a1" <= ch <= "\u30fa"  # カタカナ
+        or "\u4e00" <= ch <= "\u9fff"  # CJK漢字
+        for ch in extracted
+    )
+    # 日本語が含まれない長いテキスト → ガベージの可能性（警告用）
+    return has_japanese or len(extracted) < 3
+
+
+class QAService:
+    """スレッドごとの検証器インスタンスと、内容ハッシュごとの判定キャッシュ"""
+
+    def __init__(self, cache_path=CACHE_PATH):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._results = self._load()
+        self._local = threading.local()  # スレッドごとの _verifier / _analyzer
+        self._analysis_type = None
+        self._unavailable = set()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- キャッシュ ----------
+
+    def _load(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return data.get("results", {}) if data.get("version") == QA_VERSION else {}
+
+    def _save(self):
+        # 別プロセスが並行して書いた分を取りこんでから保存する
+        merged = self._load()
+        merged.update(self._results)
+        self._results = merged
+        with atomic_writer(self.cache_path, "w") as f:
+            json.dump({"version": QA_VERSION, "results": merged}, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def _cached(self, kind, digest):
+        with self._lock:
+            entry = self._results.get(f"{kind}:{digest}")
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["ok"], entry["detail"]
+
+    def _remember(self, kind, digest, path, ok, detail):
+        with self._lock:
+            self._results[f"{kind}:{digest}"] = {
+                "ok": ok,
+                "detail": detail,
+                "path": os.path.relpath(os.path.abspath(path), PROJECT_ROOT),
+                "checked": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self._save()
+
+    # ---------- 検証器（スレッドごとに1回だけ作る） ----------
+
+    def _load_once(self, attr, tag, skill, factory):
+        instance = getattr(self._local, attr, None)
+        if instance is not None:
+            return instance
+        with self._init_lock:
+            if skill in self._unavailable:
+                return None
+            try:
+                instance = factory()
+            except ImportError:
+                print(f"    [{tag}] {skill} not available, skipping", flush=True)
+                self._unavailable.add(skill)
+                return None
+        setattr(self._local, attr, instance)
+        return instance
+
+    def verifier(self):
+        """このスレッドの BackgroundVerifier（読めなければ None）"""
+        return self._load_once(
+            "_verifier", "verify", "japanese-text-verifier",
+            lambda: _import_from_skill(VERIFIER_DIR, "slide_verifier").BackgroundVerifier(max_retries=0),
+        )
+
+    def _make_analyzer(self):
+        vision = _import_from_skill(VISION_DIR, "agentic_vision")
+        self._analysis_type = vision.AnalysisType
+        return vision.AgenticVisionAnalyzer()
+
+    def analyzer(self):
+        """このスレッドの AgenticVisionAnalyzer（読めなければ None）"""
+        return self._load_once("_analyzer", "vision", "agentic-vision", self._make_analyzer)
+
+    # ---------- 判定 ----------
+
+    def verify_text(self, image_path):
+        """画像内テキストの品質を確認（警告のみ）
+
+        画像にテキストが含まれること自体は問題ない。
+        ガベージ（デタラメ文字）が含まれていれば is_ok=False。
+
+        Returns: (is_ok, extracted_text)
+        """
+        digest = sha256_file(image_path)
+        cached = self._cached("text", digest)
+        if cached is not None:
+            return cached
+        verifier = self.verifier()
+        if verifier is None:
+            return True, ""
+        try:
+            result = verifier.verify_background(image_path)
+        except Exception as e:
+            print(f"    [verify] Error: {e}", flush=True)
+            return True, ""
+        extracted = "" if result.is_clean else result.extracted_text
+        is_ok = _judge_text(extracted)
+        self._remember("text", digest, image_path, is_ok, extracted)
+        return is_ok, extracted
+
+    def vision_qa(self, image_path):
+        """agentic-vision で品質スコアを確認
+
+        Returns: (passed, details)
+        """
+        digest = sha256_file(image_path)
+        cached = self._cached("vision", digest)
+        if cached is not None:
+            return cached
+        analyzer = self.analyzer()
+        if analyzer is None:
+            return True, "skipped"
+        if analyzer.client is None:
+            print("    [vision] No GEMINI_API_KEY, skipping QA", flush=True)
+            return True, "skipped"
+        try:
+            result = analyzer.analyze(image_path, analysis_type=self._analysis_type.QUALITY)
+        except Exception as e:
+            print(f"    [vision] Error: {e}", flush=True)
+            return True, "error"
+        quality = result.results.get("quality_score", 0)
+        passed = quality >= VISION_PASS_SCORE
+        details = f"quality={quality}"
+        self._remember("vision", digest, image_path, passed, details)
+        return passed, details
+
+    def _many(self, check, paths, workers):
+        # 同じ内容の画像は1回だけ検証する
+        by_digest = {}
+        for path in paths:
+            by_digest.setdefault(sha256_file(path), []).append(path)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            outcomes = dict(zip(by_digest, executor.map(check, [group[0] for group in by_digest.values()])))
+        return {path: outcomes[digest] for digest, group in by_digest.items() for path in group}
+
+    def verify_many(self, paths, workers=2):
+        """複数画像をまとめて verify_text する（{path: (is_ok, extracted)}）"""
+        return self._many(self.verify_text, paths, workers)
+
+    def vision_many(self, paths, workers=2):
+        """複数画像をまとめて vision_qa する（{path: (passed, details)}）"""
+        return self._many(self.vision_qa, paths, workers)
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def get_qa():
+    """プロセス共通の QAService を返す"""
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = QAService()
+        return _default_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image QA (text verifier / vision) with result cache")
+    parser.add_argument("check", choices=["verify", "vision"])
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("-j", "--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    service = get_qa()
+    check = service.verify_many if args.check == "verify" else service.vision_many
+    failed = 0
+    for path, (ok, detail) in check(args.paths, args.workers).items():
+        failed += not ok
+        print(f"  {'OK' if ok else 'NG'}: {path} {detail[:60]!r}", flush=True)
+    print(f"QA: {len(args.paths) - failed} ok, {failed} ng (cache hits {service.hits}, misses {service.misses})", flush=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""失敗の分類とクラス別リトライ・レート制限
+
+生成の失敗を4クラスに分け、クラスごとにバックオフと回数上限を変える。
+
+  transient  タイムアウト・接続断など一時的なもの → 短い指数バックオフ
+  quota      429・quota・rate limit → 長めのバックオフ（トークンも補充待ち）
+  content    小さすぎる画像・文字化け → 待たずにプロンプトを補強して再生成
+  hard       認証・引数・スキル不在など → リトライしない
+
+TokenBucket は並行ワーカー間で共有し、リモート呼び出しの総レートを抑える。
+サーバーが Retry-After を返したら hold() で全ワーカーをその時刻まで止める。
+RetryTracker はクラス別の失敗・リトライ・断念件数を数え、--report に載せる。
+"""
+
+import email.utils
+import random
+import re
+import threading
+import time
+
+FAILURE_CLASSES = ("transient", "quota", "content", "hard")
+
+
+class RetryRule:
+    """1クラス分のリトライ設定"""
+
+    def __init__(self, max_retries, base_delay=0.0, max_delay=0.0, factor=2.0, jitter=0.2):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+
+    def delay(self, retry):
+        """retry 回目（1始まり）の待ち秒数（指数バックオフ + ゆらぎ）"""
+        if self.base_delay <= 0:
+            return 0.0
+        delay = min(self.max_delay, self.base_delay * self.factor ** (retry - 1))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+DEFAULT_RULES = {
+    "transient": RetryRule(max_retries=4, base_delay=5, max_delay=60),
+    "quota": RetryRule(max_retries=6, base_delay=30, max_delay=300),
+    "content": RetryRule(max_retries=3),
+    "hard": RetryRule(max_retries=0),
+}
+
+# ステータスコードは単語境界で区切る（"file too small: 1429B" のバイト数に反応しないように）
+_QUOTA = re.compile(r"\b429\b|quota|rate.?limit|resource.?exhausted|too many requests", re.I)
+_TRANSIENT = re.compile(
+    r"timeout|timed out|connection|temporar|unavailable|reset by peer|broken pipe|\b5\d\d\b|network",
+    re.I,
+)
+_CONTENT = re.compile(r"too small|garbled|no image|empty", re.I)
+
+
+def classify(error):
+    """エラー（例外または文字列）を失敗クラスに分類する"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return "transient"
+    message = str(error)
+    if _QUOTA.search(message):
+        return "quota"
+    if _TRANSIENT.search(message):
+        return "transient"
+    if _CONTENT.search(message):
+        return "content"
+    return "hard"
+
+
+def parse_retry_after(value):
+    """Retry-After ヘッダ（秒数または HTTP 日付）を待ち秒数にする（解釈できなければ None）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """スレッド共有のトークンバケット（rate 個/秒、最大 capacity 個）"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._resume_at = 0.0  # hold() で止めている間は補充もしない
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """トークンを1つ取る（なければ補充まで待つ）。待った秒数を返す"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    wait = self._resume_at - now
+                elif not self.rate:
+                    self.waited += waited
+                    return waited
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.waited += waited
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def drain(self):
+        """quota 超過を受けたらトークンを捨て、全ワーカーを補充待ちにする"""
+        with self._lock:
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+    def hold(self, seconds):
+        """seconds 秒後まで全ワーカーの acquire を止める（Retry-After 用）"""
+        with self._lock:
+            self._tokens = 0.0
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+            self._updated = self._resume_at
+
+
+class RetryTracker:
+    """アイテムごとのクラス別リトライ回数と、全体の集計"""
+
+    def __init__(self, rules=None):
+        self.rules = rules or DEFAULT_RULES
+        self._lock = threading.Lock()
+        self.counts = {name: {"failures": 0, "retries": 0, "gave_up": 0} for name in FAILURE_CLASSES}
+
+    def next_delay(self, attempts, failure_class):
+        """失敗を記録し、リトライするなら待ち秒数、断念なら None を返す
+
+        attempts はアイテム側で持つ {クラス: 回数} の dict（この関数が更新する）。
+        """
+        rule = self.rules[failure_class]
+        retry = attempts.get(failure_class, 0) + 1
+        with self._lock:
+            counts = self.counts[failure_class]
+            counts["failures"] += 1
+            if retry > rule.max_retries:
+                counts["gave_up"] += 1
+                return None
+            counts["retries"] += 1
+        attempts[failure_class] = retry
+        return rule.delay(retry)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self.counts.items()}
+
+    def summary(self):
+        """失敗のあったクラスだけを1行にまとめる"""
+        parts = [
+            f"{name} {c['failures']} (retried {c['retries']}, gave up {c['gave_up']})"
+            for name, c in self.snapshot().items() if c["failures"]
+        ]
+        return ", ".join(parts) if parts else "no failures"
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""シーンのナレーション字幕・画像切り替えのタイミング（音声生成時に書き出す）
+
+プレイヤーは字幕の表示時刻を文字数の比率 × 手入力の scene.duration で
+見積もっているため、シーンが長いほどずれる。generate-audio.py は
+文ごとに合成した MP3 を持っているので、その実際の長さ（mp3_frames で
+フレームヘッダから求める）から文の開始・終了時刻を決めて書き出す。
+
+  public/audio/scenes/{scene}.json  {"duration", "timing", "sentences": [...], "images": [...]}
+  public/audio/scenes/{scene}.vtt   同じ文の区切りの WebVTT
+
+timing は "frames"（文ごとの MP3 の長さを積み上げた正確な時刻）か
+"estimated"（1シーン1リクエストで合成したなど文ごとの長さがない場合。
+実際の全体長を文字数で按分）。
+
+使い方:
+  python3 scripts/scene_timing.py public/audio/scenes/s01-hook.json   # 内容を表示
+"""
+
+import argparse
+import json
+import os
+
+import branch_structure
+import mp3_frames
+from atomic_io import atomic_writer
+
+
+def timing_paths(audio_path):
+    """MP3 のパス → (JSON, VTT) のパス"""
+    base = os.path.splitext(audio_path)[0]
+    return base + ".json", base + ".vtt"
+
+
+def sentence_cues(texts, durations):
+    """文ごとの長さを積み上げて [{"start", "end", "text"}, ...] にする"""
+    cues = []
+    start = 0.0
+    for text, seconds in zip(texts, durations):
+        cues.append({"start": round(start, 3), "end": round(start + seconds, 3), "text": text})
+        start += seconds
+    return cues
+
+
+def estimate_durations(sentences, total):
+    """文ごとの長さがないとき: 全体の長さを（読み上げ側の）文字数で按分する"""
+    chars = sum(len(s) for s in sentences)
+    return [total * len(s) / chars if chars else 0.0 for s in sentences]
+
+
+def image_cues(scene, duration):
+    """画像の切り替え時刻 [{"time", "index"}, ...]（プレイヤーと同じ既定値: 3枚・3000ms）"""
+    count = scene.get("imageCount", 3)
+    interval = scene.get("imageInterval", 3000) / 1000
+    if scene.get("mediaType") == "video" or count <= 1 or interval <= 0:
+        return []
+    cues = []
+    step = 1
+    while step * interval < duration:
+        cues.append({"time": round(step * interval, 3), "index": step % count})
+        step += 1
+    return cues
+
+
+def _vtt_time(seconds):
+    millis = round(seconds * 1000)
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def to_vtt(cues):
+    lines = ["WEBVTT", ""]
+    for i, cue in enumerate(cues, 1):
+        lines += [str(i), f"{_vtt_time(cue['start'])} --> {_vtt_time(cue['end'])}", cue["text"], ""]
+    return "\n".join(lines)
+
+
+def build(scene_id, audio_path, display, spoken, durations=None, key=None):
+    """タイミング情報を作る
+
+    display: 字幕に出す文（元のナレーション）、spoken: 合成した文（前処理後）。
+    数が合わなければ字幕にも spoken を使う。durations は spoken の各文の秒数。
+    """
+    total = mp3_frames.duration(audio_path)
+    exact = durations is not None and len(durations) == len(spoken)
+    if exact:
+        # 文ごとの MP3 をフレーム単位でつないでいるので、合計は全体長と一致する
+        durations = list(durations)
+    else:
+        durations = estimate_durations(spoken, total)
+    texts = display if len(display) == len(spoken) else spoken
+
+    try:
+        scene = branch_structure.load()["scenes"].get(scene_id, {})
+    except (OSError, ValueError, AttributeError):
+        scene = {}
+    return {
+        "scene": scene_id,
+        "key": key,
+        "duration": round(total, 3),
+        "timing": "frames" if exact else "estimated",
+        "sentences": sentence_cues(texts, durations),
+        "images": image_cues(scene, total),
+    }
+
+
+def write(audio_path, timing):
+    """JSON と WebVTT を MP3 の隣に書く"""
+    json_path, vtt_path = timing_paths(audio_path)
+    with atomic_writer(json_path, "w") as f:
+        json.dump(timing, f, ensure_ascii=False, indent=1)
+    with atomic_writer(vtt_path, "w") as f:
+        f.write(to_vtt(timing["sentences"]))
+    return json_path, vtt_path
+
+
+def current(audio_path, key):
+    """書き出し済みのタイミングが key の音声のものなら True"""
+    json_path, vtt_path = timing_paths(audio_path)
+    if not os.path.exists(vtt_path):
+        return False
+    try:
+        with open(json_path, encoding="utf-8") as f:
+            return json.load(f).get("key") == key
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show scene timing files")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        with open(path, encoding="utf-8") as f:
+            timing = json.load(f)
+        print(f"{timing['scene']}: {timing['duration']:.2f}s ({timing['timing']}), "
+              f"{len(timing['sentences'])} sentences, {len(timing['images'])} image switches", flush=True)
+        for cue in timing["sentences"]:
+            print(f"  {cue['start']:7.2f} - {cue['end']:7.2f}  {cue['text'][:40]}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
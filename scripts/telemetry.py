@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""ステージ別のタイミング計測（JSON-lines スパン）とトレース集計
+
+生成スクリプトは各アイテム・各ステージの所要時間をスパンとして
+.cache/telemetry/<script>-<日時>.jsonl に1行1スパンで書き出す
+（OpenTelemetry のスパンに近い形）。
+
+  {"trace_id": "...", "span_id": "...", "parent_span_id": "...",
+   "name": "download", "item": "s01-hook_01.png",
+   "start_time": 1760000000.12, "end_time": 1760000001.48, "duration_ms": 1360.2,
+   "status": "ok", "attributes": {"bytes": 812345}}
+
+スパン名: item / submit / queue / generation / download / upload / resize /
+verify / overlay.decode / overlay.render / overlay.encode / vision / tts など。
+パイプラインのステージ待ちは "<stage>.wait" として記録する。
+
+  with telemetry.item("s01-hook_01.png"):        # 以降のスパンにアイテム名を付ける
+      with telemetry.span("download") as s:
+          data = client.fetch(url)
+          s.set(bytes=len(data))
+
+集計:
+  python3 scripts/telemetry.py summary                 # 最新のトレース
+  python3 scripts/telemetry.py summary trace.jsonl
+
+TELEMETRY=off で無効、TRACE_PATH で出力先を固定できる。
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRACE_DIR = os.path.join(PROJECT_ROOT, ".cache", "telemetry")
+ENABLED = os.environ.get("TELEMETRY", "on") != "off"
+
+# time.monotonic() → UNIX 時刻の換算（record() で計測済みの区間を書くとき用）
+_WALL_OFFSET = time.time() - time.monotonic()
+
+_local = threading.local()
+
+
+class Span:
+    """計測中のスパン（set() で属性を足す）"""
+
+    def __init__(self, name, item, parent_id, attributes):
+        self.name = name
+        self.item = item
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.start = time.monotonic()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+
+class Tracer:
+    """スパンを JSON-lines ファイルへ書く（スレッドセーフ）"""
+
+    def __init__(self, path=None, enabled=ENABLED):
+        self.enabled = enabled and path is not None
+        self.path = path
+        self.trace_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._file = None
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, span):
+        if not self.enabled:
+            return
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_id,
+            "name": span.name,
+            "item": span.item,
+            "start_time": round(span.start + _WALL_OFFSET, 6),
+            "end_time": round(span.end + _WALL_OFFSET, 6),
+            "duration_ms": round((span.end - span.start) * 1000, 3),
+            "status": span.status,
+            "attributes": span.attributes,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = Tracer()
+
+
+def start_run(script):
+    """スクリプト開始時に呼ぶ: このプロセスのスパンの出力先を決める"""
+    global _tracer
+    path = os.environ.get("TRACE_PATH") or os.path.join(
+        TRACE_DIR, f"{script}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl",
+    )
+    _tracer.close()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def finish_run():
+    """トレースを閉じて出力先を表示する"""
+    if _tracer.enabled:
+        print(f"Trace: {os.path.relpath(_tracer.path, PROJECT_ROOT)} "
+              f"(python3 scripts/telemetry.py summary)", flush=True)
+    _tracer.close()
+
+
+def current_item():
+    return getattr(_local, "item", None)
+
+
+@contextlib.contextmanager
+def span(name, item=None, **attributes):
+    """name の区間を計測する（例外が出たら status=error で記録して再送出）"""
+    parent = getattr(_local, "span", None)
+    current = Span(name, item or current_item(), parent.span_id if parent else None, attributes)
+    _local.span = current
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attributes.setdefault("error", str(e)[:200])
+        raise
+    finally:
+        _local.span = parent
+        current.end = time.monotonic()
+        _tracer.write(current)
+
+
+@contextlib.contextmanager
+def context(name):
+    """スパンを作らずに、中のスパンへアイテム名だけを付ける"""
+    previous = current_item()
+    _local.item = name
+    try:
+        yield
+    finally:
+        _local.item = previous
+
+
+@contextlib.contextmanager
+def item(name, **attributes):
+    """アイテム1件分の "item" スパン。中のスパンにはアイテム名が付く"""
+    with context(name), span("item", name, **attributes) as current:
+        yield current
+
+
+def record(name, start, end, item=None, status="ok", **attributes):
+    """計測済みの区間（time.monotonic() の start / end）をスパンとして書く"""
+    parent = getattr(_local, "span", None)
+    current = Span(name, item or current_item(), parent.span_id if parent else None, attributes)
+    current.start, current.end, current.status = start, end, status
+    _tracer.write(current)
+    return current
+
+
+def record_phases(phases, end=None, item=None, status="ok", **attributes):
+    """[(name, seconds), ...] を end から逆算して連続したスパンとして書く
+
+    別プロセス・別サービスが返した所要時間（queued / generate など）の記録用。
+    """
+    end = time.monotonic() if end is None else end
+    start = end - sum(seconds for _, seconds in phases)
+    for name, seconds in phases:
+        record(name, start, start + seconds, item, status, **attributes)
+        start += seconds
+
+
+# ============================================
+# 集計
+# ============================================
+
+def load_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+def percentile(values, q):
+    """最近傍法のパーセンタイル（values は昇順）"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def stage_table(spans):
+    """スパン名ごとの件数・合計・p50・p95・最大・バイト数"""
+    by_name = {}
+    for s in spans:
+        by_name.setdefault(s["name"], []).append(s)
+    rows = []
+    for name, group in by_name.items():
+        durations = sorted(s["duration_ms"] / 1000 for s in group)
+        rows.append({
+            "name": name,
+            "count": len(group),
+            "errors": sum(1 for s in group if s["status"] != "ok"),
+            "total": sum(durations),
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "max": durations[-1],
+            "bytes": sum(s["attributes"].get("bytes", 0) or 0 for s in group),
+            "retries": sum(s["attributes"].get("retries", 0) or 0 for s in group),
+        })
+    return sorted(rows, key=lambda row: -row["total"])
+
+
+def critical_path(spans):
+    """最後に終わったアイテムのスパン列（開始順）と、その間の待ち時間
+
+    Returns: (item, [(offset, duration, name), ...])（offset はトレース開始からの秒）
+    """
+    items = [s for s in spans if s.get("item")]
+    if not items:
+        return None, []
+    trace_start = min(s["start_time"] for s in spans)
+    last = max(items, key=lambda s: s["end_time"])["item"]
+    path = []
+    cursor = None
+    for s in sorted((s for s in items if s["item"] == last and s["name"] != "item"),
+                    key=lambda s: s["start_time"]):
+        if cursor is not None and s["start_time"] - cursor > 0.001:
+            path.append((cursor - trace_start, s["start_time"] - cursor, "(waiting)"))
+        path.append((s["start_time"] - trace_start, s["duration_ms"] / 1000, s["name"]))
+        cursor = max(cursor or 0, s["end_time"])
+    return last, path
+
+
+def summarize(paths):
+    spans = load_spans(paths)
+    if not spans:
+        print("no spans", flush=True)
+        return
+    wall = max(s["end_time"] for s in spans) - min(s["start_time"] for s in spans)
+    items = {s["item"] for s in spans if s.get("item")}
+    print(f"Trace: {', '.join(os.path.basename(p) for p in paths)}", flush=True)
+    print(f"  {len(spans)} spans, {len(items)} items, wall {wall:.1f}s", flush=True)
+    print(f"\n  {'stage':<16} {'count':>6} {'total s':>9} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'MB':>8}",
+          flush=True)
+    for row in stage_table(spans):
+        errors = f"  errors {row['errors']}" if row["errors"] else ""
+        retries = f"  retries {row['retries']}" if row["retries"] else ""
+        print(
+            f"  {row['name']:<16} {row['count']:>6} {row['total']:>9.1f} {row['p50']:>8.2f} "
+            f"{row['p95']:>8.2f} {row['max']:>8.2f} {row['bytes'] / 1e6:>8.1f}{errors}{retries}",
+            flush=True,
+        )
+    last, path = critical_path(spans)
+    if last:
+        print(f"\n  Critical path ({last}):", flush=True)
+        for offset, duration, name in path:
+            print(f"    +{offset:8.2f}s  {duration:8.2f}s  {name}", flush=True)
+
+
+def latest_trace():
+    paths = sorted(glob.glob(os.path.join(TRACE_DIR, "*.jsonl")), key=os.path.getmtime)
+    return paths[-1] if paths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize generator trace spans")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary = sub.add_parser("summary", help="ステージ別 p50/p95 とクリティカルパス")
+    summary.add_argument("paths", nargs="*", help="トレース (省略時は最新)")
+    args = parser.parse_args()
+
+    paths = args.paths or ([latest_trace()] if latest_trace() else [])
+    if not paths:
+        print(f"no traces in {TRACE_DIR}", flush=True)
+        return
+    summarize(paths)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,33 @@ interface NarrationSegment {
   readonly startTime: number
 }
 
+interface SentenceCue {
+  readonly start: number
+  readonly end: number
+  readonly text: string
+}
+
+/** Timing file written next to the audio by scripts/generate-audio.py */
+interface SceneTiming {
+  readonly duration: number
+  readonly timing: "frames" | "estimated"
+  readonly sentences: readonly SentenceCue[]
+  readonly images: readonly { readonly time: number; readonly index: number }[]
+}
+
 /**
  * Split narration text into timed segments using BudouX phrase boundaries.
  * No explicit \n — line wrapping is handled by CSS + BudouX phrase-level spans.
  * Segments are ~26 chars each (roughly 2 visual lines on mobile).
+ *
+ * With sentence cues from the timing file, each segment is placed within its
+ * sentence's measured start/end; otherwise timing is estimated from the
+ * character share of the whole scene duration.
  */
 function splitNarrationIntoSegments(
   narration: string,
-  duration: number
+  duration: number,
+  cues?: readonly SentenceCue[]
 ): NarrationSegment[] {
   if (!narration || duration <= 0) return []
 
@@ -26,11 +45,12 @@ function splitNarrationIntoSegments(
     .split(/(?<=[。！？])/)
     .filter((s) => s.trim())
 
-  const segments: string[] = []
+  const perSentence: string[][] = []
   const maxSegmentChars = 26
 
   for (const sentence of sentences) {
     const phrases = budouxParser.parse(sentence.trim())
+    const segments: string[] = []
     let current = ""
 
     for (const phrase of phrases) {
@@ -45,8 +65,23 @@ function splitNarrationIntoSegments(
     if (current) {
       segments.push(current)
     }
+    perSentence.push(segments)
+  }
+
+  if (cues && cues.length === perSentence.length) {
+    return perSentence.flatMap((segments, i) => {
+      const { start, end } = cues[i]
+      const sentenceChars = segments.reduce((sum, s) => sum + s.length, 0)
+      let charsSoFar = 0
+      return segments.map((text) => {
+        const startTime = start + (charsSoFar / sentenceChars) * (end - start)
+        charsSoFar += text.length
+        return { text, startTime }
+      })
+    })
   }
 
+  const segments = perSentence.flat()
   if (segments.length === 0) return []
 
   const totalChars = segments.reduce((sum, s) => sum + s.length, 0)
@@ -76,6 +111,7 @@ export function SceneRenderer({
   const [currentImageIndex, setCurrentImageIndex] = useState(0)
   const [imageFading, setImageFading] = useState(false)
   const [videoFailed, setVideoFailed] = useState(false)
+  const [timing, setTiming] = useState<SceneTiming | null>(null)
   const hasEndedRef = useRef(false)
   const audioRef = useRef<HTMLAudioElement | null>(null)
   const videoRef = useRef<HTMLVideoElement | null>(null)
@@ -87,10 +123,32 @@ export function SceneRenderer({
   const useVideo = scene.mediaType === "video" && !videoFailed
 
   const narrationSegments = useMemo(
-    () => splitNarrationIntoSegments(scene.narration, scene.duration),
-    [scene.narration, scene.duration]
+    () =>
+      splitNarrationIntoSegments(
+        scene.narration,
+        timing?.duration ?? scene.duration,
+        timing?.sentences
+      ),
+    [scene.narration, scene.duration, timing]
   )
 
+  // Load precomputed caption timing; keep the estimate if it is missing
+  useEffect(() => {
+    let cancelled = false
+    setTiming(null)
+    fetch(`/audio/scenes/${scene.id}.json`)
+      .then((res) => (res.ok ? res.json() : null))
+      .then((data: SceneTiming | null) => {
+        if (!cancelled && data?.sentences) setTiming(data)
+      })
+      .catch(() => {
+        // No timing file: fall back to the character-count estimate
+      })
+    return () => {
+      cancelled = true
+    }
+  }, [scene.id])
+
   const handleAudioEnded = useCallback(() => {
     if (hasEndedRef.current) return
     hasEndedRef.current = true
@@ -0,0 +1,38 @@
+"""retry_policy.classify() の分類
+
+実行: python3 -m unittest discover -s tests/python
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+
+from retry_policy import classify  # noqa: E402
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_byte_counts_are_content(self):
+        # バイト数に 429 / 503 が含まれても quota / transient にしない
+        self.assertEqual(classify("file too small: 1429B"), "content")
+        self.assertEqual(classify("file too small: 5030B"), "content")
+        self.assertEqual(classify("file too small: 502B"), "content")
+
+    def test_status_codes(self):
+        self.assertEqual(classify("HTTP 429: Too Many Requests"), "quota")
+        self.assertEqual(classify("HTTP 503 Service Unavailable"), "transient")
+        self.assertEqual(classify("upstream returned 502"), "transient")
+        self.assertEqual(classify("HTTP 500 Internal Server Error"), "transient")
+        self.assertEqual(classify("HTTP 599"), "transient")
+
+    def test_messages(self):
+        self.assertEqual(classify("RESOURCE_EXHAUSTED: quota exceeded"), "quota")
+        self.assertEqual(classify(TimeoutError("read")), "transient")
+        self.assertEqual(classify("connection reset by peer"), "transient")
+        self.assertEqual(classify("no image"), "content")
+        self.assertEqual(classify("invalid api key"), "hard")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+"""telemetry.percentile() の最近傍法
+
+実行: python3 -m unittest discover -s tests/python
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+
+from telemetry import percentile  # noqa: E402
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 11))
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 95), 10)
+        self.assertEqual(percentile(values, 10), 1)
+        self.assertEqual(percentile(values, 100), 10)
+
+    def test_small_and_empty(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertEqual(percentile([1, 2], 50), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()